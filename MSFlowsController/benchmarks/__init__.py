@@ -0,0 +1,3 @@
+"""
+Benchmarks y fakes locales para medir el FlowController sin GCP.
+"""
@@ -0,0 +1,139 @@
+"""
+Benchmark de rendimiento del camino Celery frente al camino Pub/Sub.
+
+Arranca las N tareas iniciales de un run sobre un bucket local falso y mide
+tareas por segundo, operaciones de GCS y actualizaciones de estado perdidas:
+
+- celery-previous: comportamiento anterior de execute_single_task (carga y
+  guardado completos sin precondición y espera a una tarea Celery anidada,
+  simulada con --broker-ms de ida y vuelta).
+- celery-inline: execute_single_task actual (un delta condicionado y
+  publicación dentro de la propia tarea).
+- pubsub: StepDispatcher del controlador dinámico (un guardado por run y una
+  publicación en lote).
+
+Uso:
+    python -m benchmarks.bench_celery_path --tasks 30 --workers 8 --latency-ms 5 --broker-ms 10
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+os.environ.setdefault('_M_PROJECT_ID', 'local-benchmark')
+os.environ.setdefault('RUNS_BUCKET', 'bench-runs')
+
+import tasks  # noqa: E402
+from benchmarks.fake_gcs import FakeStorageClient  # noqa: E402
+from benchmarks.fake_pubsub import FakePublisherClient, InMemoryPublisher  # noqa: E402
+from core.config import config  # noqa: E402
+from core.services.step_dispatcher import StepDispatcher  # noqa: E402
+from storage.repositories import FlowRunStateRepository  # noqa: E402
+from worker.flowscontroller import FlowController, TaskStatus  # noqa: E402
+
+FLOW_ID, RUN_ID = "bench-flow", "bench-run"
+
+
+def _task_definition(i: int) -> dict:
+    return {"type": "bench-task", "config": {"task": i}}
+
+
+def _execution_status(width: int) -> dict:
+    return {
+        "flow_id": FLOW_ID, "account": "bench", "run_id": RUN_ID, "status": "running",
+        "tasks": {f"task-{i}": {"status": TaskStatus.PENDING, "start": None, "end": None, "messages": []} for i in range(width)}
+    }
+
+
+def _previous_execute_single_task(fc: FlowController, broker_seconds: float, task_name: str, task_definition: dict) -> str:
+    """Secuencia anterior: carga, guardado completo y espera a la tarea de publicación."""
+    execution_status = fc._load_execution_status_running(RUN_ID)
+    execution_status["tasks"][task_name]["status"] = TaskStatus.EXECUTING
+    execution_status["tasks"][task_name]["start"] = datetime.now(timezone.utc)
+    fc._save_execution_status_running(RUN_ID, execution_status)
+    time.sleep(broker_seconds)
+    return fc._publish_task_message(task_name, task_definition, execution_status, RUN_ID).result()
+
+
+def _run_celery(width: int, workers: int, latency_ms: float, broker_ms: float, previous: bool) -> dict:
+    client = FakeStorageClient(latency_seconds=latency_ms / 1000.0)
+    publisher = FakePublisherClient()
+    fc = FlowController(publisher_client=publisher, storage_client=client)
+    fc.max_task_status_attempts = max(fc.max_task_status_attempts, width + 1)
+    fc._save_execution_status_running(RUN_ID, _execution_status(width))
+    tasks._flow_controller = fc
+    bucket = client.bucket(fc.runs_bucket_name)
+    bucket.stats.update(reads=0, writes=0, conflicts=0)
+
+    def execute(i: int) -> str:
+        if previous:
+            return _previous_execute_single_task(fc, broker_ms / 1000.0, f"task-{i}", _task_definition(i))
+        return tasks.execute_single_task.run(f"task-{i}", _task_definition(i), RUN_ID)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(execute, range(width)))
+    elapsed = time.perf_counter() - started
+
+    final_tasks = fc._load_execution_status_running(RUN_ID)["tasks"]
+    lost = sum(1 for task in final_tasks.values() if task["status"] != TaskStatus.EXECUTING)
+    return _result('celery-previous' if previous else 'celery-inline', width, elapsed, len(publisher.messages), lost, bucket.stats)
+
+
+def _run_pubsub(width: int, latency_ms: float) -> dict:
+    client = FakeStorageClient(latency_seconds=latency_ms / 1000.0)
+    state_repo = FlowRunStateRepository(storage_client=client)
+    publisher = InMemoryPublisher()
+    dispatcher = StepDispatcher(state_repo, publisher)
+    state_repo.save_flow_run_state(FLOW_ID, RUN_ID, {
+        "flow_id": FLOW_ID, "run_id": RUN_ID, "account": "bench", "status": "running",
+        "flow_config": {"steps": [{"id": f"task-{i}", **_task_definition(i)} for i in range(width)]}
+    })
+    bucket = client.bucket(config.RUNS_BUCKET)
+    bucket.stats.update(reads=0, writes=0, conflicts=0)
+    log = logging.LoggerAdapter(logging.getLogger(__name__), {})
+
+    started = time.perf_counter()
+    flow_state = state_repo.get_flow_run_state(FLOW_ID, RUN_ID)
+    steps = flow_state["flow_config"]["steps"]
+    dispatcher.claim(flow_state, steps)
+    state_repo.save_flow_run_state(FLOW_ID, RUN_ID, flow_state)
+    dispatcher.dispatch(FLOW_ID, RUN_ID, flow_state, steps, log)
+    elapsed = time.perf_counter() - started
+
+    final_steps = state_repo.get_flow_run_state(FLOW_ID, RUN_ID)["flow_config"]["steps"]
+    lost = sum(1 for step in final_steps if step.get("status") != "running")
+    return _result('pubsub', width, elapsed, len(publisher.messages), lost, bucket.stats)
+
+
+def _result(mode: str, width: int, elapsed: float, published: int, lost: int, stats: dict) -> dict:
+    return {
+        "mode": mode,
+        "elapsed_s": round(elapsed, 3),
+        "tasks_per_s": round(width / elapsed, 1) if elapsed else None,
+        "published": published,
+        "lost_updates": lost,
+        "reads": stats["reads"],
+        "writes": stats["writes"],
+        "conflicts": stats["conflicts"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=30, help='Número de tareas iniciales del run')
+    parser.add_argument('--workers', type=int, default=8, help='Workers Celery concurrentes')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Latencia simulada por operación de GCS')
+    parser.add_argument('--broker-ms', type=float, default=10.0, help='Ida y vuelta simulada de la tarea Celery anidada')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    print(_run_celery(args.tasks, args.workers, args.latency_ms, args.broker_ms, previous=True))
+    print(_run_celery(args.tasks, args.workers, args.latency_ms, args.broker_ms, previous=False))
+    print(_run_pubsub(args.tasks, args.latency_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark de los codecs del estado de los runs y de los mensajes de pasos.
+
+Mide, para cada codec disponible, bytes y tiempos de codificación y
+decodificación de estados de run. Por defecto usa un run sintético con
+resultados de dbt grandes; con --files se miden estados reales descargados de
+GCS (p. ej. ``gsutil cp gs://$RUNS_BUCKET/flow-runs/<flow>/<run>.json .``).
+Incluye como referencia el formato anterior (JSON con ``indent=2``).
+
+Uso:
+    python -m benchmarks.bench_codecs --steps 300 --payload-kb 20
+    python -m benchmarks.bench_codecs --files run-a.json run-b.json
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault('_M_PROJECT_ID', 'local-benchmark')
+
+from core.services.step_dispatcher import StepDispatcher  # noqa: E402
+from core.utils.codecs import Codec, codec_names, get_codec, missing_requirements  # noqa: E402
+
+
+def _dbt_result(step: int, models: int) -> dict:
+    return {"transformation_result": {"elapsed_time": 251.3 + step, "results": [
+        {"unique_id": f"model.analytics.model_{step}_{i}", "status": "success", "execution_time": round(0.5 + (step * 31 + i * 17) % 997 / 10, 3),
+         "adapter_response": {"rows_affected": (step * 7919 + i * 104729) % 10_000_000, "bytes_processed": (step + 1) * (i + 3) * 1048576, "code": "CREATE TABLE"},
+         "message": f"CREATE TABLE ({(step * i) % 5000} rows, {(step + i) % 900}.{i % 10} MiB processed)"}
+        for i in range(models)
+    ]}}
+
+
+def _synthetic_state(steps: int, payload_kb: int) -> dict:
+    models = max(1, payload_kb * 1024 // 300)
+    flow_steps = []
+    for i in range(steps):
+        step = {
+            "id": f"step-{i}", "name": f"step-{i}", "type": "dbt" if i % 3 == 0 else "extractor",
+            "status": "completed", "depends_on": [f"step-{i - 1}"] if i else [],
+            "started_at": "2026-10-01T03:00:00+00:00", "completed_at": "2026-10-01T03:04:12+00:00",
+            "config": {"account": "acme", "source": "pms", "tables": ["reservations", "rates", "rooms"], "dataset": "raw_acme"},
+        }
+        if step["type"] == "dbt":
+            step["result"] = _dbt_result(i, models)
+        else:
+            step["result"] = {"file_count": 12 + i, "max_extracted_at": f"2026-10-01T02:{i % 60:02d}:00+00:00"}
+        flow_steps.append(step)
+    return {"flow_id": "bench-flow", "run_id": "bench-run", "account": "acme", "status": "completed",
+            "flow_config": {"steps": flow_steps}}
+
+
+def _legacy_codec() -> Codec:
+    return Codec('json (indent=2)', 'application/json',
+                 lambda value: json.dumps(value, indent=2).encode('utf-8'), json.loads)
+
+
+def _measure(codec: Codec, value, repeat: int) -> dict:
+    encoded = codec.encode(value)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        codec.encode(value)
+    encode_ms = (time.perf_counter() - started) / repeat * 1000
+    started = time.perf_counter()
+    for _ in range(repeat):
+        codec.decode(encoded)
+    decode_ms = (time.perf_counter() - started) / repeat * 1000
+    return {"bytes": len(encoded), "encode_ms": round(encode_ms, 3), "decode_ms": round(decode_ms, 3)}
+
+
+def run(documents: dict, repeat: int) -> None:
+    codecs = [_legacy_codec()]
+    for name in codec_names():
+        missing = missing_requirements(name)
+        if missing:
+            print(f"# {name}: omitido (faltan {missing})")
+        else:
+            codecs.append(get_codec(name))
+
+    for label, value in documents.items():
+        baseline = None
+        for codec in codecs:
+            result = _measure(codec, value, repeat)
+            baseline = baseline or result["bytes"]
+            print({"document": label, "codec": codec.name, **result, "ratio": round(result["bytes"] / baseline, 3)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', nargs='*', default=[], help='Estados de run (JSON) a medir')
+    parser.add_argument('--steps', type=int, default=300, help='Pasos del run sintético')
+    parser.add_argument('--payload-kb', type=int, default=20, help='Tamaño aproximado del resultado de cada paso dbt')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeticiones por medida')
+    args = parser.parse_args()
+
+    documents = {}
+    for path in args.files:
+        with open(path) as f:
+            documents[os.path.basename(path)] = json.load(f)
+    if not documents:
+        documents["synthetic"] = _synthetic_state(args.steps, args.payload_kb)
+
+    # Mensaje de paso tal como lo construye el dispatcher, con el primer paso del primer documento
+    state = next(iter(documents.values()))
+    step = state["flow_config"]["steps"][0]
+    dispatcher = StepDispatcher(state_repo=None, publisher=None)
+    documents["step-message"] = dispatcher.build_step_message(state["flow_id"], state["run_id"], state, step)
+
+    run(documents, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
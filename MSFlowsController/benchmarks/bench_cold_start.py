@@ -0,0 +1,84 @@
+"""
+Benchmark de arranque en frío del punto de entrada FlowWorker.
+
+Cada muestra se ejecuta en un intérprete nuevo: importa main, importa las
+librerías cliente de GCP (que en producción se cargan al construir los clientes)
+y procesa un callback completo sobre los fakes en memoria. Informa la mediana
+de cada fase y los componentes que llegó a construir el camino del callback.
+
+Uso:
+    python -m benchmarks.bench_cold_start --samples 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_SAMPLE = r'''
+import base64, json, logging, os, time
+from types import SimpleNamespace
+os.environ.setdefault('_M_PROJECT_ID', 'local-benchmark')
+logging.disable(logging.CRITICAL)
+
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from google.cloud import pubsub_v1, storage  # noqa: F401
+clients = time.perf_counter()
+
+from benchmarks.fake_gcs import FakeStorageClient
+from benchmarks.fake_pubsub import InMemoryPublisher
+main.container._instances.update(storage_client=FakeStorageClient(), publisher=InMemoryPublisher())
+main.container.state_repo.save_flow_run_state("flow", "run", {
+    "flow_id": "flow", "run_id": "run", "account": "acme", "status": "running",
+    "flow_config": {"steps": [
+        {"id": "a", "type": "t", "status": "running", "config": {}},
+        {"id": "b", "type": "t", "status": "pending", "depends_on": ["a"], "config": {}}
+    ]}
+})
+main.container.timings.clear()
+seeded = time.perf_counter()
+
+callback = {"flow_id": "flow", "run_id": "run", "account": "acme", "task_id": "a", "status": "completed"}
+event = SimpleNamespace(data={"message": {"data": base64.b64encode(json.dumps(callback).encode()).decode(), "messageId": "1"}})
+result = main.FlowWorker(event)
+handled = time.perf_counter()
+
+print(json.dumps({
+    "import_main_ms": (imported - started) * 1000,
+    "client_libraries_ms": (clients - imported) * 1000,
+    "first_callback_ms": (handled - seeded) * 1000,
+    "total_ms": (imported - started + clients - imported + handled - seeded) * 1000,
+    "status": result.get("status"),
+    "components": sorted(main.container.timings),
+}))
+'''
+
+
+def _run_sample() -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, '-c', _SAMPLE], cwd=root, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=5, help='Intérpretes nuevos a medir')
+    args = parser.parse_args()
+
+    samples = [_run_sample() for _ in range(args.samples)]
+    report = {
+        key: round(statistics.median(sample[key] for sample in samples), 1)
+        for key in ('import_main_ms', 'client_libraries_ms', 'first_callback_ms', 'total_ms')
+    }
+    report['status'] = samples[-1]['status']
+    report['components'] = samples[-1]['components']
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark de contención del estado de ejecución sobre un bucket local falso.
+
+Lanza en paralelo los callbacks de completado de un fan-out de N ramas que
+convergen en un paso 'join' y compara la escritura con precondición de
+generación (compare-and-swap), la escritura incondicional y el log de eventos.
+
+Uso:
+    python -m benchmarks.bench_state_contention --width 30 --latency-ms 5
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('_M_PROJECT_ID', 'local-benchmark')
+
+from benchmarks.fake_gcs import FakeStorageClient  # noqa: E402
+from benchmarks.fake_pubsub import InMemoryPublisher  # noqa: E402
+from core.config import config  # noqa: E402
+from core.handlers.callback_handler import CallbackHandler  # noqa: E402
+from storage.event_store import FlowRunEventStore  # noqa: E402
+from storage.repositories import STATE_GENERATION_KEY, FlowRunStateRepository  # noqa: E402
+
+
+class _NoopNotificationService:
+    def send_flow_notification(self, flow_state, notification_type):
+        return True
+
+
+class _LastWriterWinsRepository(FlowRunStateRepository):
+    """Comportamiento previo: guarda sin precondición de generación."""
+
+    def save_flow_run_state(self, flow_id, run_id, state):
+        state.pop(STATE_GENERATION_KEY, None)
+        super().save_flow_run_state(flow_id, run_id, state)
+        state.pop(STATE_GENERATION_KEY, None)
+
+
+def _fan_out_state(flow_id: str, run_id: str, width: int) -> dict:
+    steps = [{"id": "root", "type": "bench-root", "status": "completed", "config": {}}]
+    for i in range(width):
+        steps.append({
+            "id": f"branch-{i}", "type": "bench-branch", "status": "running",
+            "depends_on": ["root"], "config": {"branch": i}
+        })
+    steps.append({
+        "id": "join", "type": "bench-join", "status": "pending",
+        "depends_on": [f"branch-{i}" for i in range(width)], "config": {}
+    })
+    return {
+        "flow_id": flow_id, "run_id": run_id, "account": "bench", "status": "running",
+        "flow_config": {"steps": steps}
+    }
+
+
+MODES = {
+    'last-writer-wins': _LastWriterWinsRepository,
+    'compare-and-swap': FlowRunStateRepository,
+    'event-log': FlowRunEventStore,
+}
+
+
+def run(width: int, latency_ms: float, mode: str) -> dict:
+    client = FakeStorageClient(latency_seconds=latency_ms / 1000.0)
+    state_repo = MODES[mode](storage_client=client)
+    publisher = InMemoryPublisher()
+    handler = CallbackHandler(state_repo, _NoopNotificationService(), publisher)
+    handler.max_state_attempts = max(handler.max_state_attempts, width + 1)
+
+    flow_id, run_id = "bench-flow", "bench-run"
+    state_repo.save_flow_run_state(flow_id, run_id, _fan_out_state(flow_id, run_id, width))
+
+    callbacks = [
+        {"flow_id": flow_id, "run_id": run_id, "account": "bench", "task_id": f"branch-{i}", "status": "completed"}
+        for i in range(width)
+    ]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=width) as pool:
+        list(pool.map(handler.handle_task_callback, callbacks))
+    elapsed = time.perf_counter() - started
+
+    final_state = state_repo.get_flow_run_state(flow_id, run_id)
+    steps = final_state["flow_config"]["steps"]
+    lost = sum(1 for s in steps if s["id"].startswith("branch-") and s.get("status") != "completed")
+    join_dispatches = sum(1 for topic, _ in publisher.messages if topic == "bench-join")
+    stats = client.bucket(config.RUNS_BUCKET).stats
+    return {
+        "mode": mode,
+        "elapsed_s": round(elapsed, 3),
+        "lost_completions": lost,
+        "join_dispatches": join_dispatches,
+        "conflicts": stats["conflicts"],
+        "writes": stats["writes"],
+        "bytes_written": stats["bytes_written"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=30, help='Número de ramas paralelas')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Latencia simulada por operación de GCS')
+    args = parser.parse_args()
+
+    for mode in MODES:
+        print(run(args.width, args.latency_ms, mode))
+
+
+if __name__ == '__main__':
+    main()
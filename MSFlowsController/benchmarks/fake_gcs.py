@@ -0,0 +1,179 @@
+"""
+Fake en memoria de Cloud Storage con semántica de generaciones.
+
+Implementa el subconjunto de la API de google-cloud-storage que usan los
+repositorios (blob, get_blob, list_blobs, descargas y subidas con
+if_generation_match) para poder ejecutar benchmarks y simulaciones en local.
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+
+class _StoredObject:
+    """Versión almacenada de un objeto."""
+
+    def __init__(self, data: bytes, generation: int, content_type: Optional[str], metadata: Optional[dict]):
+        self.data = data
+        self.generation = generation
+        self.content_type = content_type
+        self.metadata = dict(metadata or {})
+        self.updated = time.time()
+
+
+class FakeBlob:
+    """Blob de un FakeBucket."""
+
+    def __init__(self, bucket: 'FakeBucket', name: str):
+        self.bucket = bucket
+        self.name = name
+        self.generation: Optional[int] = None
+        self.content_type: Optional[str] = None
+        self.metadata: Optional[dict] = None
+        self.size: Optional[int] = None
+
+    @property
+    def etag(self) -> Optional[str]:
+        return str(self.generation) if self.generation is not None else None
+
+    def _load_properties(self, stored: _StoredObject):
+        self.generation = stored.generation
+        self.content_type = stored.content_type
+        self.metadata = dict(stored.metadata)
+        self.size = len(stored.data)
+
+    def exists(self) -> bool:
+        self.bucket._latency()
+        return self.name in self.bucket._objects
+
+    def reload(self):
+        self.bucket._latency()
+        stored = self.bucket._objects.get(self.name)
+        if stored is None:
+            raise NotFound(self.name)
+        self._load_properties(stored)
+
+    def download_as_bytes(self, if_generation_match: Optional[int] = None) -> bytes:
+        self.bucket._latency()
+        with self.bucket._lock:
+            stored = self.bucket._objects.get(self.name)
+            if stored is None:
+                raise NotFound(self.name)
+            if if_generation_match is not None and stored.generation != if_generation_match:
+                raise PreconditionFailed(self.name)
+            self._load_properties(stored)
+            self.bucket.stats['reads'] += 1
+            self.bucket.stats['bytes_read'] += len(stored.data)
+            return stored.data
+
+    def download_as_text(self, if_generation_match: Optional[int] = None) -> str:
+        return self.download_as_bytes(if_generation_match=if_generation_match).decode('utf-8')
+
+    def upload_from_string(self, data, content_type: Optional[str] = None, if_generation_match: Optional[int] = None):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.bucket._latency()
+        with self.bucket._lock:
+            stored = self.bucket._objects.get(self.name)
+            current = stored.generation if stored else 0
+            if if_generation_match is not None and current != if_generation_match:
+                self.bucket.stats['conflicts'] += 1
+                raise PreconditionFailed(self.name)
+            self.bucket._generation += 1
+            new = _StoredObject(data, self.bucket._generation, content_type or 'application/octet-stream', self.metadata)
+            self.bucket._objects[self.name] = new
+            self._load_properties(new)
+            self.bucket.stats['writes'] += 1
+            self.bucket.stats['bytes_written'] += len(data)
+
+    def patch(self):
+        self.bucket._latency()
+        with self.bucket._lock:
+            stored = self.bucket._objects.get(self.name)
+            if stored is None:
+                raise NotFound(self.name)
+            stored.metadata = dict(self.metadata or {})
+
+    def delete(self, if_generation_match: Optional[int] = None):
+        self.bucket._latency()
+        with self.bucket._lock:
+            stored = self.bucket._objects.get(self.name)
+            if stored is None:
+                raise NotFound(self.name)
+            if if_generation_match is not None and stored.generation != if_generation_match:
+                raise PreconditionFailed(self.name)
+            del self.bucket._objects[self.name]
+            self.bucket.stats['deletes'] += 1
+
+
+class FakeBucket:
+    """Bucket en memoria, seguro entre hilos."""
+
+    def __init__(self, name: str, latency_seconds: float = 0.0):
+        self.name = name
+        self.latency_seconds = latency_seconds
+        self._objects: Dict[str, _StoredObject] = {}
+        self._generation = 0
+        self._lock = threading.RLock()
+        self.stats = {'reads': 0, 'writes': 0, 'deletes': 0, 'lists': 0, 'conflicts': 0, 'bytes_read': 0, 'bytes_written': 0}
+
+    def _latency(self):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def get_blob(self, name: str) -> Optional[FakeBlob]:
+        self._latency()
+        with self._lock:
+            stored = self._objects.get(name)
+            if stored is None:
+                return None
+            blob = FakeBlob(self, name)
+            blob._load_properties(stored)
+            return blob
+
+    def list_blobs(self, prefix: str = '', start_offset: Optional[str] = None, end_offset: Optional[str] = None, **_):
+        self._latency()
+        with self._lock:
+            self.stats['lists'] += 1
+            names = sorted(name for name in self._objects if name.startswith(prefix))
+            blobs = []
+            for name in names:
+                if start_offset is not None and name < start_offset:
+                    continue
+                if end_offset is not None and name >= end_offset:
+                    continue
+                blob = FakeBlob(self, name)
+                blob._load_properties(self._objects[name])
+                blobs.append(blob)
+            return blobs
+
+
+class FakeStorageClient:
+    """Cliente de Cloud Storage en memoria."""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self._buckets: Dict[str, FakeBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, bucket_name: str) -> FakeBucket:
+        with self._lock:
+            if bucket_name not in self._buckets:
+                self._buckets[bucket_name] = FakeBucket(bucket_name, self.latency_seconds)
+            return self._buckets[bucket_name]
+
+    def list_blobs(self, bucket_name: str, **kwargs):
+        return self.bucket(bucket_name).list_blobs(**kwargs)
+
+    @property
+    def stats(self) -> dict:
+        totals: Dict[str, int] = {}
+        for bucket in self._buckets.values():
+            for key, value in bucket.stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
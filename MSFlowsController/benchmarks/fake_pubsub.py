@@ -0,0 +1,59 @@
+"""
+Publicador en memoria que implementa PublisherInterface.
+"""
+import itertools
+import threading
+from typing import Any, Dict, List, Tuple
+
+
+class InMemoryPublisher:
+    """Guarda los mensajes publicados en lugar de enviarlos a Pub/Sub."""
+
+    def __init__(self):
+        self.messages: List[Tuple[str, Dict[str, Any]]] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, topic: str, message: Dict[str, Any]) -> str:
+        with self._lock:
+            self.messages.append((topic, message))
+            return f"msg-{next(self._ids)}"
+
+    def publish_batch(self, messages: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        return [
+            {"topic": topic, "message_id": self.publish(topic, message), "error": None}
+            for topic, message in messages
+        ]
+
+    def drain(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Devuelve y elimina los mensajes publicados hasta ahora."""
+        with self._lock:
+            messages, self.messages = self.messages, []
+            return messages
+
+
+class _DoneFuture:
+    """Future ya resuelto, como el que devuelve PublisherClient.publish."""
+
+    def __init__(self, value: str):
+        self._value = value
+
+    def result(self, timeout=None) -> str:
+        return self._value
+
+
+class FakePublisherClient:
+    """Sustituto de pubsub_v1.PublisherClient: guarda los mensajes publicados."""
+
+    def __init__(self):
+        self.messages: List[Tuple[str, bytes]] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def topic_path(self, project_id: str, topic_name: str) -> str:
+        return f"projects/{project_id}/topics/{topic_name}"
+
+    def publish(self, topic: str, data: bytes, **attributes) -> _DoneFuture:
+        with self._lock:
+            self.messages.append((topic, data))
+            return _DoneFuture(f"msg-{next(self._ids)}")
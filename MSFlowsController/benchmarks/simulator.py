@@ -0,0 +1,258 @@
+"""
+Simulador offline de MSFlowsController y generador de carga.
+
+Conecta FlowStartHandler y CallbackHandler a fakes en memoria (Cloud Storage y
+Pub/Sub), lanza ejecuciones de DAGs sintéticos y responde a cada paso publicado
+con su callback de completado, con concurrencia y retardos configurables.
+
+Al terminar informa de callbacks/segundo, latencia p50/p99 del handler, bytes
+de estado escritos, conflictos y actualizaciones perdidas (pasos que no llegaron
+a 'completed'), para detectar regresiones de planificación antes de desplegar.
+
+Uso:
+    python -m benchmarks.simulator --shape fan-out --size 50 --runs 20 --concurrency 16
+    python -m benchmarks.simulator --shape chain --size 100 --backend events --delay-ms 0 5
+"""
+import argparse
+import copy
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+os.environ.setdefault('_M_PROJECT_ID', 'local-simulator')
+
+from benchmarks.fake_gcs import FakeStorageClient  # noqa: E402
+from benchmarks.fake_pubsub import InMemoryPublisher  # noqa: E402
+from core.config import config  # noqa: E402
+from core.handlers.callback_handler import CallbackHandler  # noqa: E402
+from core.handlers.flow_handlers import FlowStartHandler  # noqa: E402
+from core.services.dynamic_flow_service import DynamicFlowService  # noqa: E402
+from storage.event_store import FlowRunEventStore  # noqa: E402
+from storage.repositories import FlowDefinitionRepository, FlowRunStateRepository  # noqa: E402
+from storage.running_index import RunningStepIndex  # noqa: E402
+from storage.sharded_store import FlowRunShardedStore  # noqa: E402
+
+
+class _NoopNotificationService:
+    def send_flow_notification(self, flow_state, notification_type):
+        return True
+
+
+def _step(step_id: str, depends_on: Optional[List[str]] = None) -> Dict[str, Any]:
+    return {
+        "id": step_id,
+        "type": "sim-step",
+        "depends_on": depends_on or [],
+        "config": {"sim_id": step_id}
+    }
+
+
+def fan_out_steps(size: int) -> List[Dict[str, Any]]:
+    """Un paso raíz, 'size' ramas paralelas y un paso 'join' que depende de todas."""
+    branches = [_step(f"branch-{i}", ["root"]) for i in range(size)]
+    return [_step("root")] + branches + [_step("join", [b["id"] for b in branches])]
+
+
+def chain_steps(size: int) -> List[Dict[str, Any]]:
+    """Cadena secuencial de 'size' pasos."""
+    return [_step(f"step-{i}", [f"step-{i - 1}"] if i else None) for i in range(size)]
+
+
+def diamond_steps(size: int) -> List[Dict[str, Any]]:
+    """'size' diamantes encadenados: top -> (left, right) -> join, y cada join es el top del siguiente."""
+    steps = [_step("top-0")]
+    top = "top-0"
+    for i in range(size):
+        steps.append(_step(f"left-{i}", [top]))
+        steps.append(_step(f"right-{i}", [top]))
+        steps.append(_step(f"join-{i}", [f"left-{i}", f"right-{i}"]))
+        top = f"join-{i}"
+    return steps
+
+
+SHAPES = {
+    'fan-out': fan_out_steps,
+    'chain': chain_steps,
+    'diamond': diamond_steps,
+}
+
+
+def _percentile(values: List[float], quantile: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+BACKENDS = {
+    'document': FlowRunStateRepository,
+    'events': FlowRunEventStore,
+    'sharded': FlowRunShardedStore,
+}
+
+
+class Simulation:
+    """Controlador completo sobre fakes en memoria."""
+
+    def __init__(
+        self,
+        backend: str = 'document',
+        latency_ms: float = 0.0,
+        concurrency: int = 8,
+        delay_ms: Tuple[float, float] = (0.0, 0.0),
+        duplicate_rate: float = 0.0,
+        seed: int = 0
+    ):
+        self.client = FakeStorageClient(latency_seconds=latency_ms / 1000.0)
+        self.publisher = InMemoryPublisher()
+        self.state_repo = BACKENDS[backend](storage_client=self.client)
+        running_index = RunningStepIndex(storage_client=self.client)
+        dynamic_flow_service = DynamicFlowService(
+            flow_repo=FlowDefinitionRepository(storage_client=self.client),
+            state_repo=self.state_repo,
+            publisher=self.publisher,
+            running_index=running_index
+        )
+        self.start_handler = FlowStartHandler(dynamic_flow_service=dynamic_flow_service)
+        self.callback_handler = CallbackHandler(
+            self.state_repo, _NoopNotificationService(), self.publisher, running_index=running_index
+        )
+        self.callback_handler.max_state_attempts = max(self.callback_handler.max_state_attempts, concurrency * 4)
+        self.callback_handler.dispatcher.max_state_attempts = self.callback_handler.max_state_attempts
+        self.concurrency = concurrency
+        self.delay_ms = delay_ms
+        self.duplicate_rate = duplicate_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._message_ids = 0
+
+    def _uniform(self, low: float, high: float) -> float:
+        with self._random_lock:
+            return self._random.uniform(low, high)
+
+    def _deliver(self, callback: Dict[str, Any], message_id: str) -> Tuple[float, str]:
+        """Simula la ejecución del paso (retardo) y entrega su callback; devuelve la latencia del handler."""
+        delay = self._uniform(*self.delay_ms)
+        if delay:
+            time.sleep(delay / 1000.0)
+        started = time.perf_counter()
+        result = self.callback_handler.handle_task_callback(callback, message_id=message_id)
+        return time.perf_counter() - started, (result or {}).get('status', 'error')
+
+    def _callbacks_for_published(self) -> List[Tuple[Dict[str, Any], str]]:
+        """Convierte los mensajes publicados en callbacks de completado (con duplicados opcionales)."""
+        callbacks = []
+        for _topic, message in self.publisher.drain():
+            self._message_ids += 1
+            callback = {
+                "flow_id": message.get('flow_id'),
+                "run_id": message.get('run_id'),
+                "account": message.get('account'),
+                "task_id": message.get('task_id') or message.get('step_id'),
+                "status": "completed",
+                "result": {"status": "completed"}
+            }
+            message_id = f"sim-{self._message_ids}"
+            callbacks.append((callback, message_id))
+            if self.duplicate_rate and self._uniform(0, 1) < self.duplicate_rate:
+                # Reentrega de Pub/Sub: mismo mensaje, mismo id
+                callbacks.append((dict(callback), message_id))
+        return callbacks
+
+    def run(self, shape: str, size: int, runs: int) -> Dict[str, Any]:
+        """
+        Lanza 'runs' ejecuciones del DAG sintético y las lleva hasta el final.
+
+        Returns:
+            dict: Métricas de la simulación
+        """
+        steps = SHAPES[shape](size)
+        flow_id, account = f"sim-{shape}", "sim"
+
+        run_ids = []
+        for _ in range(runs):
+            message = {"flow_id": flow_id, "account": account, "flow_config": {"steps": copy.deepcopy(steps)}}
+            result = self.start_handler.handle_flow_start(message, flow_id, account)
+            run_ids.append(result.get('run_id'))
+
+        latencies: List[float] = []
+        outcomes: Counter = Counter()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = set()
+            while True:
+                for callback, message_id in self._callbacks_for_published():
+                    pending.add(pool.submit(self._deliver, callback, message_id))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    latency, status = future.result()
+                    latencies.append(latency)
+                    outcomes[status] += 1
+        elapsed = time.perf_counter() - started
+
+        run_statuses: Counter = Counter()
+        lost_updates = 0
+        for run_id in run_ids:
+            state = self.state_repo.get_flow_run_state(flow_id, run_id) or {}
+            run_statuses[state.get('status', 'missing')] += 1
+            lost_updates += sum(
+                1 for step in state.get('flow_config', {}).get('steps', []) if step.get('status') != 'completed'
+            )
+
+        stats = self.client.bucket(config.RUNS_BUCKET).stats
+        return {
+            "shape": shape,
+            "size": size,
+            "runs": runs,
+            "steps_per_run": len(steps),
+            "callbacks": len(latencies),
+            "elapsed_s": round(elapsed, 3),
+            "callbacks_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "handler_p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+            "handler_p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+            "outcomes": dict(outcomes),
+            "run_statuses": dict(run_statuses),
+            "lost_updates": lost_updates,
+            "storage_writes": stats["writes"],
+            "state_bytes_written": stats["bytes_written"],
+            "storage_conflicts": stats["conflicts"],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shape', choices=sorted(SHAPES), default='fan-out', help='Forma del DAG sintético')
+    parser.add_argument('--size', type=int, default=30, help='Ancho (fan-out), longitud (chain) o número de diamantes')
+    parser.add_argument('--runs', type=int, default=10, help='Ejecuciones simultáneas')
+    parser.add_argument('--concurrency', type=int, default=8, help='Callbacks procesados en paralelo')
+    parser.add_argument('--delay-ms', type=float, nargs=2, default=(0.0, 0.0), metavar=('MIN', 'MAX'),
+                        help='Duración simulada de cada paso')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latencia simulada por operación de GCS')
+    parser.add_argument('--backend', choices=list(BACKENDS), default=config.RUN_STATE_BACKEND,
+                        help='Almacén del estado de ejecución')
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help='Fracción de callbacks reentregados')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='Muestra los logs del controlador')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    simulation = Simulation(
+        backend=args.backend,
+        latency_ms=args.latency_ms,
+        concurrency=args.concurrency,
+        delay_ms=tuple(args.delay_ms),
+        duplicate_rate=args.duplicate_rate,
+        seed=args.seed
+    )
+    print(simulation.run(args.shape, args.size, args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@
 Configuración centralizada para el FlowController.
 """
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic import Field, computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -18,6 +18,74 @@ class Settings(BaseSettings):
     FLOWS_BUCKET: str = Field(default='ocean_flows_graphs', validation_alias='FLOWS_BUCKET')
     RUNS_BUCKET: str = Field(default='ocean_flows_runs', validation_alias='RUNS_BUCKET')
     
+    # Run state concurrency
+    STATE_SAVE_MAX_ATTEMPTS: int = Field(default=5, validation_alias='STATE_SAVE_MAX_ATTEMPTS')
+    # 'document' (un JSON por run), 'events' (log de eventos append-only) o
+    # 'sharded' (cabecera del run y documentos por paso para las cargas grandes)
+    RUN_STATE_BACKEND: str = Field(default='document', validation_alias='RUN_STATE_BACKEND')
+    EVENT_SNAPSHOT_INTERVAL: int = Field(default=20, validation_alias='EVENT_SNAPSHOT_INTERVAL')
+    # Tamaño a partir del cual el result/config de un paso va a su propio documento ('sharded')
+    STATE_SHARD_MIN_BYTES: int = Field(default=1024, validation_alias='STATE_SHARD_MIN_BYTES')
+    # Codec del documento de estado: json, json+gzip, json+zstd, msgpack, msgpack+zstd (ver core.utils.codecs)
+    RUN_STATE_CODEC: str = Field(default='json', validation_alias='RUN_STATE_CODEC')
+    # Índice de runs activos y recientes: refresco de last_updated de los runs activos
+    # y ventana por defecto de las consultas de runs terminados
+    RUN_INDEX_REFRESH_SECONDS: int = Field(default=300, validation_alias='RUN_INDEX_REFRESH_SECONDS')
+    RUN_INDEX_RECENT_HOURS: int = Field(default=24, validation_alias='RUN_INDEX_RECENT_HOURS')
+    # Ids de mensaje de Pub/Sub recordados por run para descartar callbacks duplicados
+    CALLBACK_LEDGER_MAX_MESSAGE_IDS: int = Field(default=1000, validation_alias='CALLBACK_LEDGER_MAX_MESSAGE_IDS')
+    
+    # Timeouts de pasos (el paso puede definir su propio 'timeout_minutes')
+    STEP_TIMEOUT_MINUTES: float = Field(default=30.0, validation_alias='STEP_TIMEOUT_MINUTES')
+    TIMEOUT_SWEEP_BATCH_SIZE: int = Field(default=1000, validation_alias='TIMEOUT_SWEEP_BATCH_SIZE')
+    
+    # Reintentos de pasos por defecto (max_attempts=1 desactiva los reintentos)
+    RETRY_MAX_ATTEMPTS: int = Field(default=1, validation_alias='RETRY_MAX_ATTEMPTS')
+    RETRY_BASE_DELAY_SECONDS: float = Field(default=60.0, validation_alias='RETRY_BASE_DELAY_SECONDS')
+    RETRY_MAX_DELAY_SECONDS: float = Field(default=900.0, validation_alias='RETRY_MAX_DELAY_SECONDS')
+    RETRY_JITTER: float = Field(default=0.5, validation_alias='RETRY_JITTER')
+    RETRY_RETRYABLE_ERRORS: List[str] = Field(default_factory=list, validation_alias='RETRY_RETRYABLE_ERRORS')
+
+    # Hijos de un paso 'map' en ejecución a la vez si el paso no define 'parallelism'
+    MAP_DEFAULT_PARALLELISM: int = Field(default=10, validation_alias='MAP_DEFAULT_PARALLELISM')
+    # Anidamiento máximo de pasos 'subflow' (protege de definiciones que se referencian a sí mismas)
+    SUBFLOW_MAX_DEPTH: int = Field(default=5, validation_alias='SUBFLOW_MAX_DEPTH')
+
+    # Hilos para leer definiciones y escribir estados en un arranque por lotes
+    BATCH_START_MAX_WORKERS: int = Field(default=16, validation_alias='BATCH_START_MAX_WORKERS')
+    
+    # Registra en los logs el tiempo de importación y construcción de cada componente
+    STARTUP_PROFILE: bool = Field(default=False, validation_alias='STARTUP_PROFILE')
+    
+    # Caché de definiciones de flujo (por instancia)
+    FLOW_DEFINITION_CACHE_SIZE: int = Field(default=256, validation_alias='FLOW_DEFINITION_CACHE_SIZE')
+    FLOW_DEFINITION_CACHE_TTL_SECONDS: float = Field(default=30.0, validation_alias='FLOW_DEFINITION_CACHE_TTL_SECONDS')
+    
+    # Pub/Sub batching (ver google.cloud.pubsub_v1.types.BatchSettings)
+    PUBSUB_BATCH_MAX_MESSAGES: int = Field(default=100, validation_alias='PUBSUB_BATCH_MAX_MESSAGES')
+    PUBSUB_BATCH_MAX_BYTES: int = Field(default=1_000_000, validation_alias='PUBSUB_BATCH_MAX_BYTES')
+    PUBSUB_BATCH_MAX_LATENCY_SECONDS: float = Field(default=0.01, validation_alias='PUBSUB_BATCH_MAX_LATENCY_SECONDS')
+    PUBSUB_PUBLISH_TIMEOUT_SECONDS: float = Field(default=60.0, validation_alias='PUBSUB_PUBLISH_TIMEOUT_SECONDS')
+    # Codec de los mensajes publicados; los consumidores deben leer el atributo 'content_type'
+    PUBSUB_MESSAGE_CODEC: str = Field(default='json', validation_alias='PUBSUB_MESSAGE_CODEC')
+    
+    # Límites de concurrencia de pasos despachados (0 = sin límite; los mapas se leen como JSON)
+    ADMISSION_GLOBAL_LIMIT: int = Field(default=0, validation_alias='ADMISSION_GLOBAL_LIMIT')
+    ADMISSION_ACCOUNT_LIMIT: int = Field(default=0, validation_alias='ADMISSION_ACCOUNT_LIMIT')
+    ADMISSION_TOPIC_LIMIT: int = Field(default=0, validation_alias='ADMISSION_TOPIC_LIMIT')
+    ADMISSION_ACCOUNT_LIMITS: Dict[str, int] = Field(default_factory=dict, validation_alias='ADMISSION_ACCOUNT_LIMITS')
+    ADMISSION_TOPIC_LIMITS: Dict[str, int] = Field(default_factory=dict, validation_alias='ADMISSION_TOPIC_LIMITS')
+    ADMISSION_LEDGER_MAX_ATTEMPTS: int = Field(default=20, validation_alias='ADMISSION_LEDGER_MAX_ATTEMPTS')
+    # Antigüedad a partir de la cual el barrido comprueba las entradas del registro contra el estado del run
+    ADMISSION_RECONCILE_SECONDS: int = Field(default=600, validation_alias='ADMISSION_RECONCILE_SECONDS')
+    
+    # Prioridad por camino crítico: duración supuesta de los pasos sin histórico y
+    # peso de la muestra nueva en la media del histórico de duraciones
+    CRITICAL_PATH_DEFAULT_STEP_SECONDS: float = Field(default=60.0, validation_alias='CRITICAL_PATH_DEFAULT_STEP_SECONDS')
+    STEP_HISTORY_SMOOTHING: float = Field(default=0.3, validation_alias='STEP_HISTORY_SMOOTHING')
+    # Muestras recientes por paso sobre las que se calculan p50/p90/max
+    STEP_HISTORY_WINDOW: int = Field(default=50, validation_alias='STEP_HISTORY_WINDOW')
+    
     model_config = SettingsConfigDict(env_file='.env', extra='ignore')
 
     @computed_field
@@ -0,0 +1,227 @@
+"""
+Lazy dependency container for the FlowWorker entry point.
+
+Components are built on first use, so each invocation only pays for what its
+path needs: a callback never builds the legacy FlowController nor imports its
+Celery tasks. GCP clients are created once per instance and shared by every
+component. With STARTUP_PROFILE enabled, the import and construction time of
+each component is logged.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from core.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class Container:
+    """Builds and caches the controller's components on demand."""
+    
+    def __init__(self, overrides: Optional[Dict[str, Any]] = None):
+        # Pre-built instances (e.g. fakes for local runs) keyed by component name
+        self._instances: Dict[str, Any] = dict(overrides or {})
+        self._lock = threading.RLock()
+        self.timings: Dict[str, float] = {}
+    
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                started = time.perf_counter()
+                self._instances[name] = factory()
+                self.timings[name] = time.perf_counter() - started
+                if config.STARTUP_PROFILE:
+                    logger.info(f"⏱️ STARTUP - {name} built in {self.timings[name] * 1000:.1f} ms")
+            return self._instances[name]
+    
+    # --- Shared clients ---
+    
+    @property
+    def storage_client(self):
+        def build():
+            from google.cloud import storage
+            return storage.Client()
+        return self._get('storage_client', build)
+    
+    @property
+    def publisher(self):
+        def build():
+            from core.services.publisher import PubSubPublisher
+            return PubSubPublisher()
+        return self._get('publisher', build)
+    
+    # --- Repositories ---
+    
+    @property
+    def flow_repo(self):
+        def build():
+            from storage.repositories import FlowDefinitionRepository
+            return FlowDefinitionRepository(storage_client=self.storage_client)
+        return self._get('flow_repo', build)
+    
+    @property
+    def state_repo(self):
+        def build():
+            if config.RUN_STATE_BACKEND == 'events':
+                from storage.event_store import FlowRunEventStore
+                return FlowRunEventStore(storage_client=self.storage_client, run_index=self.run_index)
+            if config.RUN_STATE_BACKEND == 'sharded':
+                from storage.sharded_store import FlowRunShardedStore
+                return FlowRunShardedStore(storage_client=self.storage_client, run_index=self.run_index)
+            from storage.repositories import FlowRunStateRepository
+            return FlowRunStateRepository(storage_client=self.storage_client, run_index=self.run_index)
+        return self._get('state_repo', build)
+    
+    @property
+    def running_index(self):
+        def build():
+            from storage.running_index import RunningStepIndex
+            return RunningStepIndex(storage_client=self.storage_client)
+        return self._get('running_index', build)
+    
+    @property
+    def run_index(self):
+        def build():
+            from storage.run_index import RunIndex
+            return RunIndex(storage_client=self.storage_client)
+        return self._get('run_index', build)
+    
+    @property
+    def admission_ledger(self):
+        def build():
+            from storage.admission_ledger import AdmissionLedger
+            return AdmissionLedger(storage_client=self.storage_client)
+        return self._get('admission_ledger', build)
+    
+    @property
+    def step_history(self):
+        def build():
+            from storage.step_history import StepHistoryRepository
+            return StepHistoryRepository(storage_client=self.storage_client)
+        return self._get('step_history', build)
+    
+    @property
+    def result_cache(self):
+        def build():
+            from storage.result_cache import StepResultCache
+            return StepResultCache(storage_client=self.storage_client)
+        return self._get('result_cache', build)
+    
+    # --- Services ---
+    
+    @property
+    def memoizer(self):
+        def build():
+            from core.services.memoization import ResultMemoizer
+            return ResultMemoizer(self.result_cache)
+        return self._get('memoizer', build)
+    
+    @property
+    def admission(self):
+        def build():
+            from core.services.admission import AdmissionController
+            return AdmissionController(self.admission_ledger)
+        return self._get('admission', build)
+    
+    @property
+    def step_dispatcher(self):
+        def build():
+            from core.services.step_dispatcher import StepDispatcher
+            return StepDispatcher(
+                state_repo=self.state_repo,
+                publisher=self.publisher,
+                running_index=self.running_index,
+                admission=self.admission
+            )
+        return self._get('step_dispatcher', build)
+    
+    @property
+    def notification_service(self):
+        def build():
+            from core.notifications import NotificationService
+            return NotificationService(flow_repo=self.flow_repo)
+        return self._get('notification_service', build)
+    
+    @property
+    def dynamic_flow_service(self):
+        def build():
+            from core.services.dynamic_flow_service import DynamicFlowService
+            return DynamicFlowService(
+                flow_repo=self.flow_repo,
+                state_repo=self.state_repo,
+                publisher=self.publisher,
+                running_index=self.running_index,
+                dispatcher=self.step_dispatcher,
+                step_history=self.step_history
+            )
+        return self._get('dynamic_flow_service', build)
+    
+    @property
+    def classic_flow_controller(self):
+        def build():
+            from worker.flowscontroller import FlowController
+            return FlowController(
+                publisher_client=self.publisher.publisher,
+                storage_client=self.storage_client,
+                state_repo=self.state_repo,
+                dispatcher=self.step_dispatcher
+            )
+        return self._get('classic_flow_controller', build)
+    
+    # --- Handlers ---
+    
+    @property
+    def flow_start_handler(self):
+        def build():
+            from core.handlers.flow_handlers import FlowStartHandler
+            return FlowStartHandler(
+                dynamic_flow_service=self.dynamic_flow_service,
+                classic_flow_controller_factory=lambda: self.classic_flow_controller
+            )
+        return self._get('flow_start_handler', build)
+    
+    @property
+    def flow_continuation_handler(self):
+        def build():
+            from core.handlers.flow_handlers import FlowContinuationHandler
+            return FlowContinuationHandler(dynamic_flow_service=self.dynamic_flow_service)
+        return self._get('flow_continuation_handler', build)
+    
+    @property
+    def callback_handler(self):
+        def build():
+            from core.handlers.callback_handler import CallbackHandler
+            return CallbackHandler(
+                state_repo=self.state_repo,
+                notification_service=self.notification_service,
+                publisher=self.publisher,
+                running_index=self.running_index,
+                dispatcher=self.step_dispatcher,
+                step_history=self.step_history,
+                memoizer=self.memoizer
+            )
+        return self._get('callback_handler', build)
+    
+    @property
+    def resume_handler(self):
+        def build():
+            from core.handlers.resume_handler import RunResumeHandler
+            return RunResumeHandler(state_repo=self.state_repo, dispatcher=self.step_dispatcher)
+        return self._get('resume_handler', build)
+    
+    @property
+    def timeout_sweeper(self):
+        def build():
+            from core.handlers.timeout_sweeper import TimeoutSweeper
+            return TimeoutSweeper(
+                state_repo=self.state_repo,
+                running_index=self.running_index,
+                notification_service=self.notification_service,
+                dispatcher=self.step_dispatcher
+            )
+        return self._get('timeout_sweeper', build)
@@ -30,3 +30,7 @@ class StateNotFoundError(FlowError):
 class FlowDefinitionNotFoundError(FlowError):
     """Raised when flow definition cannot be found."""
     pass
+
+class StateConflictError(FlowError):
+    """Raised when the flow state was modified concurrently since it was read."""
+    pass
@@ -2,15 +2,30 @@
 Handler for processing Cloud Function callbacks and detecting internal errors.
 """
 import logging
+import random
+import time
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional, List
 
 from core.interfaces import (
     FlowRunStateRepositoryInterface,
     NotificationServiceInterface,
-    PublisherInterface
+    PublisherInterface,
+    RunningStepIndexInterface,
+    StepHistoryInterface
 )
 from core.config import config
+from core.exceptions import StateConflictError, StepExecutionError
+from core.services.memoization import ResultMemoizer
+from core.services.step_dispatcher import STATE_CONFLICT_BACKOFF_SECONDS, StepDispatcher
+from core.utils import metrics
+from flows.critical_path import get_critical_path, sort_by_priority
+from flows.durations import run_step_durations, run_step_queue_times
+from flows.graph import find_step, get_run_graph, record_transition
+from flows.mapping import complete_map_parent, get_dispatchable_steps
+from flows.retries import schedule_retry, should_retry
+from flows.ledger import is_duplicate, record_callback, transition_key
+from flows.routing import flatten_scalars, get_routing_index, resolve_route
 
 logger = logging.getLogger(__name__)
 
@@ -22,16 +37,27 @@ class CallbackHandler:
         self,
         state_repo: FlowRunStateRepositoryInterface,
         notification_service: NotificationServiceInterface,
-        publisher: PublisherInterface
+        publisher: PublisherInterface,
+        running_index: Optional[RunningStepIndexInterface] = None,
+        dispatcher: Optional[StepDispatcher] = None,
+        step_history: Optional[StepHistoryInterface] = None,
+        memoizer: Optional[ResultMemoizer] = None
     ):
         self.state_repo = state_repo
         self.notification_service = notification_service
         self.publisher = publisher
+        self.dispatcher = dispatcher or StepDispatcher(state_repo, publisher, running_index)
+        self.step_history = step_history
+        self.memoizer = memoizer
         self.project_id = config.PROJECT_ID
+        self.max_state_attempts = config.STATE_SAVE_MAX_ATTEMPTS
     
-    def handle_task_callback(self, message_json: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_task_callback(self, message_json: Dict[str, Any], message_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Processes a Cloud Function callback.
+        
+        message_id is the Pub/Sub message id; together with the step transition it
+        is used to discard redelivered callbacks before touching the state.
         """
         flow_id = message_json.get('flow_id')
         run_id = message_json.get('run_id')
@@ -58,45 +84,19 @@ class CallbackHandler:
                     "error": "Incomplete callback: missing flow_id/run_id/account/status"
                 }
             
-            # Load current flow state
-            log.info(f"🔍 FETCHING STATE")
-            flow_state = self.state_repo.get_flow_run_state(flow_id, run_id)
-            if not flow_state:
-                log.error(f"❌ STATE NOT FOUND")
-                return {
-                    "status": "error", 
-                    "error": f"Execution state not found for {flow_id}/{run_id}"
-                }
-            
-            # Infer task_id if missing
-            if not task_id:
-                task_id = self._infer_task_id(message_json, flow_state)
-                if task_id:
-                    message_json['task_id'] = task_id
-                    # Update logger context with inferred task_id
-                    log.extra['task_id'] = task_id
-                    log.info(f"🧭 INFERRED TASK_ID: '{task_id}'")
-                else:
-                    log.warning(f"⚠️ Could not infer task_id for step/topic='{source_step}'")
-            
-            # Update specific task status
-            updated_state = self._update_task_status(
-                flow_state, task_id, status, result, timestamp, log
-            )
-            
-            # Determine if flow should continue or stop
-            if status == "failed":
-                return self._handle_failure(flow_id, run_id, task_id, result, updated_state, log)
-            
-            elif status == "completed":
-                return self._handle_completion(flow_id, run_id, task_id, source_step, updated_state, log)
-            
-            else:
-                log.warning(f"Unknown status: {status}")
-                return {
-                    "status": "error",
-                    "error": f"Unknown status: {status}"
-                }
+            # Apply the callback as a compare-and-swap update: on a concurrent write
+            # the state is re-read and the step delta re-applied.
+            for attempt in range(1, self.max_state_attempts + 1):
+                try:
+                    return self._apply_callback(
+                        flow_id, run_id, task_id, status, result, timestamp, source_step, message_json, log,
+                        message_id=message_id
+                    )
+                except StateConflictError:
+                    if attempt == self.max_state_attempts:
+                        raise
+                    log.warning(f"⚔️ STATE CONFLICT - Retrying callback ({attempt}/{self.max_state_attempts})")
+                    time.sleep(random.uniform(0, STATE_CONFLICT_BACKOFF_SECONDS * attempt))
                 
         except Exception as e:
             log.error(f"Error processing callback: {str(e)}")
@@ -105,6 +105,90 @@ class CallbackHandler:
                 "error": str(e)
             }
     
+    def _apply_callback(
+        self,
+        flow_id: str,
+        run_id: str,
+        task_id: Optional[str],
+        status: str,
+        result: Dict[str, Any],
+        timestamp: Optional[str],
+        source_step: Optional[str],
+        message_json: Dict[str, Any],
+        log: logging.LoggerAdapter,
+        message_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Loads the current state, applies the callback and persists it."""
+        # Load current flow state
+        log.info(f"🔍 FETCHING STATE")
+        flow_state = self.state_repo.get_flow_run_state(flow_id, run_id)
+        if not flow_state:
+            log.error(f"❌ STATE NOT FOUND")
+            return {
+                "status": "error", 
+                "error": f"Execution state not found for {flow_id}/{run_id}"
+            }
+        
+        # Infer task_id if missing
+        if not task_id:
+            task_id = self._infer_task_id(message_json, flow_state)
+            if task_id:
+                message_json['task_id'] = task_id
+                # Update logger context with inferred task_id
+                log.extra['task_id'] = task_id
+                log.info(f"🧭 INFERRED TASK_ID: '{task_id}'")
+            else:
+                log.warning(f"⚠️ Could not infer task_id for step/topic='{source_step}'")
+        
+        # Idempotency: a redelivered callback exits here, before any state change or write
+        step = find_step(flow_state, get_run_graph(flow_state), task_id) if task_id else None
+        transition = transition_key(task_id, status, step.get('attempt', 1)) if step is not None else None
+        if is_duplicate(flow_state, message_id, transition):
+            metrics.increment('callbacks.duplicates_suppressed')
+            log.info(f"♻️ DUPLICATE CALLBACK - Already processed (message_id={message_id}, transition={transition})")
+            return {
+                "status": "duplicate",
+                "flow_id": flow_id,
+                "run_id": run_id,
+                "task_id": task_id
+            }
+        record_callback(flow_state, message_id, transition, config.CALLBACK_LEDGER_MAX_MESSAGE_IDS)
+        running_marker = self.dispatcher.running_marker(flow_id, run_id, step)
+        retrying = status == "failed" and step is not None and should_retry(step, result)
+        
+        # Update specific task status
+        updated_state = self._update_task_status(
+            flow_state, task_id, status, result, timestamp, log
+        )
+        
+        # Determine if flow should continue or stop
+        if retrying:
+            response = self._handle_retry(flow_id, run_id, step, result, updated_state, log)
+        
+        elif status == "failed":
+            response = self._handle_failure(flow_id, run_id, task_id, result, updated_state, log)
+        
+        elif status == "completed":
+            response = self._handle_completion(flow_id, run_id, task_id, source_step, updated_state, log)
+        
+        else:
+            log.warning(f"Unknown status: {status}")
+            return {
+                "status": "error",
+                "error": f"Unknown status: {status}"
+            }
+        
+        # The step is no longer running: drop it from the timeout index and free its
+        # admission slot (a failed flow gives up all of its slots)
+        self.dispatcher.unindex_running([running_marker], log)
+        if (status == "failed" and not retrying) or response.get("status") == "error":
+            self.dispatcher.cancel_run(flow_id, run_id, updated_state, log)
+        else:
+            self.dispatcher.release(flow_id, run_id, updated_state, [task_id], log)
+            if self.memoizer:
+                self.memoizer.remember(updated_state, step, log)
+        return response
+    
     def _handle_failure(self, flow_id: str, run_id: str, task_id: str, result: Dict[str, Any], updated_state: Dict[str, Any], log: logging.LoggerAdapter) -> Dict[str, Any]:
         """Handles task failure."""
         log.error(f"❌ TASK FAILED")
@@ -115,6 +199,8 @@ class CallbackHandler:
         
         log.info(f"💾 SAVING ERROR STATE")
         self.state_repo.save_flow_run_state(flow_id, run_id, updated_state)
+        self._record_step_history(updated_state, log)
+        self.dispatcher.notify_parent(updated_state, log)
         
         log.info(f"📧 SENDING FAILURE NOTIFICATION")
         try:
@@ -130,17 +216,61 @@ class CallbackHandler:
             "error": result.get('message', 'Unknown error')
         }
 
+    def _handle_retry(self, flow_id: str, run_id: str, step: Dict[str, Any], result: Dict[str, Any], updated_state: Dict[str, Any], log: logging.LoggerAdapter) -> Dict[str, Any]:
+        """Schedules a delayed re-dispatch of a failed step; the timeout sweep picks it up when due."""
+        graph = get_run_graph(updated_state)
+        retry_at = schedule_retry(graph, step, result, datetime.now(timezone.utc))
+        counts = graph.get('counts', {})
+        updated_state['failed_steps_count'] = counts.get('failed', 0) + counts.get('timeout', 0)
+        log.warning(f"🔁 RETRY SCHEDULED - {step['id']} attempt {step['attempt']} at {retry_at}")
+        
+        self.state_repo.save_flow_run_state(flow_id, run_id, updated_state)
+        self.dispatcher.index_running([(flow_id, run_id, step['id'], retry_at)], log)
+        metrics.increment('steps.retries_scheduled')
+        
+        return {
+            "status": "retry_scheduled",
+            "flow_id": flow_id,
+            "run_id": run_id,
+            "task_id": step['id'],
+            "attempt": step['attempt'],
+            "retry_at": retry_at
+        }
+
     def _handle_completion(self, flow_id: str, run_id: str, task_id: str, source_step: str, updated_state: Dict[str, Any], log: logging.LoggerAdapter) -> Dict[str, Any]:
         """Handles task completion."""
         log.info(f"✅ Task completed successfully")
         
-        next_steps = self._get_next_executable_steps(updated_state)
-        self._check_for_timeout_steps(updated_state, log)
+        # The last child of a map step completes the map step, releasing its dependents
+        map_parent = complete_map_parent(updated_state, task_id)
+        if map_parent:
+            log.info(f"🗺️ MAP STEP COMPLETED - {map_parent}")
+        
+        try:
+            next_steps = self._get_next_executable_steps(updated_state)
+            cached_steps = []
+            # Steps whose inputs did not change complete from cache, which may release further steps
+            while self.memoizer and next_steps:
+                cached = self.memoizer.apply_cached(updated_state, next_steps, log)
+                if not cached:
+                    break
+                cached_steps.extend(cached)
+                next_steps = self._get_next_executable_steps(updated_state)
+        except StepExecutionError as e:
+            # A map step whose items cannot be resolved fails the flow
+            counts = get_run_graph(updated_state).get('counts', {})
+            updated_state['failed_steps_count'] = counts.get('failed', 0) + counts.get('timeout', 0)
+            return self._handle_failure(flow_id, run_id, e.step_id, {"message": str(e)}, updated_state, log)
+        # Map steps add their children to the run and may complete on their own
+        graph = get_run_graph(updated_state)
+        updated_state['completed_steps_count'] = graph.get('counts', {}).get('completed', 0)
+        updated_state['total_steps_count'] = len(graph['index'])
         
         if not next_steps:
             # Check for flow completion
             all_steps = updated_state.get('flow_config', {}).get('steps', [])
-            all_completed = bool(all_steps) and all(s.get('status') == 'completed' for s in all_steps)
+            total_steps = updated_state.get('total_steps_count', len(all_steps))
+            all_completed = bool(all_steps) and updated_state.get('completed_steps_count') == total_steps
             
             if all_completed:
                 log.info("🎉 All steps completed. Marking flow as 'completed'.")
@@ -148,6 +278,8 @@ class CallbackHandler:
                 updated_state["completed_at"] = datetime.now(timezone.utc).isoformat()
                 
                 self.state_repo.save_flow_run_state(flow_id, run_id, updated_state)
+                self._record_step_history(updated_state, log)
+                self.dispatcher.notify_parent(updated_state, log)
                 
                 log.info(f"📧 SENDING SUCCESS NOTIFICATION")
                 try:
@@ -160,170 +292,109 @@ class CallbackHandler:
                     "flow_id": flow_id,
                     "run_id": run_id,
                     "completed_steps": [s.get('id') for s in all_steps],
+                    "cached_steps": cached_steps,
                     "next_steps": []
                 }
         
         if next_steps:
             log.info(f"🚀 Executing next steps: {[s['id'] for s in next_steps]}")
-            for step in next_steps:
-                try:
-                    log.info(f"📤 DISPATCHING STEP - {step['id']} ({step['type']})")
-                    topic_id = self._get_topic_for_step_type(step['type'])
-                    
-                    step_message = {
-                        **step['config'],
-                        'flow_id': flow_id,
-                        'run_id': run_id,
-                        'task_id': step['id'],
-                        'step_name': step.get('name', step['id']),
-                        'step_type': step['type'],
-                        'account': updated_state.get('account'),
-                        'callback_topic': 'ms-flows-controller',
-                        'callback_required': True
-                    }
-                    
-                    message_id = self.publisher.publish(topic_id, step_message)
-                    log.info(f"✅ STEP DISPATCHED - {step['id']} Message ID: {message_id}")
-                    
-                    step['status'] = 'running'
-                    step['started_at'] = datetime.now(timezone.utc).isoformat()
-                    
-                except Exception as step_error:
-                    log.error(f"❌ ERROR DISPATCHING STEP - {step['id']}: {step_error}")
-                    step['status'] = 'failed'
-                    step['error'] = str(step_error)
-            
+            self.dispatcher.claim(updated_state, next_steps)
             updated_state["next_executable_steps"] = [s['id'] for s in next_steps]
         
         self.state_repo.save_flow_run_state(flow_id, run_id, updated_state)
+        self.dispatcher.dispatch(flow_id, run_id, updated_state, next_steps, log)
         
         return {
             "status": "success",
             "flow_id": flow_id,
             "run_id": run_id,
             "completed_task": task_id,
+            "cached_steps": cached_steps,
             "next_steps": [s['id'] for s in next_steps] if next_steps else []
         }
 
     def _update_task_status(self, flow_state: Dict[str, Any], task_id: str, status: str, result: Dict[str, Any], timestamp: str, log: logging.LoggerAdapter) -> Dict[str, Any]:
         """Updates the status of a specific task in the flow."""
-        steps = flow_state.get('flow_config', {}).get('steps', [])
-        step_found = False
-        
-        for step in steps:
-            if step.get('id') == task_id:
-                step['status'] = status
-                step['result'] = result
-                step['completed_at'] = timestamp or datetime.now(timezone.utc).isoformat()
-                step_found = True
-                log.info(f"📝 Updated status of {task_id} to {status}")
-                break
+        graph = get_run_graph(flow_state)
+        step = find_step(flow_state, graph, task_id) if task_id else None
         
-        if not step_found:
+        if step is not None:
+            previous_status = step.get('status')
+            step['status'] = status
+            step['result'] = result
+            step['completed_at'] = timestamp or datetime.now(timezone.utc).isoformat()
+            released = record_transition(graph, task_id, previous_status, status)
+            log.info(f"📝 Updated status of {task_id} to {status}")
+            if released:
+                log.info(f"🔓 Released successors of {task_id}: {released}")
+        else:
             log.warning(f"Step {task_id} not found in flow configuration")
         
         flow_state['last_updated'] = datetime.now(timezone.utc).isoformat()
         
-        completed_steps = [s for s in steps if s.get('status') == 'completed']
-        failed_steps = [s for s in steps if s.get('status') == 'failed']
-        
-        flow_state['completed_steps_count'] = len(completed_steps)
-        flow_state['failed_steps_count'] = len(failed_steps)
-        flow_state['total_steps_count'] = len(steps)
+        counts = graph.get('counts', {})
+        flow_state['completed_steps_count'] = counts.get('completed', 0)
+        flow_state['failed_steps_count'] = counts.get('failed', 0) + counts.get('timeout', 0)
+        flow_state['total_steps_count'] = len(graph['index'])
         
         return flow_state
     
     def _get_next_executable_steps(self, flow_state: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Determines which steps can be executed now."""
-        steps = flow_state.get('flow_config', {}).get('steps', [])
-        completed_steps = {s.get('id') for s in steps if s.get('status') == 'completed'}
-
-        next_executable = []
-
-        for step in steps:
-            step_status = step.get('status', 'pending')
-            if step_status != 'pending':
-                continue
-
-            dependencies = step.get('depends_on', []) or []
-            unmet = [dep for dep in dependencies if dep not in completed_steps]
-            if not unmet:
-                next_executable.append(step)
-            else:
-                logger.debug(f"⏳ Step {step.get('id')} not executable yet; missing deps={unmet}")
-
-        return next_executable
+        """Determines which steps can be executed now, longest remaining critical path first."""
+        ready = get_dispatchable_steps(flow_state)
+        return sort_by_priority(ready, get_critical_path(flow_state))
+    
+    def _record_step_history(self, flow_state: Dict[str, Any], log: logging.LoggerAdapter) -> None:
+        """Feeds the step and queue times of a finished run to the step history (best effort)."""
+        if not self.step_history:
+            return
+        try:
+            steps = flow_state.get('flow_config', {}).get('steps', [])
+            self.step_history.record_run(
+                flow_state.get('account'), flow_state.get('flow_id'),
+                run_step_durations(steps), run_step_queue_times(steps)
+            )
+        except Exception as e:
+            log.error(f"❌ Error recording step history: {str(e)}")
 
     def _infer_task_id(self, message_json: Dict[str, Any], flow_state: Dict[str, Any]) -> Optional[str]:
-        """Infers task_id without hardcoding."""
+        """Infers task_id without hardcoding, using the run's routing index."""
         try:
-            steps = flow_state.get('flow_config', {}).get('steps', [])
             source_step = message_json.get('step') or message_json.get('topic') or message_json.get('source')
             result = message_json.get('result') or {}
+            cb_fields = flatten_scalars({**message_json, **result})
 
-            def flatten(d: Dict[str, Any]) -> Dict[str, str]:
-                flat = {}
-                for k, v in (d or {}).items():
-                    if isinstance(v, (str, int, float, bool)) and v is not None:
-                        flat[k] = str(v)
-                return flat
+            if source_step:
+                candidates = resolve_route(get_routing_index(flow_state), source_step, cb_fields)
+                if candidates:
+                    graph = get_run_graph(flow_state)
+                    by_status: Dict[str, str] = {}
+                    for step_id in candidates:
+                        step = find_step(flow_state, graph, step_id)
+                        if step is not None:
+                            by_status.setdefault(step.get('status', 'pending'), step_id)
+                    return by_status.get('running') or by_status.get('pending')
 
-            cb_fields = flatten({**message_json, **result})
+            # No type, or a callback the index cannot resolve: legacy scoring
+            return self._score_task_id(source_step, cb_fields, flow_state)
+        except Exception:
+            return None
 
-            def score(step: Dict[str, Any]) -> tuple:
-                if source_step and step.get('type') != source_step:
-                    return (-1, -1)
-                cfg = step.get('config', {}) or {}
-                cfg_flat = flatten(cfg)
-                matches = sum(1 for k, v in cfg_flat.items() if k in cb_fields and cb_fields[k] == str(v))
-                status_pref = 1 if step.get('status') == 'running' else (0 if step.get('status', 'pending') == 'pending' else -1)
-                return (matches, status_pref)
+    def _score_task_id(self, source_step: Optional[str], cb_fields: Dict[str, str], flow_state: Dict[str, Any]) -> Optional[str]:
+        """Scores every step against the callback fields (fallback for _infer_task_id)."""
+        steps = flow_state.get('flow_config', {}).get('steps', [])
 
-            scored = [(score(s), s) for s in steps]
-            valid = [s for sc, s in scored if sc[0] >= 0 and sc[1] >= 0]
-            if not valid:
-                return None
-            best = max(valid, key=lambda s: score(s))
-            return best.get('id')
-        except Exception:
+        def score(step: Dict[str, Any]) -> tuple:
+            if source_step and step.get('type') != source_step:
+                return (-1, -1)
+            cfg_flat = flatten_scalars(step.get('config', {}) or {})
+            matches = sum(1 for k, v in cfg_flat.items() if k in cb_fields and cb_fields[k] == str(v))
+            status_pref = 1 if step.get('status') == 'running' else (0 if step.get('status', 'pending') == 'pending' else -1)
+            return (matches, status_pref)
+
+        scored = [(score(s), s) for s in steps]
+        valid = [s for sc, s in scored if sc[0] >= 0 and sc[1] >= 0]
+        if not valid:
             return None
-    
-    def _get_topic_for_step_type(self, step_type: str) -> str:
-        """Determines the Pub/Sub topic based on step type."""
-        topic = step_type
-        logger.info(f"📋 Using type '{step_type}' as topic '{topic}'")
-        return topic
-    
-    def _check_for_timeout_steps(self, flow_state: Dict[str, Any], log: logging.LoggerAdapter):
-        """Checks for steps that have been running for too long."""
-        try:
-            steps = flow_state.get('flow_config', {}).get('steps', [])
-            current_time = datetime.now(timezone.utc)
-            timeout_minutes = 30
-            
-            for step in steps:
-                if step.get('status') == 'running':
-                    started_at_str = step.get('started_at')
-                    if started_at_str:
-                        try:
-                            if isinstance(started_at_str, str):
-                                started_at = datetime.fromisoformat(started_at_str.replace('Z', '+00:00'))
-                            else:
-                                started_at = started_at_str
-                            
-                            elapsed = current_time - started_at
-                            elapsed_minutes = elapsed.total_seconds() / 60
-                            
-                            if elapsed_minutes > timeout_minutes:
-                                log.warning(f"⏰ TIMEOUT - Step {step['id']} running for {elapsed_minutes:.1f} mins")
-                                step['status'] = 'timeout'
-                                step['timeout_at'] = current_time.isoformat()
-                                step['error'] = f"Timeout after {elapsed_minutes:.1f} minutes"
-                                
-                                flow_state['failed_steps_count'] = flow_state.get('failed_steps_count', 0) + 1
-                                
-                        except Exception as e:
-                            log.error(f"Error processing timeout for step {step['id']}: {str(e)}")
-                            
-        except Exception as e:
-            log.error(f"Error checking timeouts: {str(e)}")
+        best = max(valid, key=lambda s: score(s))
+        return best.get('id')
@@ -2,12 +2,16 @@
 Handlers for different flow types.
 """
 import logging
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, TYPE_CHECKING
 
+from core.config import config
 from core.interfaces import FlowExecutorInterface
-from worker.flowscontroller import FlowController
 from core.utils.message_utils import has_dynamic_definition
 
+if TYPE_CHECKING:
+    from worker.flowscontroller import FlowController
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,10 +21,23 @@ class FlowStartHandler:
     def __init__(
         self, 
         dynamic_flow_service: FlowExecutorInterface,
-        classic_flow_controller: Optional[FlowController] = None
+        classic_flow_controller: Optional["FlowController"] = None,
+        classic_flow_controller_factory: Optional[Callable[[], "FlowController"]] = None
     ) -> None:
         self.dynamic_flow_service = dynamic_flow_service
-        self.classic_flow_controller = classic_flow_controller or FlowController()
+        self._classic_flow_controller = classic_flow_controller
+        self._classic_flow_controller_factory = classic_flow_controller_factory
+    
+    @property
+    def classic_flow_controller(self) -> "FlowController":
+        """Legacy controller, created (and its Celery tasks imported) on first use."""
+        if self._classic_flow_controller is None:
+            if self._classic_flow_controller_factory is not None:
+                self._classic_flow_controller = self._classic_flow_controller_factory()
+            else:
+                from worker.flowscontroller import FlowController
+                self._classic_flow_controller = FlowController()
+        return self._classic_flow_controller
     
     def handle_flow_start(self, message_json: Dict[str, Any], flow_id: str, account: str) -> Dict[str, Any]:
         """
@@ -68,6 +85,51 @@ class FlowStartHandler:
                 "task_id": None,
                 "run_id": None
             }
+    
+    def handle_batch_start(self, message_json: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Handles a batch of flow starts: {"action": "batch_start", "account": ..., "flows": [...]}.
+        
+        Each entry is routed like a single start. Dynamic flows are started together
+        (concurrent loads and state writes, one publish); classic flows are started
+        concurrently. The account of the message applies to entries without one.
+        """
+        entries = [
+            {"account": message_json.get('account'), **entry} if message_json.get('account') else dict(entry)
+            for entry in message_json.get('flows') or []
+        ]
+        logger.info(f"📦 BATCH START - {len(entries)} flows")
+        results: List[Optional[Dict[str, Any]]] = [None] * len(entries)
+        
+        dynamic = [i for i, entry in enumerate(entries) if has_dynamic_definition(entry)]
+        classic = [i for i, entry in enumerate(entries) if not has_dynamic_definition(entry)]
+        if dynamic:
+            started = self.dynamic_flow_service.execute_flows_batch([entries[i] for i in dynamic])
+            for position, result in zip(dynamic, started):
+                results[position] = result
+        if classic:
+            controller = self.classic_flow_controller
+            with ThreadPoolExecutor(max_workers=max(1, min(config.BATCH_START_MAX_WORKERS, len(classic)))) as pool:
+                started = pool.map(lambda entry: self._start_classic(controller, entry), [entries[i] for i in classic])
+                for position, result in zip(classic, started):
+                    results[position] = result
+        
+        failed = sum(1 for result in results if result.get('status') not in ('success', 'started'))
+        logger.info(f"📦 BATCH START COMPLETED - {len(results) - failed}/{len(results)} flows started")
+        return {
+            "status": "success" if not failed else ("error" if failed == len(results) else "partial"),
+            "started": len(results) - failed,
+            "failed": failed,
+            "results": results
+        }
+    
+    def _start_classic(self, controller: "FlowController", entry: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            result = controller.start_flow(entry)
+            return {"status": result.get('status'), "flow_id": entry.get('flow_id'), "account": entry.get('account'), "run_id": result.get('run_id')}
+        except Exception as e:
+            logger.error(f"Error starting flow {entry.get('flow_id')}: {str(e)}")
+            return {"status": "error", "flow_id": entry.get('flow_id'), "account": entry.get('account'), "error": str(e)}
 
 
 class FlowContinuationHandler:
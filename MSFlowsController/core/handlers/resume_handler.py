@@ -0,0 +1,94 @@
+"""
+Handler for resuming a failed run from the point of failure.
+"""
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from core.config import config
+from core.exceptions import StateConflictError
+from core.interfaces import FlowRunStateRepositoryInterface
+from core.services.step_dispatcher import STATE_CONFLICT_BACKOFF_SECONDS, StepDispatcher
+from core.utils.logging_utils import get_flow_logger
+from flows.critical_path import get_critical_path, sort_by_priority
+from flows.graph import get_run_graph
+from flows.mapping import get_dispatchable_steps
+from flows.resume import reset_for_resume
+
+logger = logging.getLogger(__name__)
+
+# Run statuses that can be resumed
+RESUMABLE_STATUSES = ('error',)
+
+
+class RunResumeHandler:
+    """
+    Resumes a failed run in place, keeping its run_id.
+
+    Failed and downstream steps go back to pending; completed steps keep their
+    results, and only the new frontier is dispatched.
+    """
+
+    def __init__(self, state_repo: FlowRunStateRepositoryInterface, dispatcher: StepDispatcher):
+        self.state_repo = state_repo
+        self.dispatcher = dispatcher
+        self.max_state_attempts = config.STATE_SAVE_MAX_ATTEMPTS
+
+    def handle_resume(self, flow_id: str, run_id: str) -> Dict[str, Any]:
+        """Resumes the run and returns the reset and dispatched steps."""
+        log = get_flow_logger(__name__, flow_id, run_id)
+        if not flow_id or not run_id:
+            return {"status": "error", "error": "Resume requires flow_id and run_id"}
+
+        try:
+            for attempt in range(1, self.max_state_attempts + 1):
+                try:
+                    return self._resume(flow_id, run_id, log)
+                except StateConflictError:
+                    if attempt == self.max_state_attempts:
+                        raise
+                    log.warning(f"⚔️ STATE CONFLICT - Retrying resume ({attempt}/{self.max_state_attempts})")
+                    time.sleep(random.uniform(0, STATE_CONFLICT_BACKOFF_SECONDS * attempt))
+        except Exception as e:
+            log.error(f"Error resuming run: {str(e)}")
+            return {"status": "error", "error": str(e)}
+
+    def _resume(self, flow_id: str, run_id: str, log: logging.LoggerAdapter) -> Dict[str, Any]:
+        flow_state = self.state_repo.get_flow_run_state(flow_id, run_id)
+        if not flow_state:
+            return {"status": "error", "error": f"Execution state not found for {flow_id}/{run_id}"}
+        if flow_state.get('status') not in RESUMABLE_STATUSES:
+            return {
+                "status": "error",
+                "error": f"Run {run_id} is '{flow_state.get('status')}', only failed runs can be resumed"
+            }
+
+        reset_steps = reset_for_resume(flow_state)
+        next_steps: List[Dict[str, Any]] = sort_by_priority(get_dispatchable_steps(flow_state), get_critical_path(flow_state))
+        graph = get_run_graph(flow_state)
+        log.info(f"🔁 RESUMING RUN - Reset: {reset_steps}, dispatching: {[s['id'] for s in next_steps]}")
+
+        for key in ('error', 'failed_task', 'completed_at'):
+            flow_state.pop(key, None)
+        flow_state['status'] = 'running'
+        flow_state['resumed_at'] = datetime.now(timezone.utc).isoformat()
+        flow_state['resume_count'] = flow_state.get('resume_count', 0) + 1
+        self.dispatcher.claim(flow_state, next_steps)
+        counts = graph.get('counts', {})
+        flow_state['completed_steps_count'] = counts.get('completed', 0)
+        flow_state['failed_steps_count'] = counts.get('failed', 0) + counts.get('timeout', 0)
+        flow_state['total_steps_count'] = len(graph['index'])
+        flow_state['next_executable_steps'] = [s['id'] for s in next_steps]
+
+        self.state_repo.save_flow_run_state(flow_id, run_id, flow_state)
+        self.dispatcher.dispatch(flow_id, run_id, flow_state, next_steps, log)
+
+        return {
+            "status": "resumed",
+            "flow_id": flow_id,
+            "run_id": run_id,
+            "reset_steps": reset_steps,
+            "next_steps": [s['id'] for s in next_steps]
+        }
@@ -0,0 +1,180 @@
+"""
+Scheduled sweeper that expires running steps past their deadline.
+"""
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import config
+from core.exceptions import StateConflictError
+from core.interfaces import FlowRunStateRepositoryInterface, NotificationServiceInterface, RunningStepIndexInterface
+from core.services.step_dispatcher import STATE_CONFLICT_BACKOFF_SECONDS, StepDispatcher
+from core.utils.logging_utils import get_flow_logger
+from flows.graph import find_step, get_run_graph
+from flows.retries import RETRY_AT_KEY, RETRY_WAIT_STATUS
+from flows.timeouts import TIMEOUT_DEADLINE_KEY, expire_step
+
+logger = logging.getLogger(__name__)
+
+
+class TimeoutSweeper:
+    """
+    Expires overdue running steps of all active runs and re-dispatches due retries.
+    
+    Overdue steps come from a single listing of the running-steps index; only the
+    states of runs that actually have an overdue step are loaded. Steps waiting
+    for a retry are indexed by their retry time, so the same listing finds them,
+    as are queued steps whose admission ledger update failed. Each sweep also
+    reconciles the admission ledger with the run states.
+    """
+    
+    def __init__(
+        self,
+        state_repo: FlowRunStateRepositoryInterface,
+        running_index: RunningStepIndexInterface,
+        notification_service: NotificationServiceInterface,
+        dispatcher: Optional[StepDispatcher] = None
+    ):
+        self.state_repo = state_repo
+        self.running_index = running_index
+        self.notification_service = notification_service
+        self.dispatcher = dispatcher
+        self.max_state_attempts = config.STATE_SAVE_MAX_ATTEMPTS
+    
+    def sweep(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Expires every step whose deadline has passed.
+        
+        Markers are removed once their run has been processed, whether the step
+        timed out or had already finished; runs that fail to update keep their
+        markers and are retried on the next sweep.
+        """
+        now = now or datetime.now(timezone.utc)
+        overdue = self.running_index.list_overdue(int(now.timestamp()), max_results=config.TIMEOUT_SWEEP_BATCH_SIZE)
+        logger.info(f"⏰ TIMEOUT SWEEP - {len(overdue)} overdue markers")
+        
+        by_run: Dict[tuple, List[Dict[str, Any]]] = {}
+        for entry in overdue:
+            by_run.setdefault((entry['flow_id'], entry['run_id']), []).append(entry)
+        
+        expired: List[str] = []
+        retried: List[str] = []
+        errors = 0
+        for (flow_id, run_id), entries in by_run.items():
+            log = get_flow_logger(__name__, flow_id, run_id)
+            try:
+                expired_steps, retried_steps = self._expire_run(flow_id, run_id, entries, now, log)
+            except Exception as e:
+                errors += 1
+                log.error(f"❌ Error expiring steps: {str(e)}")
+                continue
+            expired.extend(f"{flow_id}/{run_id}/{step_id}" for step_id in expired_steps)
+            retried.extend(f"{flow_id}/{run_id}/{step_id}" for step_id in retried_steps)
+            self.running_index.remove(
+                (entry['flow_id'], entry['run_id'], entry['step_id'], entry['deadline']) for entry in entries
+            )
+        
+        reconciled: List[str] = []
+        if self.dispatcher:
+            try:
+                reconciled = self.dispatcher.reconcile_admission(logger)
+            except Exception as e:
+                errors += 1
+                logger.error(f"❌ Error reconciling admission ledger: {str(e)}")
+        
+        return {
+            "status": "success",
+            "checked": len(overdue),
+            "runs": len(by_run),
+            "expired_steps": expired,
+            "retried_steps": retried,
+            "reconciled_slots": reconciled,
+            "errors": errors
+        }
+    
+    def _expire_run(self, flow_id: str, run_id: str, entries: List[Dict[str, Any]], now: datetime, log: logging.LoggerAdapter) -> Tuple[List[str], List[str]]:
+        """Expires the overdue steps of one run and claims its due retries (compare-and-swap)."""
+        for attempt in range(1, self.max_state_attempts + 1):
+            flow_state = self.state_repo.get_flow_run_state(flow_id, run_id)
+            if not flow_state:
+                log.warning("⚠️ STATE NOT FOUND - Dropping running-step markers")
+                return [], []
+            
+            graph = get_run_graph(flow_state)
+            expired_steps = []
+            retry_steps = []
+            requeue_steps = []
+            for entry in entries:
+                step = find_step(flow_state, graph, entry['step_id'])
+                if step is not None and step.get('status') == RETRY_WAIT_STATUS and step.get(RETRY_AT_KEY) == entry['deadline']:
+                    retry_steps.append(step)
+                    continue
+                # Claimed for admission but the ledger update failed: queue it again
+                if step is not None and step.get('status') == 'queued':
+                    requeue_steps.append(step)
+                    continue
+                # A marker whose step already finished (or was re-dispatched with a new deadline) is stale
+                if step is None or step.get('status') != 'running' or step.get(TIMEOUT_DEADLINE_KEY) != entry['deadline']:
+                    continue
+                log.warning(f"⏰ TIMEOUT - Step {step['id']} passed its deadline")
+                expire_step(flow_state, graph, step, now)
+                expired_steps.append(step['id'])
+            
+            flow_failed = bool(expired_steps) and flow_state.get('status') == 'running'
+            # Retries only make sense while the run is alive, and need the dispatcher to publish
+            if flow_failed or flow_state.get('status') in ('error', 'completed') or not self.dispatcher:
+                retry_steps = []
+                requeue_steps = []
+            if not expired_steps and not retry_steps:
+                self._requeue(flow_id, run_id, flow_state, requeue_steps, log)
+                return [], []
+            
+            for step in retry_steps:
+                log.info(f"🔁 RETRY DUE - Re-dispatching {step['id']} (attempt {step.get('attempt')})")
+                step.pop(RETRY_AT_KEY, None)
+            if retry_steps:
+                self.dispatcher.claim(flow_state, retry_steps)
+            
+            if flow_failed:
+                flow_state['status'] = 'error'
+                flow_state['error'] = f"Steps timed out: {', '.join(expired_steps)}"
+                flow_state['failed_task'] = expired_steps[0]
+                flow_state['completed_at'] = now.isoformat()
+            
+            try:
+                self.state_repo.save_flow_run_state(flow_id, run_id, flow_state)
+                break
+            except StateConflictError:
+                if attempt == self.max_state_attempts:
+                    raise
+                log.warning(f"⚔️ STATE CONFLICT - Retrying timeout update ({attempt}/{self.max_state_attempts})")
+                time.sleep(random.uniform(0, STATE_CONFLICT_BACKOFF_SECONDS * attempt))
+        
+        if retry_steps:
+            self.dispatcher.dispatch(flow_id, run_id, flow_state, retry_steps, log)
+        self._requeue(flow_id, run_id, flow_state, requeue_steps, log)
+        
+        if self.dispatcher and expired_steps:
+            # Expired steps give up their admission slots; a failed flow gives up all of them
+            if flow_failed:
+                self.dispatcher.cancel_run(flow_id, run_id, flow_state, log)
+            else:
+                self.dispatcher.release(flow_id, run_id, flow_state, expired_steps, log)
+        
+        if flow_failed:
+            if self.dispatcher:
+                self.dispatcher.notify_parent(flow_state, log)
+            log.info("📧 SENDING FAILURE NOTIFICATION")
+            try:
+                self.notification_service.send_flow_notification(flow_state, 'fail')
+            except Exception as notification_error:
+                log.error(f"❌ Error sending failure notification: {str(notification_error)}")
+        return expired_steps, [step['id'] for step in retry_steps]
+    
+    def _requeue(self, flow_id: str, run_id: str, flow_state: Dict[str, Any], steps: List[Dict[str, Any]], log: logging.LoggerAdapter) -> None:
+        """Queues again steps whose admission ledger update failed (queueing is idempotent)."""
+        if steps:
+            log.info(f"🚦 REQUEUE - Queueing {[step['id'] for step in steps]} for admission again")
+            self.dispatcher.dispatch(flow_id, run_id, flow_state, steps, log)
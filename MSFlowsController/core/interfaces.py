@@ -1,7 +1,7 @@
 """
 Interfaces for the core components of the FlowController.
 """
-from typing import Dict, Any, Optional, Protocol
+from typing import Dict, Any, Iterable, List, Optional, Protocol, Tuple
 
 class FlowDefinitionRepositoryInterface(Protocol):
     """Interface for retrieving flow definitions."""
@@ -18,6 +18,60 @@ class FlowRunStateRepositoryInterface(Protocol):
     def save_flow_run_state(self, flow_id: str, run_id: str, state: Dict[str, Any]) -> None:
         ...
 
+class RunningStepIndexInterface(Protocol):
+    """Interface for the deadline-ordered index of running steps."""
+    
+    def add(self, entries: Iterable[Tuple[str, str, str, int]]) -> None:
+        """Registers (flow_id, run_id, step_id, deadline) entries."""
+        ...
+    
+    def remove(self, entries: Iterable[Tuple[str, str, str, int]]) -> None:
+        ...
+    
+    def list_overdue(self, now: int, max_results: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Returns {flow_id, run_id, step_id, deadline} entries with deadline <= now, in deadline order."""
+        ...
+
+class RunIndexInterface(Protocol):
+    """Interface for the index of active and recent runs."""
+    
+    def list_runs(
+        self,
+        account: Optional[str] = None,
+        flow_id: Optional[str] = None,
+        statuses: Optional[Iterable[str]] = None,
+        since: Any = None,
+        until: Any = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Returns {account, flow_id, run_id, status, started, last_updated} entries, most recent first."""
+        ...
+
+class StepHistoryInterface(Protocol):
+    """Interface for the per-step duration history."""
+    
+    def get_history(self, account: str, flow_id: str) -> Dict[str, Dict[str, Any]]:
+        """Returns the rolling statistics (p50/p90/max durations and queue times) of each step of a flow."""
+        ...
+    
+    def get_durations(self, account: str, flow_id: str) -> Dict[str, float]:
+        """Returns the expected duration (seconds) of each step of a flow."""
+        ...
+    
+    def record_run(self, account: str, flow_id: str, durations: Dict[str, float], queue_times: Optional[Dict[str, float]] = None) -> bool:
+        """Adds the step durations and admission queue times of a finished run."""
+        ...
+
+class ResultCacheInterface(Protocol):
+    """Interface for the last successful result of memoizable steps."""
+    
+    def get(self, account: str, flow_id: str, step_id: str) -> Optional[Dict[str, Any]]:
+        """Returns {cache_key, result, run_id, completed_at} or None."""
+        ...
+    
+    def put(self, account: str, flow_id: str, step_id: str, entry: Dict[str, Any]) -> None:
+        ...
+
 class NotificationServiceInterface(Protocol):
     """Interface for sending notifications."""
     
@@ -29,9 +83,20 @@ class PublisherInterface(Protocol):
     
     def publish(self, topic: str, message: Dict[str, Any]) -> str:
         ...
+    
+    def publish_batch(self, messages: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Publishes several (topic, message) pairs at once and waits for all of them.
+        Returns one result per message, in order: {"topic", "message_id", "error"}.
+        """
+        ...
 
 class FlowExecutorInterface(Protocol):
     """Interface for executing flows."""
     
     def execute_flow(self, message_json: Dict[str, Any]) -> Dict[str, Any]:
         ...
+
+    def execute_flows_batch(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Starts several flows at once; returns one result per entry, in order."""
+        ...
@@ -12,8 +12,10 @@ logger = logging.getLogger(__name__)
 class NotificationService:
     """Servicio para enviar notificaciones de éxito y fallo de flujos."""
     
-    def __init__(self):
+    def __init__(self, flow_repo=None):
         self.project_id = self._get_project_id()
+        # Repositorio de definiciones compartido (se crea bajo demanda si no se inyecta)
+        self.flow_repo = flow_repo
     
     def _get_project_id(self) -> str:
         """Obtiene el project_id desde variables de entorno."""
@@ -42,9 +44,10 @@ class NotificationService:
             # Fallback: si no hay notifications en el estado, leer la definición del flujo desde GCS
             if not notifications_config:
                 try:
-                    from storage.repositories import FlowDefinitionRepository
-                    repo = FlowDefinitionRepository()
-                    definition = repo.get_flow_definition(
+                    if self.flow_repo is None:
+                        from storage.repositories import FlowDefinitionRepository
+                        self.flow_repo = FlowDefinitionRepository()
+                    definition = self.flow_repo.get_flow_definition(
                         account=flow_state.get('account'),
                         flow_id=flow_state.get('flow_id')
                     ) or {}
@@ -0,0 +1,219 @@
+"""
+Admission controller enforcing concurrency limits on dispatched steps.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.config import config
+from core.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+GLOBAL_SCOPE = 'global'
+
+
+def account_scope(account: str) -> str:
+    """Ledger scope of an account limit."""
+    return f"account/{account}"
+
+
+def topic_scope(topic: str) -> str:
+    """Ledger scope of a topic limit."""
+    return f"topic/{topic}"
+
+
+def admission_key(flow_id: str, run_id: str, step_id: str) -> str:
+    """Ledger key of a step."""
+    return f"{flow_id}/{run_id}/{step_id}"
+
+
+def _entry_key(entry: Dict[str, Any]) -> str:
+    return admission_key(entry['flow_id'], entry['run_id'], entry['step_id'])
+
+
+# Pending slot release: (scope, limit, key matcher, also drop matching queued entries)
+_Freed = Tuple[str, int, Callable[[str], bool], bool]
+
+
+class AdmissionController:
+    """
+    Decides which queued steps may start, given global, per-account and per-topic limits.
+    
+    Each limited scope (a topic, an account, the global limit) has its own ledger
+    document with the steps holding one of its slots and the steps waiting for
+    one, so dispatches of different accounts and topics do not contend on a single
+    object. A step starts once it holds a slot in every limited scope it belongs
+    to: scopes are taken in a fixed order (topic, account, global) and a step that
+    does not fit waits in the queue of the first full scope, giving back the slots
+    it already took. Freeing a slot admits the waiting steps of that scope by
+    priority (remaining critical path), then in FIFO order, so a saturated
+    extractor does not hold up the rest.
+    A limit of 0 means unlimited; with no limit configured the controller is disabled
+    and the dispatch path never touches the ledger.
+    """
+    
+    def __init__(
+        self,
+        ledger,
+        global_limit: Optional[int] = None,
+        account_limit: Optional[int] = None,
+        topic_limit: Optional[int] = None,
+        account_limits: Optional[Dict[str, int]] = None,
+        topic_limits: Optional[Dict[str, int]] = None
+    ):
+        self.ledger = ledger
+        self.global_limit = config.ADMISSION_GLOBAL_LIMIT if global_limit is None else global_limit
+        self.account_limit = config.ADMISSION_ACCOUNT_LIMIT if account_limit is None else account_limit
+        self.topic_limit = config.ADMISSION_TOPIC_LIMIT if topic_limit is None else topic_limit
+        self.account_limits = dict(config.ADMISSION_ACCOUNT_LIMITS if account_limits is None else account_limits)
+        self.topic_limits = dict(config.ADMISSION_TOPIC_LIMITS if topic_limits is None else topic_limits)
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(
+            self.global_limit or self.account_limit or self.topic_limit
+            or any(self.account_limits.values()) or any(self.topic_limits.values())
+        )
+    
+    def enqueue(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Queues steps and returns every entry admitted as a result (of any run).
+        
+        Entries are {flow_id, run_id, step_id, account, topic, priority}.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        admitted = []
+        freed: List[_Freed] = []
+        # Stable sort: equal priorities keep their arrival order
+        for entry in sorted(entries, key=lambda e: -e.get('priority', 0.0)):
+            entry = self._acquire({**entry, "queued_at": entry.get('queued_at') or now}, freed)
+            if entry is not None:
+                admitted.append(entry)
+        admitted.extend(self._drain(freed))
+        
+        metrics.increment('admission.enqueued', len(entries))
+        return self._record_admitted(admitted)
+    
+    def release(self, entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Frees the slots of finished steps and returns the entries admitted in their place.
+        
+        Entries are {flow_id, run_id, step_id, account, topic}; account and topic
+        select the ledger documents holding the step.
+        """
+        keys_by_scope: Dict[str, Tuple[int, set]] = {}
+        for entry in entries:
+            for scope, limit in self._scopes(entry):
+                keys_by_scope.setdefault(scope, (limit, set()))[1].add(_entry_key(entry))
+        if not keys_by_scope:
+            return []
+        freed = [(scope, limit, keys.__contains__, True) for scope, (limit, keys) in keys_by_scope.items()]
+        return self._record_admitted(self._drain(freed))
+    
+    def cancel_run(self, flow_id: str, run_id: str, entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Drops every admitted or queued step of a run and returns the entries admitted in their place.
+        
+        Entries are the run's steps ({flow_id, run_id, step_id, account, topic}); they
+        select the ledger documents to clean.
+        """
+        prefix = admission_key(flow_id, run_id, '')
+        scopes = dict(scope for entry in entries for scope in self._scopes(entry))
+        freed = [(scope, limit, lambda key: key.startswith(prefix), True) for scope, limit in scopes.items()]
+        return self._record_admitted(self._drain(freed))
+    
+    def entries(self) -> List[Dict[str, Any]]:
+        """Every entry of the ledger (admitted or waiting), once per step."""
+        entries: Dict[str, Dict[str, Any]] = {}
+        for scope in self.ledger.scopes():
+            document = self.ledger.read(scope)
+            for entry in list(document['running'].values()) + document['queue']:
+                entries.setdefault(_entry_key(entry), entry)
+        return list(entries.values())
+    
+    def _limit_for(self, value: Optional[str], specific: Dict[str, int], default: int) -> int:
+        return specific.get(value, default) if value is not None else default
+    
+    def _scopes(self, entry: Dict[str, Any]) -> List[Tuple[str, int]]:
+        """Limited scopes of an entry with their limits, in acquisition order."""
+        scopes = []
+        topic, account = entry.get('topic'), entry.get('account')
+        topic_limit = self._limit_for(topic, self.topic_limits, self.topic_limit)
+        if topic_limit:
+            scopes.append((topic_scope(topic), topic_limit))
+        account_limit = self._limit_for(account, self.account_limits, self.account_limit)
+        if account_limit:
+            scopes.append((account_scope(account), account_limit))
+        if self.global_limit:
+            scopes.append((GLOBAL_SCOPE, self.global_limit))
+        return scopes
+    
+    def _acquire(self, entry: Dict[str, Any], freed: List[_Freed]) -> Optional[Dict[str, Any]]:
+        """
+        Takes a slot in every limited scope of an entry and returns it admitted.
+        
+        If a scope is full the entry waits in its queue and returns None; the
+        slots already taken are added to 'freed'.
+        """
+        key = _entry_key(entry)
+        held = []
+        for scope, limit in self._scopes(entry):
+            def take(document, limit=limit):
+                if key in document['running']:
+                    return True
+                if len(document['running']) < limit:
+                    document['running'][key] = entry
+                    document['queue'] = [e for e in document['queue'] if _entry_key(e) != key]
+                    return True
+                if all(_entry_key(e) != key for e in document['queue']):
+                    document['queue'].append(entry)
+                return False
+            
+            if not self.ledger.update(scope, take):
+                freed.extend((held_scope, held_limit, lambda k: k == key, False) for held_scope, held_limit in held)
+                return None
+            held.append((scope, limit))
+        return {**entry, "admitted_at": datetime.now(timezone.utc).isoformat()}
+    
+    def _drain(self, freed: List[_Freed]) -> List[Dict[str, Any]]:
+        """Frees slots and admits the waiting entries of each scope, until no slot changes hands."""
+        admitted = []
+        while freed:
+            scope, limit, match, drop_queued = freed.pop(0)
+            candidates = self.ledger.update(scope, lambda document: self._free(document, limit, match, drop_queued))
+            for candidate in candidates:
+                entry = self._acquire(candidate, freed)
+                if entry is not None:
+                    admitted.append(entry)
+        return admitted
+    
+    def _free(self, document: Dict[str, Any], limit: int, match: Callable[[str], bool], drop_queued: bool) -> List[Dict[str, Any]]:
+        """Removes matching entries from a scope and moves waiting entries into its free slots (by priority)."""
+        running = document['running']
+        for key in [key for key in running if match(key)]:
+            del running[key]
+        if drop_queued:
+            document['queue'] = [e for e in document['queue'] if not match(_entry_key(e))]
+        
+        picked = []
+        # Stable sort: equal priorities keep their arrival order
+        for entry in sorted(document['queue'], key=lambda e: -e.get('priority', 0.0)):
+            if len(running) >= limit:
+                break
+            running[_entry_key(entry)] = entry
+            picked.append(entry)
+        picked_keys = {_entry_key(e) for e in picked}
+        document['queue'] = [e for e in document['queue'] if _entry_key(e) not in picked_keys]
+        return picked
+    
+    def _record_admitted(self, admitted: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for entry in admitted:
+            queued_at = datetime.fromisoformat(entry['queued_at'])
+            admitted_at = datetime.fromisoformat(entry['admitted_at'])
+            metrics.observe('admission.queue_wait_seconds', (admitted_at - queued_at).total_seconds())
+        if admitted:
+            metrics.increment('admission.admitted', len(admitted))
+            logger.info(f"🚦 ADMITTED - {[admission_key(e['flow_id'], e['run_id'], e['step_id']) for e in admitted]}")
+        return admitted
@@ -3,16 +3,20 @@ Service for executing dynamic N8N-like flows.
 """
 import uuid
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 
 from core.interfaces import (
     FlowDefinitionRepositoryInterface,
     FlowRunStateRepositoryInterface,
     PublisherInterface,
-    FlowExecutorInterface
+    FlowExecutorInterface,
+    RunningStepIndexInterface,
+    StepHistoryInterface
 )
 from core.config import config
+from core.services.step_dispatcher import StepDispatcher
 from core.exceptions import (
     FlowConfigurationError, 
     FlowDefinitionNotFoundError, 
@@ -21,11 +25,41 @@ from core.exceptions import (
 )
 from core.utils.logging_utils import get_flow_logger
 from flows.normalization import normalize_steps, is_advanced_flow
+from flows.critical_path import CRITICAL_PATH_KEY, compute_critical_path, sort_by_priority
+from flows.graph import RUN_GRAPH_KEY, compile_run_graph
+from flows.mapping import get_dispatchable_steps, is_map_step
+from flows.subflows import PARENT_RUN_KEY, is_subflow_step
+from flows.routing import ROUTING_INDEX_KEY, build_routing_index
+from flows.timeouts import TIMEOUT_DEADLINE_KEY, compute_deadline
 from n8n_engine import N8NLikeEngine
 
 # Base logger
 logger = logging.getLogger(__name__)
 
+
+class _PreparedRun(NamedTuple):
+    """A started run that is not persisted yet (flow_state is None for basic flows)."""
+    flow_state: Optional[Dict[str, Any]]
+    response: Dict[str, Any]
+    running_markers: List[tuple]
+    dispatch_steps: List[Dict[str, Any]]
+
+
+class _DeferredPublisher:
+    """Collects the engine's messages so the messages of many runs go out in one batch."""
+
+    def __init__(self):
+        self.messages: List[Tuple[str, Dict[str, Any]]] = []
+        self.owners: List[int] = []
+        self.owner = 0
+
+    def publish(self, topic: str, message: Dict[str, Any]) -> Optional[str]:
+        self.messages.append((topic, message))
+        self.owners.append(self.owner)
+        # The message id is only known once the batch is published
+        return None
+
+
 class DynamicFlowService(FlowExecutorInterface):
     """
     Service for executing dynamic flows with N8N-like configuration.
@@ -35,11 +69,17 @@ class DynamicFlowService(FlowExecutorInterface):
         self,
         flow_repo: FlowDefinitionRepositoryInterface,
         state_repo: FlowRunStateRepositoryInterface,
-        publisher: PublisherInterface
+        publisher: PublisherInterface,
+        running_index: Optional[RunningStepIndexInterface] = None,
+        dispatcher: Optional[StepDispatcher] = None,
+        step_history: Optional[StepHistoryInterface] = None
     ):
         self.flow_repo = flow_repo
         self.state_repo = state_repo
         self.publisher = publisher
+        self.running_index = running_index
+        self.dispatcher = dispatcher or StepDispatcher(state_repo, publisher, running_index)
+        self.step_history = step_history
         
     def execute_flow(self, message_json: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -71,6 +111,104 @@ class DynamicFlowService(FlowExecutorInterface):
                 "error": str(e)
             }
 
+    def execute_flows_batch(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Starts several flows in one invocation.
+
+        Definitions (and step histories) are loaded and initial states written
+        concurrently, each run's state is written once, and the initial steps of
+        every run go out in a single batched publish.
+
+        Args:
+            entries: Start messages ({"flow_id", "account", ...}), one per flow.
+
+        Returns:
+            list: One result per entry, in order.
+        """
+        log = get_flow_logger(__name__, None, None)
+        log.info(f"📦 BATCH START - {len(entries)} flows")
+        results: List[Optional[Dict[str, Any]]] = [None] * len(entries)
+        deferred = _DeferredPublisher()
+        prepared: Dict[int, Tuple[str, _PreparedRun]] = {}
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(config.BATCH_START_MAX_WORKERS, len(entries) or 1))) as pool:
+            loaded = list(pool.map(self._load_batch_entry, entries))
+            
+            for position, (entry, (flow_config, durations, error)) in enumerate(zip(entries, loaded)):
+                flow_id, account = entry.get('flow_id'), entry.get('account')
+                run_id = str(uuid.uuid4())
+                run_log = get_flow_logger(__name__, flow_id, run_id)
+                try:
+                    if error is not None:
+                        raise error
+                    deferred.owner = position
+                    prepared[position] = (run_id, self._prepare_run(
+                        flow_config, flow_id, account, run_id, None, entry, run_log, deferred, durations
+                    ))
+                except Exception as e:
+                    run_log.error(f"❌ Error preparing flow start: {str(e)}")
+                    results[position] = {"status": "error", "flow_id": flow_id, "account": account, "error": str(e)}
+            
+            to_save = [(position, run_id, run) for position, (run_id, run) in prepared.items() if run.flow_state is not None]
+            saved = list(pool.map(lambda item: self._save_batch_state(item[1], item[2]), to_save))
+        
+        failed_saves = set()
+        for (position, _run_id, run), error in zip(to_save, saved):
+            if error is not None:
+                failed_saves.add(position)
+                results[position] = {"status": "error", "flow_id": run.response.get('flow_id'), "account": run.response.get('account'), "error": error}
+        
+        # One publish for the initial steps of every persisted run
+        outgoing = [(message, owner) for message, owner in zip(deferred.messages, deferred.owners) if owner not in failed_saves]
+        published = self.publisher.publish_batch([message for message, _ in outgoing]) if outgoing else []
+        undelivered: Dict[int, Dict[str, str]] = {}
+        for ((_, message), owner), outcome in zip(outgoing, published):
+            if outcome.get('error'):
+                undelivered.setdefault(owner, {})[message.get('step_id')] = outcome['error']
+        log.info(f"📤 BATCH START PUBLISHED - {len(outgoing) - sum(len(e) for e in undelivered.values())}/{len(outgoing)} initial steps")
+        
+        self._index_running([m for p, (_, run) in prepared.items() if p not in failed_saves for m in run.running_markers], log)
+        for position, (run_id, run) in prepared.items():
+            if position in failed_saves:
+                continue
+            flow_id = run.response.get('flow_id', entries[position].get('flow_id'))
+            run_log = get_flow_logger(__name__, flow_id, run_id)
+            if position in undelivered:
+                self.dispatcher.mark_dispatch_failures(flow_id, run_id, undelivered[position], run_log)
+            if run.flow_state is not None:
+                self.dispatcher.dispatch(flow_id, run_id, run.flow_state, run.dispatch_steps, run_log)
+            results[position] = {
+                "status": run.response.get('status'),
+                "flow_id": flow_id,
+                "account": entries[position].get('account'),
+                "run_id": run_id if run.flow_state is not None else None,
+                "undelivered_steps": sorted(undelivered.get(position, {}))
+            }
+        return results
+
+    def _load_batch_entry(self, entry: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, float]], Optional[Exception]]:
+        """Definition (repository first, then the embedded one) and step durations of a batch entry."""
+        flow_id, account = entry.get('flow_id'), entry.get('account')
+        try:
+            if not flow_id or not account:
+                raise FlowConfigurationError("Batch entries require flow_id and account", flow_id)
+            embedded = entry.get('flow_config') or (entry if entry.get('steps') or entry.get('tasks') else None)
+            flow_config = self.flow_repo.get_flow_definition(account, flow_id) or embedded
+            if not flow_config:
+                raise FlowDefinitionNotFoundError(f"Flow definition not found for {account}/{flow_id}", flow_id)
+            return flow_config, self._historical_durations(account, flow_id, get_flow_logger(__name__, flow_id, None)), None
+        except Exception as e:
+            return None, None, e
+
+    def _save_batch_state(self, run_id: str, run: _PreparedRun) -> Optional[str]:
+        """Writes the state of a prepared run; returns the error, if any."""
+        try:
+            self.state_repo.save_flow_run_state(run.flow_state['flow_id'], run_id, run.flow_state)
+            return None
+        except Exception as e:
+            logger.error(f"❌ Error saving initial state of {run.flow_state['flow_id']}/{run_id}: {str(e)}")
+            return str(e)
+
     def _handle_new_flow(self, account: str, flow_id: str, message_json: Dict[str, Any], log: logging.LoggerAdapter) -> Dict[str, Any]:
         """Handles the start of a new flow."""
         log.info("🚀 NEW FLOW START - Reading definition")
@@ -103,6 +241,48 @@ class DynamicFlowService(FlowExecutorInterface):
         
         return self._execute_engine(flow_config, flow_id, account, run_id, None, message_json, log)
 
+    def execute_subflow(self, message_json: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Starts the child run of a parent's sub-flow step.
+
+        The run id comes from the parent, so a redelivered start message finds the
+        run already created. The definition is read through the cached flow
+        repository and the child state is written once, after the engine runs.
+        """
+        flow_id = message_json.get('flow_id')
+        account = message_json.get('account')
+        run_id = message_json.get('subflow_run_id')
+        parent = message_json.get(PARENT_RUN_KEY) or {}
+        log = get_flow_logger(__name__, flow_id, run_id)
+        
+        try:
+            log.info(f"🔗 SUB-FLOW START - Parent: {parent.get('flow_id')}/{parent.get('run_id')} step {parent.get('task_id')}")
+            if not flow_id or not run_id or not parent:
+                raise FlowConfigurationError("Sub-flow start requires flow_id, subflow_run_id and parent_run", flow_id, run_id)
+            if parent.get('depth', 1) > config.SUBFLOW_MAX_DEPTH:
+                raise FlowConfigurationError(f"Sub-flow nesting exceeds SUBFLOW_MAX_DEPTH ({config.SUBFLOW_MAX_DEPTH})", flow_id, run_id)
+            if self.state_repo.get_flow_run_state(flow_id, run_id):
+                log.info("♻️ DUPLICATE SUB-FLOW START - Child run already exists")
+                return {"status": "duplicate", "flow_id": flow_id, "run_id": run_id}
+            
+            flow_config = self.flow_repo.get_flow_definition(account, flow_id)
+            if not flow_config:
+                raise FlowDefinitionNotFoundError(f"Sub-flow definition not found for {account}/{flow_id}", flow_id, run_id)
+            response = self._execute_engine(flow_config, flow_id, account, run_id, None, message_json, log)
+            if response.get('status') == 'error':
+                raise FlowExecutionError(f"Sub-flow engine failed to start {flow_id}", flow_id, run_id)
+            return response
+        
+        except Exception as e:
+            log.error(f"Error starting sub-flow: {str(e)}")
+            if parent:
+                # The parent's sub-flow step fails with its child run
+                self.dispatcher.notify_parent({
+                    "flow_id": flow_id, "run_id": run_id, "status": "error",
+                    "error": str(e), PARENT_RUN_KEY: parent
+                }, log)
+            return {"status": "error", "error": str(e)}
+
     def _handle_continuation(self, flow_id: str, run_id: str, task_id: str, message_json: Dict[str, Any], log: logging.LoggerAdapter) -> Dict[str, Any]:
         """Handles the continuation of an existing flow."""
         log.info("🔄 FLOW CONTINUATION - Reading state")
@@ -131,6 +311,26 @@ class DynamicFlowService(FlowExecutorInterface):
         log: logging.LoggerAdapter
     ) -> Dict[str, Any]:
         """Executes the N8N engine logic."""
+        prepared = self._prepare_run(flow_config, flow_id, account, run_id, task_id, message_json, log, self.publisher)
+        if prepared.flow_state is not None:
+            self.state_repo.save_flow_run_state(flow_id, run_id, prepared.flow_state)
+            self._index_running(prepared.running_markers, log)
+            self.dispatcher.dispatch(flow_id, run_id, prepared.flow_state, prepared.dispatch_steps, log)
+        return prepared.response
+
+    def _prepare_run(
+        self,
+        flow_config: Dict[str, Any],
+        flow_id: str,
+        account: str,
+        run_id: str,
+        task_id: Optional[str],
+        message_json: Dict[str, Any],
+        log: logging.LoggerAdapter,
+        publisher: PublisherInterface,
+        durations: Optional[Dict[str, float]] = None
+    ) -> "_PreparedRun":
+        """Runs the engine against the given publisher and builds the run state, without persisting it."""
         
         steps = normalize_steps(flow_config)
         flow_config['steps'] = steps
@@ -146,38 +346,111 @@ class DynamicFlowService(FlowExecutorInterface):
             **message_json.get('context', {})
         }
         
-        if is_advanced_flow(steps):
-            log.info("🚀 Advanced flow detected - using N8N-like engine")
-            # Inject our publisher into the engine
-            engine = N8NLikeEngine(config.PROJECT_ID, self.publisher)
-            result = engine.execute_flow(flow_config, initial_context)
-            
-            # Save updated state
-            flow_state = {
-                "flow_id": flow_id,
-                "run_id": run_id,
-                "account": account,
-                "status": result.get("status", "success"),
-                "flow_config": flow_config,
-                "executed_steps": result.get('executed_steps', []),
-                "total_steps": len(result.get('executed_steps', [])),
-                "engine_type": "n8n_like",
-                "started_at": datetime.now(timezone.utc).isoformat(),
-                "completed_at": datetime.now(timezone.utc).isoformat()
-            }
-            
-            self.state_repo.save_flow_run_state(flow_id, run_id, flow_state)
-            
-            return {
-                "status": result.get("status", "success"),
-                "flow_id": flow_id,
-                "account": account,
-                "task_id": task_id,
-                "run_id": run_id,
-                "executed_steps": result.get('executed_steps', []),
-                "total_steps": len(result.get('executed_steps', [])),
-                "engine_type": "n8n_like"
-            }
-        else:
+        # Dispatch priority: remaining critical path of each step, from past run durations
+        if durations is None:
+            durations = self._historical_durations(account, flow_id, log)
+        critical_path = compute_critical_path(steps, durations)
+        
+        if not is_advanced_flow(steps):
             log.info("📋 Basic flow detected - using simple engine (placeholder)")
-            return {"status": "success"}
+            return _PreparedRun(None, {"status": "success"}, [], [])
+        
+        log.info("🚀 Advanced flow detected - using N8N-like engine")
+        queued_steps = sort_by_priority(self._queue_initial_steps(steps), critical_path)
+        # Inject our publisher into the engine
+        engine = N8NLikeEngine(config.PROJECT_ID, publisher)
+        result = engine.execute_flow(flow_config, initial_context)
+        running_markers = self._assign_deadlines(flow_id, run_id, steps)
+        
+        # The engine leaves map and sub-flow steps alone: initial ones go through the
+        # dispatcher (map children within the map's parallelism)
+        run_state = {"run_id": run_id, "account": account, "flow_config": flow_config, CRITICAL_PATH_KEY: critical_path}
+        controller_steps = sort_by_priority(get_dispatchable_steps(run_state), critical_path)
+        if controller_steps:
+            log.info(f"🗺️ Dispatching map/sub-flow steps: {[s['id'] for s in controller_steps]}")
+            self.dispatcher.claim(run_state, controller_steps)
+        steps = flow_config['steps']
+        
+        # Callback routing is resolved once per run; ambiguous steps are reported now, not at callback time
+        routing_index, routing_ambiguities = build_routing_index(steps)
+        if routing_ambiguities:
+            log.warning(f"⚠️ ROUTING AMBIGUITIES - Steps not distinguishable by config: {routing_ambiguities}")
+        
+        flow_state = {
+            "flow_id": flow_id,
+            "run_id": run_id,
+            "account": account,
+            "status": result.get("status", "success"),
+            "flow_config": flow_config,
+            "executed_steps": result.get('executed_steps', []),
+            "total_steps": len(result.get('executed_steps', [])),
+            "engine_type": "n8n_like",
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "completed_at": datetime.now(timezone.utc).isoformat(),
+            RUN_GRAPH_KEY: compile_run_graph(steps),
+            ROUTING_INDEX_KEY: routing_index,
+            CRITICAL_PATH_KEY: critical_path
+        }
+        if routing_ambiguities:
+            flow_state["routing_ambiguities"] = routing_ambiguities
+        if message_json.get('context'):
+            # Scope of the expressions of steps dispatched on callbacks
+            flow_state["context"] = message_json['context']
+        if message_json.get(PARENT_RUN_KEY):
+            flow_state[PARENT_RUN_KEY] = message_json[PARENT_RUN_KEY]
+        
+        response = {
+            "status": result.get("status", "success"),
+            "flow_id": flow_id,
+            "account": account,
+            "task_id": task_id,
+            "run_id": run_id,
+            "executed_steps": result.get('executed_steps', []),
+            "total_steps": len(result.get('executed_steps', [])),
+            "engine_type": "n8n_like"
+        }
+        if routing_ambiguities:
+            response["routing_ambiguities"] = routing_ambiguities
+        return _PreparedRun(flow_state, response, running_markers, queued_steps + controller_steps)
+
+    def _index_running(self, markers: List[tuple], log: logging.LoggerAdapter) -> None:
+        if self.running_index and markers:
+            try:
+                self.running_index.add(markers)
+            except Exception as e:
+                log.error(f"❌ Error indexing running steps: {str(e)}")
+
+    def _historical_durations(self, account: str, flow_id: str, log: logging.LoggerAdapter) -> Dict[str, float]:
+        """Expected step durations from previous runs (empty without history)."""
+        if not self.step_history:
+            return {}
+        try:
+            return self.step_history.get_durations(account, flow_id)
+        except Exception as e:
+            log.warning(f"⚠️ Step history unavailable, using default durations: {str(e)}")
+            return {}
+
+    def _queue_initial_steps(self, steps: list) -> list:
+        """Under admission control, marks the initial steps 'queued' so the engine leaves them to the dispatcher."""
+        if not self.dispatcher.admission_enabled:
+            return []
+        initial = [
+            s for s in steps
+            if not s.get('depends_on') and s.get('status', 'pending') == 'pending'
+            and not is_map_step(s) and not is_subflow_step(s)
+        ]
+        if initial:
+            # The run graph is compiled from the step statuses once the engine returns
+            self.dispatcher.claim({"flow_config": {"steps": steps}}, initial)
+        return initial
+
+    def _assign_deadlines(self, flow_id: str, run_id: str, steps: list) -> list:
+        """Sets the timeout deadline of the steps the engine dispatched and returns their index entries."""
+        markers = []
+        for step in steps:
+            if step.get('status') != 'running' or not step.get('started_at') or is_map_step(step):
+                continue
+            started_at = datetime.fromisoformat(step['started_at'].replace('Z', '+00:00'))
+            step[TIMEOUT_DEADLINE_KEY] = compute_deadline(step, started_at)
+            markers.append((flow_id, run_id, step['id'], step[TIMEOUT_DEADLINE_KEY]))
+        return markers
@@ -0,0 +1,79 @@
+"""
+Result memoization for steps that opt in with a cache_key policy.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from core.interfaces import ResultCacheInterface
+from core.utils import metrics
+from flows.graph import find_step, get_run_graph, record_transition
+from flows.memoization import CACHE_FINGERPRINT_KEY, cache_policy, compute_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class ResultMemoizer:
+    """
+    Skips ready steps whose inputs have not changed since their last successful run.
+
+    Only steps with dependencies are memoized: their key covers the outputs of
+    those dependencies, so an unchanged upstream means an unchanged result.
+    """
+
+    def __init__(self, result_cache: ResultCacheInterface):
+        self.result_cache = result_cache
+
+    def apply_cached(self, flow_state: Dict[str, Any], steps: List[Dict[str, Any]], log: logging.LoggerAdapter) -> List[str]:
+        """
+        Completes the ready steps whose key matches their last successful run and
+        returns their ids. Misses keep their key, so their result can be stored
+        when they complete.
+        """
+        graph = get_run_graph(flow_state)
+        account, flow_id = flow_state.get('account'), flow_state.get('flow_id')
+        cached = []
+        for step in steps:
+            dependencies = step.get('depends_on') or []
+            if cache_policy(step) is None or not dependencies:
+                continue
+            dependency_results = {
+                dependency: (find_step(flow_state, graph, dependency) or {}).get('result')
+                for dependency in dependencies
+            }
+            cache_key = compute_cache_key(step, dependency_results)
+            step[CACHE_FINGERPRINT_KEY] = cache_key
+            try:
+                entry = self.result_cache.get(account, flow_id, step['id'])
+            except Exception as e:
+                log.warning(f"⚠️ Result cache unavailable for {step['id']}: {str(e)}")
+                entry = None
+            if not entry or entry.get('cache_key') != cache_key:
+                metrics.increment('memoization.misses')
+                continue
+
+            previous_status = step.get('status', 'pending')
+            step['status'] = 'completed'
+            step['cached'] = True
+            step['result'] = entry.get('result')
+            step['cached_from_run'] = entry.get('run_id')
+            step['completed_at'] = datetime.now(timezone.utc).isoformat()
+            record_transition(graph, step['id'], previous_status, 'completed')
+            metrics.increment('memoization.hits')
+            log.info(f"💾 CACHED RESULT - {step['id']} inputs unchanged since run {entry.get('run_id')}")
+            cached.append(step['id'])
+        return cached
+
+    def remember(self, flow_state: Dict[str, Any], step: Optional[Dict[str, Any]], log: logging.LoggerAdapter) -> None:
+        """Stores the result of a memoizable step that just completed (best effort)."""
+        if step is None or step.get('status') != 'completed' or step.get('cached') or not step.get(CACHE_FINGERPRINT_KEY):
+            return
+        try:
+            self.result_cache.put(flow_state.get('account'), flow_state.get('flow_id'), step['id'], {
+                "cache_key": step[CACHE_FINGERPRINT_KEY],
+                "result": step.get('result'),
+                "run_id": flow_state.get('run_id'),
+                "completed_at": step.get('completed_at')
+            })
+        except Exception as e:
+            log.error(f"❌ Error storing cached result of {step['id']}: {str(e)}")
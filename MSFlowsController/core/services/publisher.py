@@ -1,21 +1,45 @@
 """
 Publisher service implementation using Google Cloud Pub/Sub.
 """
-import json
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from google.cloud import pubsub_v1
 from core.interfaces import PublisherInterface
 from core.config import config
+from core.utils.codecs import CONTENT_TYPE_ATTRIBUTE, Codec, get_codec
 
 logger = logging.getLogger(__name__)
 
 class PubSubPublisher(PublisherInterface):
     """Google Cloud Pub/Sub implementation of PublisherInterface."""
     
-    def __init__(self, project_id: str = None):
+    def __init__(
+        self,
+        project_id: str = None,
+        batch_settings: Optional[pubsub_v1.types.BatchSettings] = None,
+        codec: Optional[Codec] = None
+    ):
         self.project_id = project_id or config.PROJECT_ID
-        self.publisher = pubsub_v1.PublisherClient()
+        # Messages carry their codec's content type as the 'content_type' attribute
+        self.codec = codec or get_codec(config.PUBSUB_MESSAGE_CODEC)
+        self.batch_settings = batch_settings or pubsub_v1.types.BatchSettings(
+            max_messages=config.PUBSUB_BATCH_MAX_MESSAGES,
+            max_bytes=config.PUBSUB_BATCH_MAX_BYTES,
+            max_latency=config.PUBSUB_BATCH_MAX_LATENCY_SECONDS
+        )
+        self.publisher = pubsub_v1.PublisherClient(batch_settings=self.batch_settings)
+    
+    def _topic_path(self, topic: str) -> str:
+        """Constructs the full topic path if it's just a topic name."""
+        if '/' not in topic:
+            return self.publisher.topic_path(self.project_id, topic)
+        return topic
+    
+    def _send(self, topic_path: str, message: Dict[str, Any]):
+        """Encodes a message with the configured codec and hands it to the client."""
+        return self.publisher.publish(
+            topic_path, self.codec.encode(message), **{CONTENT_TYPE_ATTRIBUTE: self.codec.content_type}
+        )
         
     def publish(self, topic: str, message: Dict[str, Any]) -> str:
         """
@@ -29,14 +53,9 @@ class PubSubPublisher(PublisherInterface):
             str: The message ID of the published message.
         """
         try:
-            # Construct full topic path if it's just a topic name
-            if '/' not in topic:
-                topic_path = self.publisher.topic_path(self.project_id, topic)
-            else:
-                topic_path = topic
+            topic_path = self._topic_path(topic)
                 
-            message_bytes = json.dumps(message).encode('utf-8')
-            future = self.publisher.publish(topic_path, message_bytes)
+            future = self._send(topic_path, message)
             message_id = future.result()
             
             logger.info(f"📤 MESSAGE PUBLISHED - Topic: {topic}, Message ID: {message_id}")
@@ -45,3 +64,43 @@ class PubSubPublisher(PublisherInterface):
         except Exception as e:
             logger.error(f"❌ ERROR PUBLISHING MESSAGE - Topic: {topic}, Error: {str(e)}")
             raise
+    
+    def publish_batch(self, messages: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Publishes several messages without waiting between them.
+        
+        All messages are handed to the client first, so the client batches them
+        according to its batch settings, and the futures are awaited afterwards.
+        
+        Args:
+            messages: List of (topic, message) pairs.
+            
+        Returns:
+            list: One {"topic", "message_id", "error"} result per message, in order.
+        """
+        pending = []
+        for topic, message in messages:
+            try:
+                pending.append((topic, self._send(self._topic_path(topic), message), None))
+            except Exception as e:
+                pending.append((topic, None, e))
+        
+        results = []
+        for topic, future, error in pending:
+            message_id = None
+            if future is not None:
+                try:
+                    message_id = future.result(timeout=config.PUBSUB_PUBLISH_TIMEOUT_SECONDS)
+                except Exception as e:
+                    error = e
+            if error is not None:
+                logger.error(f"❌ ERROR PUBLISHING MESSAGE - Topic: {topic}, Error: {str(error)}")
+            results.append({
+                "topic": topic,
+                "message_id": message_id,
+                "error": str(error) if error is not None else None
+            })
+        
+        failed = sum(1 for r in results if r["error"])
+        logger.info(f"📤 BATCH PUBLISHED - {len(results) - failed}/{len(results)} messages")
+        return results
@@ -0,0 +1,369 @@
+"""
+Dispatch of ready steps: claim, admission control, timeout index and publishing.
+"""
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.config import config
+from core.exceptions import StateConflictError
+from core.interfaces import FlowRunStateRepositoryInterface, PublisherInterface, RunningStepIndexInterface
+from core.services.admission import AdmissionController, admission_key
+from flows.critical_path import get_critical_path
+from flows.expressions import render_step_config
+from flows.graph import find_step, get_run_graph, record_transition
+from flows.subflows import CHILD_RUN_KEY, build_parent_callback, build_subflow_start, child_run_id, is_subflow_step
+from flows.timeouts import TIMEOUT_DEADLINE_KEY, compute_deadline
+
+logger = logging.getLogger(__name__)
+
+# Upper bound (seconds) of the randomized wait between state conflict retries
+STATE_CONFLICT_BACKOFF_SECONDS = 0.05
+
+# Topic the controller listens on: step callbacks and sub-flow starts
+CALLBACK_TOPIC = 'ms-flows-controller'
+
+
+class StepDispatcher:
+    """
+    Starts ready steps.
+
+    Without admission control, claimed steps are marked 'running' and published
+    right away. With it, they are marked 'queued', handed to the admission
+    controller and only started (queued -> running, then published) once
+    admitted; finished steps release their slot, which may admit queued steps of
+    any run. Sub-flow steps never hold a slot (the steps of their child run do):
+    they start a child run through the controller's own topic.
+    """
+
+    def __init__(
+        self,
+        state_repo: FlowRunStateRepositoryInterface,
+        publisher: PublisherInterface,
+        running_index: Optional[RunningStepIndexInterface] = None,
+        admission: Optional[AdmissionController] = None
+    ):
+        self.state_repo = state_repo
+        self.publisher = publisher
+        self.running_index = running_index
+        self.admission = admission
+        self.max_state_attempts = config.STATE_SAVE_MAX_ATTEMPTS
+
+    @property
+    def admission_enabled(self) -> bool:
+        return self.admission is not None and self.admission.enabled
+
+    def claim(self, flow_state: Dict[str, Any], steps: List[Dict[str, Any]]) -> None:
+        """
+        Claims ready steps in memory: 'running', or 'queued' under admission control.
+        The caller persists the state before calling dispatch, so a conflicting
+        writer never causes a double dispatch.
+        """
+        graph = get_run_graph(flow_state)
+        now = datetime.now(timezone.utc)
+        for step in steps:
+            if is_subflow_step(step):
+                step[CHILD_RUN_KEY] = child_run_id(flow_state.get('run_id'), step)
+            if self.admission_enabled and not is_subflow_step(step):
+                previous_status = step.get('status', 'pending')
+                step['status'] = 'queued'
+                step['queued_at'] = now.isoformat()
+                record_transition(graph, step['id'], previous_status, 'queued')
+            else:
+                self._mark_running(graph, step, now)
+
+    def dispatch(self, flow_id: str, run_id: str, flow_state: Dict[str, Any], steps: List[Dict[str, Any]], log: logging.LoggerAdapter) -> None:
+        """Starts steps whose claim has been persisted."""
+        if not steps:
+            return
+        if self.admission_enabled:
+            queued = [step for step in steps if not is_subflow_step(step)]
+            steps = [step for step in steps if is_subflow_step(step)]
+            if queued:
+                entries = [self._admission_entry(flow_id, run_id, flow_state, step) for step in queued]
+                log.info(f"🚦 QUEUED FOR ADMISSION - {[s['id'] for s in queued]}")
+                admitted = self._update_ledger(lambda: self.admission.enqueue(entries), "queueing steps", log)
+                if admitted is None:
+                    # The claim is persisted as 'queued': the timeout sweep queues them again
+                    retry_at = int(time.time()) + 1
+                    self.index_running([(flow_id, run_id, step['id'], retry_at) for step in queued], log)
+                self._start_admitted(admitted or [], log)
+            if not steps:
+                return
+
+        self.index_running([self.running_marker(flow_id, run_id, step) for step in steps], log)
+        errors = self._publish(flow_id, run_id, flow_state, steps, log)
+        if errors:
+            self.mark_dispatch_failures(flow_id, run_id, errors, log)
+
+    def release(self, flow_id: str, run_id: str, flow_state: Dict[str, Any], step_ids: List[str], log: logging.LoggerAdapter) -> None:
+        """Frees the admission slots of finished steps and starts whatever gets admitted."""
+        step_ids = [s for s in step_ids if s]
+        if not self.admission_enabled or not step_ids:
+            return
+        graph = get_run_graph(flow_state)
+        entries = [self._slot_entry(flow_id, run_id, flow_state, find_step(flow_state, graph, s) or {'id': s}) for s in step_ids]
+        self._start_admitted(self._update_ledger(lambda: self.admission.release(entries), "releasing slots", log) or [], log)
+
+    def cancel_run(self, flow_id: str, run_id: str, flow_state: Dict[str, Any], log: logging.LoggerAdapter) -> None:
+        """Drops a finished run from admission control and starts whatever gets admitted."""
+        if not self.admission_enabled:
+            return
+        entries = [
+            self._slot_entry(flow_id, run_id, flow_state, step)
+            for step in flow_state.get('flow_config', {}).get('steps', []) if not is_subflow_step(step)
+        ]
+        self._start_admitted(self._update_ledger(lambda: self.admission.cancel_run(flow_id, run_id, entries), "cancelling the run", log) or [], log)
+
+    def reconcile_admission(self, log: logging.LoggerAdapter) -> List[str]:
+        """
+        Releases ledger entries whose step no longer needs a slot.
+        
+        Ledger updates that fail after the run state was saved leave finished steps
+        holding slots (and steps of finished runs queued); entries queued for longer
+        than ADMISSION_RECONCILE_SECONDS are checked against their run state.
+        Returns the keys of the released entries.
+        """
+        if not self.admission_enabled:
+            return []
+        cutoff = datetime.now(timezone.utc).timestamp() - config.ADMISSION_RECONCILE_SECONDS
+        by_run: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for entry in self.admission.entries():
+            queued_at = entry.get('queued_at')
+            if queued_at and datetime.fromisoformat(queued_at).timestamp() > cutoff:
+                continue
+            by_run.setdefault((entry['flow_id'], entry['run_id']), []).append(entry)
+        
+        stale = []
+        for (flow_id, run_id), entries in by_run.items():
+            flow_state = self.state_repo.get_flow_run_state(flow_id, run_id)
+            if flow_state and flow_state.get('status') == 'running':
+                graph = get_run_graph(flow_state)
+                entries = [
+                    entry for entry in entries
+                    if (find_step(flow_state, graph, entry['step_id']) or {}).get('status') not in ('running', 'queued')
+                ]
+            stale.extend(entries)
+        if not stale:
+            return []
+        
+        keys = [admission_key(e['flow_id'], e['run_id'], e['step_id']) for e in stale]
+        log.warning(f"🚦 RECONCILING ADMISSION - Releasing {keys}")
+        self._start_admitted(self._update_ledger(lambda: self.admission.release(stale), "reconciling slots", log) or [], log)
+        return keys
+
+    def _update_ledger(self, operation: Callable[[], List[Dict[str, Any]]], action: str, log: logging.LoggerAdapter) -> Optional[List[Dict[str, Any]]]:
+        """
+        Runs an admission ledger update whose run state is already persisted.
+        
+        A failure must not reach the caller's state retry loop (the retried callback
+        would be a duplicate and skip the update): it is logged, the ledger entries
+        are left for reconcile_admission and None is returned.
+        """
+        try:
+            return operation()
+        except Exception as e:
+            log.error(f"❌ Error {action} in the admission ledger (left for the timeout sweep): {str(e)}")
+            return None
+
+    def notify_parent(self, flow_state: Dict[str, Any], log: logging.LoggerAdapter) -> None:
+        """Publishes the outcome of a finished child run as the callback of its parent's sub-flow step."""
+        callback = build_parent_callback(flow_state)
+        if callback is None:
+            return
+        try:
+            self.publisher.publish(CALLBACK_TOPIC, callback)
+            log.info(f"🔗 PARENT RUN NOTIFIED - {callback['flow_id']}/{callback['run_id']} step {callback['task_id']}: {callback['status']}")
+        except Exception as e:
+            log.error(f"❌ Error notifying parent run: {str(e)}")
+
+    def running_marker(self, flow_id: str, run_id: str, step: Optional[Dict[str, Any]]) -> Optional[tuple]:
+        """Timeout index entry of a running step (None if it is not running or has no deadline)."""
+        if step is None or step.get('status') != 'running' or step.get(TIMEOUT_DEADLINE_KEY) is None:
+            return None
+        return (flow_id, run_id, step['id'], step[TIMEOUT_DEADLINE_KEY])
+
+    def index_running(self, markers: List[Optional[tuple]], log: logging.LoggerAdapter) -> None:
+        """Adds running steps to the timeout index."""
+        markers = [m for m in markers if m]
+        if not self.running_index or not markers:
+            return
+        try:
+            self.running_index.add(markers)
+        except Exception as e:
+            log.error(f"❌ Error indexing running steps: {str(e)}")
+
+    def unindex_running(self, markers: List[Optional[tuple]], log: logging.LoggerAdapter) -> None:
+        """Removes finished steps from the timeout index."""
+        markers = [m for m in markers if m]
+        if not self.running_index or not markers:
+            return
+        try:
+            self.running_index.remove(markers)
+        except Exception as e:
+            log.error(f"❌ Error removing running-step markers: {str(e)}")
+
+    def get_topic(self, step: Dict[str, Any]) -> str:
+        """Determines the Pub/Sub topic: an explicit 'topic' in the step config wins over the step type."""
+        topic = self._topic(step)
+        logger.info(f"📋 Using topic '{topic}' for type '{step.get('type')}'")
+        return topic
+
+    def _topic(self, step: Dict[str, Any]) -> str:
+        if is_subflow_step(step):
+            return CALLBACK_TOPIC
+        return (step.get('config') or {}).get('topic') or step.get('type')
+
+    def build_step_message(self, flow_id: str, run_id: str, flow_state: Dict[str, Any], step: Dict[str, Any]) -> Dict[str, Any]:
+        """Message sent to the step's Cloud Function (or to the controller, for a sub-flow)."""
+        step_config = render_step_config(flow_state, step)
+        if is_subflow_step(step):
+            return build_subflow_start(flow_id, run_id, flow_state, {**step, 'config': step_config})
+        return {
+            **step_config,
+            'flow_id': flow_id,
+            'run_id': run_id,
+            'task_id': step['id'],
+            'step_name': step.get('name', step['id']),
+            'step_type': step['type'],
+            'account': flow_state.get('account'),
+            'callback_topic': CALLBACK_TOPIC,
+            'callback_required': True
+        }
+
+    def _mark_running(self, graph: Dict[str, Any], step: Dict[str, Any], now: datetime) -> None:
+        previous_status = step.get('status', 'pending')
+        step['status'] = 'running'
+        step['started_at'] = now.isoformat()
+        step[TIMEOUT_DEADLINE_KEY] = compute_deadline(step, now)
+        record_transition(graph, step['id'], previous_status, 'running')
+
+    def _slot_entry(self, flow_id: str, run_id: str, flow_state: Dict[str, Any], step: Dict[str, Any]) -> Dict[str, Any]:
+        """Admission entry identifying the ledger slots of a step (without its priority)."""
+        return {
+            "flow_id": flow_id,
+            "run_id": run_id,
+            "step_id": step['id'],
+            "account": flow_state.get('account'),
+            "topic": self._topic(step)
+        }
+
+    def _admission_entry(self, flow_id: str, run_id: str, flow_state: Dict[str, Any], step: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "flow_id": flow_id,
+            "run_id": run_id,
+            "step_id": step['id'],
+            "account": flow_state.get('account'),
+            "topic": self.get_topic(step),
+            "priority": get_critical_path(flow_state).get(step['id'], 0.0),
+            "queued_at": step.get('queued_at')
+        }
+
+    def _publish(self, flow_id: str, run_id: str, flow_state: Dict[str, Any], steps: List[Dict[str, Any]], log: logging.LoggerAdapter) -> Dict[str, str]:
+        """Publishes the steps in one batch and returns {step_id: error} for the failed ones."""
+        outgoing = []
+        for step in steps:
+            log.info(f"📤 DISPATCHING STEP - {step['id']} ({step['type']})")
+            outgoing.append((self.get_topic(step), self.build_step_message(flow_id, run_id, flow_state, step)))
+
+        # One batch for the whole fan-out: the client groups the messages and
+        # all futures are awaited together instead of one round trip per step.
+        try:
+            results = self.publisher.publish_batch(outgoing)
+        except Exception as batch_error:
+            results = [{"topic": topic, "message_id": None, "error": str(batch_error)} for topic, _ in outgoing]
+
+        errors = {}
+        for step, published in zip(steps, results):
+            if published.get('error'):
+                log.error(f"❌ ERROR DISPATCHING STEP - {step['id']}: {published['error']}")
+                errors[step['id']] = published['error']
+            else:
+                log.info(f"✅ STEP DISPATCHED - {step['id']} Message ID: {published.get('message_id')}")
+        return errors
+
+    def _start_admitted(self, entries: List[Dict[str, Any]], log: logging.LoggerAdapter) -> None:
+        """Starts admitted steps; slots of steps that cannot start are released, possibly admitting others."""
+        while entries:
+            by_run: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+            for entry in entries:
+                by_run.setdefault((entry['flow_id'], entry['run_id']), []).append(entry)
+
+            freed = []
+            for (flow_id, run_id), run_entries in by_run.items():
+                step_ids = [entry['step_id'] for entry in run_entries]
+                try:
+                    flow_state, started = self._claim_admitted(flow_id, run_id, step_ids, log)
+                except Exception as e:
+                    log.error(f"❌ Error starting admitted steps of {flow_id}/{run_id}: {str(e)}")
+                    freed.extend(run_entries)
+                    continue
+                started_ids = {step['id'] for step in started}
+                freed.extend(entry for entry in run_entries if entry['step_id'] not in started_ids)
+                if not started:
+                    continue
+                self.index_running([self.running_marker(flow_id, run_id, step) for step in started], log)
+                errors = self._publish(flow_id, run_id, flow_state, started, log)
+                if errors:
+                    self.mark_dispatch_failures(flow_id, run_id, errors, log)
+                    freed.extend(entry for entry in run_entries if entry['step_id'] in errors)
+
+            entries = (self._update_ledger(lambda: self.admission.release(freed), "releasing slots", log) or []) if freed else []
+
+    def _claim_admitted(self, flow_id: str, run_id: str, step_ids: List[str], log: logging.LoggerAdapter) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Moves admitted steps of a run from 'queued' to 'running' (compare-and-swap)."""
+        for attempt in range(1, self.max_state_attempts + 1):
+            flow_state = self.state_repo.get_flow_run_state(flow_id, run_id)
+            if not flow_state or flow_state.get('status') in ('error', 'completed'):
+                return flow_state, []
+            graph = get_run_graph(flow_state)
+            now = datetime.now(timezone.utc)
+            started = []
+            for step_id in step_ids:
+                step = find_step(flow_state, graph, step_id)
+                if step is None or step.get('status') != 'queued':
+                    continue
+                step['admitted_at'] = now.isoformat()
+                self._mark_running(graph, step, now)
+                started.append(step)
+            if not started:
+                return flow_state, []
+            try:
+                self.state_repo.save_flow_run_state(flow_id, run_id, flow_state)
+                return flow_state, started
+            except StateConflictError:
+                if attempt == self.max_state_attempts:
+                    raise
+                log.warning(f"⚔️ STATE CONFLICT - Retrying admitted step claim ({attempt}/{self.max_state_attempts})")
+                time.sleep(random.uniform(0, STATE_CONFLICT_BACKOFF_SECONDS * attempt))
+        return None, []
+
+    def mark_dispatch_failures(self, flow_id: str, run_id: str, errors: Dict[str, str], log: logging.LoggerAdapter) -> None:
+        """Marks claimed steps whose message could not be published as failed."""
+        for attempt in range(1, self.max_state_attempts + 1):
+            flow_state = self.state_repo.get_flow_run_state(flow_id, run_id)
+            if not flow_state:
+                return
+            graph = get_run_graph(flow_state)
+            markers = []
+            for step_id, error in errors.items():
+                step = find_step(flow_state, graph, step_id)
+                if step is None or step.get('status') != 'running':
+                    continue
+                markers.append(self.running_marker(flow_id, run_id, step))
+                step['status'] = 'failed'
+                step['error'] = error
+                record_transition(graph, step_id, 'running', 'failed')
+            counts = graph.get('counts', {})
+            flow_state['failed_steps_count'] = counts.get('failed', 0) + counts.get('timeout', 0)
+            try:
+                self.state_repo.save_flow_run_state(flow_id, run_id, flow_state)
+                self.unindex_running(markers, log)
+                return
+            except StateConflictError:
+                if attempt == self.max_state_attempts:
+                    raise
+                log.warning(f"⚔️ STATE CONFLICT - Retrying dispatch failure update ({attempt}/{self.max_state_attempts})")
+                time.sleep(random.uniform(0, STATE_CONFLICT_BACKOFF_SECONDS * attempt))
@@ -0,0 +1,180 @@
+"""
+Codecs de serialización del estado de los runs y de los mensajes de Pub/Sub.
+
+Cada codec se elige por nombre (RUN_STATE_CODEC, PUBSUB_MESSAGE_CODEC) y tiene un
+content type que se guarda en el blob (``content_type``) o en el atributo
+``content_type`` del mensaje, de modo que los lectores detectan el formato:
+
+    json           application/json          JSON compacto (por defecto)
+    json+gzip      application/json+gzip     JSON compacto con gzip (biblioteca estándar)
+    json+zstd      application/json+zstd     requiere 'zstandard'
+    msgpack        application/msgpack       requiere 'msgpack'
+    msgpack+zstd   application/msgpack+zstd  requiere 'msgpack' y 'zstandard'
+
+Los datos sin content type conocido (p. ej. estados escritos antes con
+``indent=2``, o mensajes sin atributos) se leen como JSON.
+"""
+import gzip
+import json
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import msgpack
+except ImportError:  # Dependencia opcional
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # Dependencia opcional
+    zstandard = None
+
+# Atributo de Pub/Sub con el content type del mensaje
+CONTENT_TYPE_ATTRIBUTE = 'content_type'
+
+JSON_CONTENT_TYPE = 'application/json'
+
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+
+
+class Codec:
+    """Serializa valores a bytes y los recupera."""
+
+    def __init__(
+        self,
+        name: str,
+        content_type: str,
+        dumps: Callable[[Any], bytes],
+        loads: Callable[[bytes], Any],
+        compress: Optional[Callable[[bytes], bytes]] = None,
+        decompress: Optional[Callable[[bytes], bytes]] = None
+    ):
+        self.name = name
+        self.content_type = content_type
+        self._dumps = dumps
+        self._loads = loads
+        self._compress = compress
+        self._decompress = decompress
+
+    def encode(self, value: Any) -> bytes:
+        data = self._dumps(value)
+        return self._compress(data) if self._compress else data
+
+    def decode(self, data: bytes) -> Any:
+        if self._decompress:
+            data = self._decompress(data)
+        return self._loads(data)
+
+    def __repr__(self):
+        return f"Codec({self.name})"
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def _json_loads(data: bytes) -> Any:
+    return json.loads(data)
+
+
+def _msgpack_dumps(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _msgpack_loads(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    # Los compresores de zstandard no se comparten entre hilos
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def _gzip_compress(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+# Codecs conocidos y dependencias opcionales que requiere cada uno
+_CODECS: Dict[str, Codec] = {
+    codec.name: codec for codec in (
+        Codec('json', JSON_CONTENT_TYPE, _json_dumps, _json_loads),
+        Codec('json+gzip', 'application/json+gzip', _json_dumps, _json_loads, _gzip_compress, gzip.decompress),
+        Codec('json+zstd', 'application/json+zstd', _json_dumps, _json_loads, _zstd_compress, _zstd_decompress),
+        Codec('msgpack', 'application/msgpack', _msgpack_dumps, _msgpack_loads),
+        Codec('msgpack+zstd', 'application/msgpack+zstd', _msgpack_dumps, _msgpack_loads, _zstd_compress, _zstd_decompress),
+    )
+}
+_REQUIREMENTS = {
+    'json+zstd': ('zstandard',),
+    'msgpack': ('msgpack',),
+    'msgpack+zstd': ('msgpack', 'zstandard'),
+}
+_BY_CONTENT_TYPE = {codec.content_type: codec for codec in _CODECS.values()}
+
+
+def codec_names() -> list:
+    """Nombres de todos los codecs conocidos."""
+    return list(_CODECS)
+
+
+def missing_requirements(name: str) -> list:
+    """Paquetes opcionales no instalados que necesita un codec."""
+    installed = {'msgpack': msgpack is not None, 'zstandard': zstandard is not None}
+    return [package for package in _REQUIREMENTS.get(name, ()) if not installed[package]]
+
+
+def get_codec(name: str) -> Codec:
+    """
+    Obtiene un codec por nombre.
+
+    Args:
+        name: Nombre del codec (ver codec_names)
+
+    Returns:
+        Codec: Codec solicitado
+
+    Raises:
+        ValueError: Si el codec no existe o falta alguna de sus dependencias
+    """
+    codec = _CODECS.get((name or 'json').strip().lower())
+    if codec is None:
+        raise ValueError(f"Unknown codec '{name}'; expected one of {codec_names()}")
+    missing = missing_requirements(codec.name)
+    if missing:
+        raise ValueError(f"Codec '{codec.name}' requires the packages {missing}")
+    return codec
+
+
+def codec_for_content_type(content_type: Optional[str]) -> Codec:
+    """
+    Codec con el que se escribieron unos datos, a partir de su content type.
+
+    Args:
+        content_type: Content type del blob o atributo del mensaje (puede incluir parámetros)
+
+    Returns:
+        Codec: Codec correspondiente; JSON si el content type no es de ningún codec
+    """
+    if content_type:
+        codec = _BY_CONTENT_TYPE.get(content_type.split(';', 1)[0].strip().lower())
+        if codec is not None:
+            return codec
+    return _CODECS['json']
+
+
+def decode(data: bytes, content_type: Optional[str]) -> Any:
+    """
+    Decodifica datos según su content type.
+
+    Args:
+        data: Bytes leídos
+        content_type: Content type con el que se escribieron
+
+    Returns:
+        Any: Valor decodificado
+    """
+    return codec_for_content_type(content_type).decode(data)
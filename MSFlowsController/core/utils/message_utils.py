@@ -4,6 +4,9 @@ Utilidades para manejo de mensajes.
 import json
 import base64
 import logging
+from typing import Optional
+
+from core.utils.codecs import CONTENT_TYPE_ATTRIBUTE, decode
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +15,7 @@ def decode_message_data(cloud_event) -> dict:
     """
     Decodifica los datos del mensaje desde el evento de Cloud Function.
     Maneja tanto mensajes simples como mensajes con estructura {'data': 'base64_content'}.
+    El formato se toma del atributo 'content_type' del mensaje (JSON si no viene).
     
     Args:
         cloud_event: Evento de Cloud Function
@@ -19,8 +23,9 @@ def decode_message_data(cloud_event) -> dict:
     Returns:
         dict: Datos del mensaje decodificados
     """
-    message_data = base64.b64decode(cloud_event.data['message']['data']).decode('utf-8')
-    message_json = json.loads(message_data)
+    message = cloud_event.data['message']
+    content_type = (message.get('attributes') or {}).get(CONTENT_TYPE_ATTRIBUTE)
+    message_json = decode(base64.b64decode(message['data']), content_type)
     
     # Si el mensaje tiene estructura {'data': 'base64_content'}, extraer el contenido real
     if 'data' in message_json and len(message_json) == 1:
@@ -32,6 +37,20 @@ def decode_message_data(cloud_event) -> dict:
     return message_json
 
 
+def get_message_id(cloud_event) -> Optional[str]:
+    """
+    Obtiene el ID del mensaje de Pub/Sub del evento, si viene informado.
+    
+    Args:
+        cloud_event: Evento de Cloud Function
+        
+    Returns:
+        str: ID del mensaje o None
+    """
+    message = (cloud_event.data or {}).get('message') or {}
+    return message.get('messageId') or message.get('message_id')
+
+
 def extract_flow_identifiers(message_json: dict) -> tuple:
     """
     Extrae los identificadores del flujo desde el mensaje.
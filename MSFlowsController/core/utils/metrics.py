@@ -0,0 +1,61 @@
+"""
+In-process counters and distributions for operational metrics.
+
+Metrics live for the lifetime of the function instance and every update is
+also logged, so they can be turned into log-based metrics in Cloud Monitoring.
+"""
+import logging
+import threading
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+_counters: Dict[str, int] = {}
+_observations: Dict[str, Dict[str, float]] = {}
+_lock = threading.Lock()
+
+
+def increment(name: str, value: int = 1) -> int:
+    """Increments a counter and returns its new value."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+        current = _counters[name]
+    logger.info(f"📊 METRIC {name}={current}")
+    return current
+
+
+def observe(name: str, value: float) -> Dict[str, float]:
+    """Records a sample of a distribution (count, sum, max) and returns its summary."""
+    with _lock:
+        summary = _observations.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["max"] = max(summary["max"], value)
+        current = dict(summary)
+    logger.info(f"📊 METRIC {name} value={value:.3f} count={current['count']} max={current['max']:.3f}")
+    return current
+
+
+def get_observation(name: str) -> Dict[str, float]:
+    """Returns the summary of a distribution (empty if never observed)."""
+    with _lock:
+        return dict(_observations.get(name, {}))
+
+
+def get_counter(name: str) -> int:
+    """Returns the current value of a counter (0 if never incremented)."""
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> Dict[str, Any]:
+    """Returns a copy of all counters and distribution summaries."""
+    with _lock:
+        return {**_counters, **{name: dict(summary) for name, summary in _observations.items()}}
+
+
+def reset() -> None:
+    """Clears all counters and distributions."""
+    with _lock:
+        _counters.clear()
+        _observations.clear()
@@ -0,0 +1,97 @@
+"""
+Conversión de runs clásicos (Celery, ``running/{run_id}.json``) al formato dinámico.
+
+Un run clásico se convierte una sola vez: al arrancar, con la definición que el
+FlowController ya tiene cargada, o, para runs arrancados antes, en el primer
+callback. El estado convertido se guarda en la ubicación dinámica
+(``flow-runs/...``) y, a partir de ahí, los callbacks lo leen directamente, sin
+volver a normalizar ni a leer la definición.
+
+Marcadores de la conversión:
+    - en el documento clásico, STATE_LOCATION_KEY indica dónde vive el estado
+      que usan los callbacks;
+    - en el estado convertido, CLASSIC_SOURCE_KEY indica el documento clásico
+      del que procede.
+"""
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_LOCATION_KEY = 'state_location'
+CLASSIC_SOURCE_KEY = 'classic_source'
+
+# Estados clásicos con otro nombre en el formato dinámico (flujo y tareas)
+_STATUS_MAP = {'executing': 'running'}
+
+
+def classic_state_path(run_id: str) -> str:
+    """Nombre del documento clásico de un run en el bucket de runs."""
+    return f"running/{run_id}.json"
+
+
+def dynamic_state_path(flow_id: str, run_id: str) -> str:
+    """Ubicación del estado dinámico de un run en el bucket de runs."""
+    return f"flow-runs/{flow_id}/{run_id}"
+
+
+def _status(value: Optional[str], default: Optional[str] = None) -> Optional[str]:
+    value = value or default
+    return _STATUS_MAP.get(value, value)
+
+
+def _find_step_definition(task_id: str, flow_definition: Dict[str, Any]) -> Dict[str, Any]:
+    """Definición de un paso en la definición del flujo ('tasks' como dict o lista, o 'steps')."""
+    tasks = flow_definition.get("tasks")
+    if isinstance(tasks, dict):
+        if isinstance(tasks.get(task_id), dict):
+            return tasks[task_id]
+    else:
+        for step in (tasks if isinstance(tasks, list) else flow_definition.get("steps", [])):
+            if step.get("id") == task_id:
+                return step
+
+    logger.warning(f"No se encontró definición para el paso {task_id}")
+    return {"id": task_id, "type": "unknown", "config": {}, "depends_on": []}
+
+
+def convert_classic_state(state: Dict[str, Any], flow_definition: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Convierte el estado de un run clásico al formato dinámico.
+
+    Args:
+        state: Documento de ``running/{run_id}.json``
+        flow_definition: Definición del flujo (vacía si no se encontró)
+
+    Returns:
+        dict: Estado en formato dinámico, con CLASSIC_SOURCE_KEY
+    """
+    flow_definition = flow_definition or {}
+    converted = {
+        "flow_id": state.get("flow_id"),
+        "run_id": state.get("run_id"),
+        "account": state.get("account"),
+        "status": _status(state.get("status")),
+        "flow_config": {
+            "steps": []
+        },
+        "started_at": state.get("created_at"),
+        "last_updated": state.get("last_updated"),
+        CLASSIC_SOURCE_KEY: classic_state_path(state.get("run_id")),
+    }
+
+    for task_id, task_info in (state.get("tasks") or {}).items():
+        step_definition = _find_step_definition(task_id, flow_definition)
+        converted["flow_config"]["steps"].append({
+            "id": task_id,
+            "name": task_id,
+            "type": step_definition.get("type", "unknown"),
+            "status": _status(task_info.get("status"), "pending"),
+            "started_at": task_info.get("start"),
+            "ended_at": task_info.get("end"),
+            "config": step_definition.get("config", {}),
+            "depends_on": step_definition.get("depends_on", [])
+        })
+
+    logger.info(f"Estado clásico convertido: {len(converted['flow_config']['steps'])} pasos")
+    return converted
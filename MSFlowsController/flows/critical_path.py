@@ -0,0 +1,96 @@
+"""
+Prioridad de pasos por camino crítico.
+
+Para cada paso se calcula la duración del camino más largo que queda desde su
+inicio hasta el final del flujo (su propia duración más la del sucesor más
+largo). Las duraciones salen del histórico por (account, flow_id, step_id) y,
+para los pasos sin histórico, de ``CRITICAL_PATH_DEFAULT_STEP_SECONDS``.
+
+El resultado se guarda en el estado del run (clave ``critical_path``) y se usa
+para despachar primero, entre los pasos listos, los de camino crítico más largo.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from core.config import config
+
+logger = logging.getLogger(__name__)
+
+CRITICAL_PATH_KEY = 'critical_path'
+
+
+def compute_critical_path(steps: list, durations: Optional[Dict[str, float]] = None, default_seconds: Optional[float] = None) -> Dict[str, float]:
+    """
+    Calcula la longitud del camino crítico restante de cada paso.
+
+    Args:
+        steps: Lista de pasos normalizados
+        durations: Duración esperada (segundos) por id de paso
+        default_seconds: Duración de los pasos sin histórico
+
+    Returns:
+        dict: Id de paso -> segundos del camino más largo que empieza en él
+    """
+    durations = durations or {}
+    default_seconds = config.CRITICAL_PATH_DEFAULT_STEP_SECONDS if default_seconds is None else default_seconds
+    ids = [step.get('id') for step in steps if step.get('id')]
+    known = set(ids)
+    dependents: Dict[str, List[str]] = {step_id: [] for step_id in ids}
+    for step in steps:
+        for dependency in step.get('depends_on', []) or []:
+            if dependency in known and step.get('id'):
+                dependents[dependency].append(step['id'])
+
+    lengths: Dict[str, float] = {}
+    for root in ids:
+        if root in lengths:
+            continue
+        # Recorrido en profundidad iterativo (post-orden); un ciclo se corta sin sumar
+        stack = [(root, False)]
+        visiting = set()
+        while stack:
+            step_id, expanded = stack.pop()
+            if expanded:
+                visiting.discard(step_id)
+                tail = max((lengths.get(d, 0.0) for d in dependents[step_id]), default=0.0)
+                lengths[step_id] = float(durations.get(step_id, default_seconds)) + tail
+                continue
+            if step_id in lengths or step_id in visiting:
+                continue
+            visiting.add(step_id)
+            stack.append((step_id, True))
+            stack.extend((d, False) for d in dependents[step_id] if d not in lengths)
+    return {step_id: round(length, 3) for step_id, length in lengths.items()}
+
+
+def get_critical_path(flow_state: dict) -> Dict[str, float]:
+    """
+    Obtiene el camino crítico persistido en el estado, calculándolo sin histórico
+    si no existe (estados antiguos).
+
+    Args:
+        flow_state: Estado de ejecución del flujo
+
+    Returns:
+        dict: Id de paso -> segundos del camino crítico restante
+    """
+    critical_path = flow_state.get(CRITICAL_PATH_KEY)
+    if critical_path is None:
+        critical_path = compute_critical_path(flow_state.get('flow_config', {}).get('steps', []))
+        flow_state[CRITICAL_PATH_KEY] = critical_path
+    return critical_path
+
+
+def sort_by_priority(steps: List[Dict[str, Any]], critical_path: Dict[str, float]) -> List[Dict[str, Any]]:
+    """
+    Ordena pasos por camino crítico descendente (estable: a igualdad, orden de la lista).
+
+    Args:
+        steps: Pasos a ordenar
+        critical_path: Id de paso -> segundos del camino crítico restante
+
+    Returns:
+        list: Pasos ordenados
+    """
+    return sorted(steps, key=lambda step: -critical_path.get(step.get('id'), 0.0))
+
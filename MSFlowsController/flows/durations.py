@@ -0,0 +1,57 @@
+"""
+Tiempos observados de los pasos de un run (ejecución y espera en cola).
+
+Alimentan el histórico de duraciones (storage/step_history.py) cuando un run termina.
+"""
+from datetime import datetime
+from typing import Dict, Optional
+
+
+def _seconds_between(start: Optional[str], end: Optional[str]) -> Optional[float]:
+    if not start or not end:
+        return None
+    try:
+        started = datetime.fromisoformat(start.replace('Z', '+00:00'))
+        ended = datetime.fromisoformat(end.replace('Z', '+00:00'))
+        return max((ended - started).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        # Marcas de tiempo ilegibles o mezcla de fechas con y sin zona horaria
+        return None
+
+
+def run_step_durations(steps: list) -> Dict[str, float]:
+    """
+    Duración observada de los pasos completados de un run.
+
+    Args:
+        steps: Pasos del run
+
+    Returns:
+        dict: Id de paso -> segundos entre started_at y completed_at
+    """
+    durations = {}
+    for step in steps:
+        if step.get('status') != 'completed':
+            continue
+        seconds = _seconds_between(step.get('started_at'), step.get('completed_at'))
+        if seconds is not None:
+            durations[step['id']] = seconds
+    return durations
+
+
+def run_step_queue_times(steps: list) -> Dict[str, float]:
+    """
+    Espera en cola de admisión de los pasos que llegaron a arrancar.
+
+    Args:
+        steps: Pasos del run
+
+    Returns:
+        dict: Id de paso -> segundos entre queued_at y started_at
+    """
+    queue_times = {}
+    for step in steps:
+        seconds = _seconds_between(step.get('queued_at'), step.get('started_at'))
+        if seconds is not None:
+            queue_times[step['id']] = seconds
+    return queue_times
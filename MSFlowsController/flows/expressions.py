@@ -0,0 +1,391 @@
+"""
+Expresiones ``{{ ... }}`` en la configuración de los pasos.
+
+    "config": {
+        "table": "{{ context.dataset }}.kpis_{{ account }}",
+        "since": "{{ steps.extract.result.max_extracted_at }}",
+        "batch": "{{ steps.extract.result.rows // 1000 + 1 }}",
+        "mode": "{{ 'full' if steps.extract.result.rows > 100000 else 'incremental' }}"
+    }
+
+Una expresión es un subconjunto de expresiones de Python: nombres, rutas con
+``.`` o ``[...]``, literales, aritmética, comparaciones, ``and``/``or``/``not``
+y ``a if cond else b``. Los nombres disponibles son ``flow_id``, ``run_id``,
+``account``, ``context`` (y sus claves directamente), ``config`` (la
+configuración del propio paso) y ``steps`` (``steps.<id>.result``,
+``steps.<id>.status``). Una cadena formada por una sola expresión conserva el
+tipo del valor; en otro caso el valor se interpola como texto.
+
+Las expresiones se compilan una vez a funciones (caché por texto) y la
+normalización guarda en cada paso las rutas de su configuración que contienen
+plantillas, de modo que despachar un paso solo visita esas rutas. Un texto que
+no es una expresión válida (p. ej. Jinja de dbt) o que no se puede resolver se
+deja tal cual.
+"""
+import ast
+import json
+import logging
+import operator
+import re
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from flows.graph import find_step, get_run_graph
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_PATHS_KEY = 'template_paths'
+
+_TEMPLATE = re.compile(r'\{\{(.*?)\}\}', re.S)
+
+_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+_UNARY_OPERATORS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Not: operator.not_,
+}
+_COMPARE_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+_JSON_CONSTANTS = {'true': True, 'false': False, 'null': None}
+
+Path = List[Union[str, int]]
+
+
+class _Undefined:
+    """Valor de una ruta que no existe en el ámbito."""
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return 'UNDEFINED'
+
+
+UNDEFINED = _Undefined()
+
+
+def _lookup(value: Any, key: Any) -> Any:
+    if isinstance(value, Mapping):
+        return value.get(key, UNDEFINED)
+    if isinstance(value, (list, tuple)) and isinstance(key, int) and -len(value) <= key < len(value):
+        return value[key]
+    return UNDEFINED
+
+
+def _compile_node(node: ast.AST) -> Callable[[Mapping], Any]:
+    """Convierte un nodo del AST en una función del ámbito."""
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda scope: value
+    if isinstance(node, ast.Name):
+        if node.id in _JSON_CONSTANTS:
+            value = _JSON_CONSTANTS[node.id]
+            return lambda scope: value
+        name = node.id
+        return lambda scope: scope.get(name, UNDEFINED)
+    if isinstance(node, ast.Attribute):
+        target, attribute = _compile_node(node.value), node.attr
+        return lambda scope: _lookup(target(scope), attribute)
+    if isinstance(node, ast.Subscript):
+        target, key = _compile_node(node.value), _compile_node(node.slice)
+        return lambda scope: _lookup(target(scope), key(scope))
+    if isinstance(node, (ast.List, ast.Tuple)):
+        items = [_compile_node(item) for item in node.elts]
+        return lambda scope: [item(scope) for item in items]
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        function, left, right = _BINARY_OPERATORS[type(node.op)], _compile_node(node.left), _compile_node(node.right)
+
+        def binary(scope):
+            a, b = left(scope), right(scope)
+            return UNDEFINED if a is UNDEFINED or b is UNDEFINED else function(a, b)
+        return binary
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        function, operand = _UNARY_OPERATORS[type(node.op)], _compile_node(node.operand)
+        if isinstance(node.op, ast.Not):
+            return lambda scope: not operand(scope)
+
+        def unary(scope):
+            value = operand(scope)
+            return UNDEFINED if value is UNDEFINED else function(value)
+        return unary
+    if isinstance(node, ast.BoolOp):
+        operands = [_compile_node(value) for value in node.values]
+        is_and = isinstance(node.op, ast.And)
+
+        def boolean(scope):
+            for operand in operands:
+                value = operand(scope)
+                if bool(value) != is_and:
+                    return value
+            return value
+        return boolean
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARE_OPERATORS for op in node.ops):
+        left = _compile_node(node.left)
+        comparisons = [(_COMPARE_OPERATORS[type(op)], _compile_node(right)) for op, right in zip(node.ops, node.comparators)]
+
+        def compare(scope):
+            a = left(scope)
+            for function, right in comparisons:
+                b = right(scope)
+                if not function(None if a is UNDEFINED else a, None if b is UNDEFINED else b):
+                    return False
+                a = b
+            return True
+        return compare
+    if isinstance(node, ast.IfExp):
+        test, body, orelse = _compile_node(node.test), _compile_node(node.body), _compile_node(node.orelse)
+        return lambda scope: body(scope) if test(scope) else orelse(scope)
+    raise ValueError(f"Unsupported expression element: {type(node).__name__}")
+
+
+@lru_cache(maxsize=4096)
+def compile_expression(source: str) -> Callable[[Mapping], Any]:
+    """
+    Compila una expresión (sin las llaves) a una función del ámbito.
+
+    Args:
+        source: Texto de la expresión
+
+    Returns:
+        callable: Función que evalúa la expresión; devuelve UNDEFINED si una ruta no existe
+
+    Raises:
+        ValueError: Si el texto no es una expresión admitida
+    """
+    try:
+        tree = ast.parse(source.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression '{source}': {e.msg}") from e
+    return _compile_node(tree.body)
+
+
+def _as_text(value: Any) -> str:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return '' if value is None else str(value)
+
+
+@lru_cache(maxsize=4096)
+def compile_template(text: str) -> Optional[Callable[[Mapping], Any]]:
+    """
+    Compila una cadena con expresiones ``{{ ... }}``.
+
+    Args:
+        text: Cadena de la configuración
+
+    Returns:
+        callable: Función que renderiza la cadena para un ámbito, o None si no contiene expresiones admitidas
+    """
+    segments: List[Any] = []
+    position = 0
+    compiled = False
+    for match in _TEMPLATE.finditer(text):
+        segments.append(text[position:match.start()])
+        try:
+            expression = compile_expression(match.group(1))
+            segments.append((expression, match.group(0)))
+            compiled = True
+        except ValueError:
+            segments.append(match.group(0))
+        position = match.end()
+    if not compiled:
+        return None
+    segments.append(text[position:])
+    segments = [segment for segment in segments if segment != '']
+
+    if len(segments) == 1:
+        # Una sola expresión: se conserva el tipo del valor
+        expression, original = segments[0]
+
+        def render_value(scope):
+            value = _evaluate(expression, original, scope)
+            return original if value is UNDEFINED else value
+        return render_value
+
+    def render_text(scope):
+        parts = []
+        for segment in segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+            else:
+                value = _evaluate(*segment, scope)
+                parts.append(segment[1] if value is UNDEFINED else _as_text(value))
+        return ''.join(parts)
+    return render_text
+
+
+def _evaluate(expression: Callable[[Mapping], Any], original: str, scope: Mapping) -> Any:
+    try:
+        return expression(scope)
+    except Exception as e:
+        logger.warning(f"⚠️ Expression {original} could not be evaluated: {str(e)}")
+        return UNDEFINED
+
+
+def render_value(value: Any, scope: Mapping) -> Any:
+    """
+    Renderiza un valor suelto: las cadenas con expresiones se evalúan, el resto se devuelve igual.
+
+    Args:
+        value: Valor a renderizar
+        scope: Ámbito de nombres
+
+    Returns:
+        Any: Valor renderizado
+    """
+    if not isinstance(value, str):
+        return value
+    template = compile_template(value)
+    return value if template is None else template(scope)
+
+
+def find_template_paths(value: Any, path: Optional[Path] = None) -> List[Path]:
+    """
+    Rutas de las cadenas de un valor que contienen expresiones admitidas.
+
+    Args:
+        value: Configuración (dict, lista o escalar)
+        path: Prefijo de la ruta actual
+
+    Returns:
+        list: Rutas (listas de claves e índices)
+    """
+    path = path or []
+    if isinstance(value, str):
+        return [path] if compile_template(value) is not None else []
+    if isinstance(value, dict):
+        return [found for key, item in value.items() for found in find_template_paths(item, path + [key])]
+    if isinstance(value, list):
+        return [found for index, item in enumerate(value) for found in find_template_paths(item, path + [index])]
+    return []
+
+
+def render_templates(value: Any, paths: Optional[List[Path]], scope: Mapping) -> Any:
+    """
+    Renderiza las cadenas de las rutas indicadas sin modificar el valor original.
+
+    Solo se copian los contenedores de esas rutas; sin rutas, se devuelve el mismo objeto.
+
+    Args:
+        value: Configuración del paso
+        paths: Rutas con plantillas (ver find_template_paths)
+        scope: Ámbito de nombres
+
+    Returns:
+        Any: Configuración renderizada
+    """
+    if not paths:
+        return value
+    copies: Dict[int, Any] = {}
+
+    def writable(container):
+        if id(container) not in copies:
+            copies[id(container)] = dict(container) if isinstance(container, dict) else list(container)
+        return copies[id(container)]
+
+    root = writable(value)
+    for path in paths:
+        container = root
+        try:
+            for key in path[:-1]:
+                container[key] = writable(container[key])
+                container = container[key]
+            container[path[-1]] = render_value(container[path[-1]], scope)
+        except (KeyError, IndexError, TypeError):
+            # La configuración ya no tiene esa ruta (p. ej. modificada tras normalizar)
+            continue
+    return root
+
+
+def annotate_templates(step: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Guarda en el paso las rutas de su configuración que contienen plantillas.
+
+    Args:
+        step: Paso del flujo (se modifica en sitio)
+
+    Returns:
+        dict: El mismo paso
+    """
+    paths = find_template_paths(step.get('config') or {})
+    if paths:
+        step[TEMPLATE_PATHS_KEY] = paths
+    else:
+        step.pop(TEMPLATE_PATHS_KEY, None)
+    return step
+
+
+class _StepResults(Mapping):
+    """Pasos del run por id, resueltos bajo demanda con el índice del grafo."""
+
+    def __init__(self, flow_state: dict):
+        self.flow_state = flow_state
+
+    def __getitem__(self, step_id):
+        step = find_step(self.flow_state, get_run_graph(self.flow_state), step_id)
+        if step is None:
+            raise KeyError(step_id)
+        return step
+
+    def __iter__(self):
+        return (step.get('id') for step in self.flow_state.get('flow_config', {}).get('steps', []))
+
+    def __len__(self):
+        return len(self.flow_state.get('flow_config', {}).get('steps', []))
+
+
+class StepScope(Mapping):
+    """Ámbito de nombres de las expresiones de un paso."""
+
+    def __init__(self, flow_state: dict, step: Dict[str, Any]):
+        self.flow_state = flow_state
+        self.step = step
+        self.context = flow_state.get('context') or {}
+
+    def __getitem__(self, name):
+        if name == 'steps':
+            return _StepResults(self.flow_state)
+        if name == 'config':
+            return self.step.get('config') or {}
+        if name == 'context':
+            return self.context
+        if name in ('flow_id', 'run_id', 'account'):
+            return self.flow_state.get(name)
+        return self.context[name]
+
+    def __iter__(self):
+        return iter(['flow_id', 'run_id', 'account', 'context', 'config', 'steps', *self.context])
+
+    def __len__(self):
+        return 6 + len(self.context)
+
+
+def render_step_config(flow_state: dict, step: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Configuración del paso con sus plantillas renderizadas para el run.
+
+    Args:
+        flow_state: Estado de ejecución del flujo
+        step: Paso a despachar
+
+    Returns:
+        dict: Configuración renderizada (la del paso si no tiene plantillas)
+    """
+    config = step.get('config') or {}
+    return render_templates(config, step.get(TEMPLATE_PATHS_KEY), StepScope(flow_state, step))
@@ -0,0 +1,183 @@
+"""
+Grafo compilado de ejecución (DAG) para la planificación de pasos dirigida por callbacks.
+
+El grafo se compila una vez por ejecución y se persiste junto al estado del run
+(clave ``run_graph``), de forma que cada callback solo actualiza los sucesores
+directos del paso completado en lugar de recorrer toda la lista de pasos.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+RUN_GRAPH_KEY = 'run_graph'
+
+
+def compile_run_graph(steps: list) -> dict:
+    """
+    Compila el grafo de ejecución a partir de la lista de pasos.
+
+    El resultado es serializable a JSON y contiene:
+        - index: id de paso -> posición en la lista de pasos
+        - dependents: id de paso -> ids de los pasos que dependen de él
+        - remaining: id de paso -> número de dependencias aún no completadas
+        - ready: pasos 'pending' sin dependencias pendientes (frontera)
+        - running: pasos en ejecución
+        - counts: número de pasos por estado
+
+    Args:
+        steps: Lista de pasos normalizados
+
+    Returns:
+        dict: Grafo compilado
+    """
+    index: Dict[str, int] = {}
+    for position, step in enumerate(steps):
+        step_id = step.get('id')
+        if step_id:
+            index[step_id] = position
+
+    completed = {step_id for step_id, position in index.items() if steps[position].get('status') == 'completed'}
+    dependents: Dict[str, List[str]] = {step_id: [] for step_id in index}
+    remaining: Dict[str, int] = {}
+    counts: Dict[str, int] = {}
+    ready: List[str] = []
+    running: List[str] = []
+
+    for step_id, position in index.items():
+        step = steps[position]
+        dependencies = step.get('depends_on', []) or []
+        for dependency in dependencies:
+            dependents.setdefault(dependency, []).append(step_id)
+        remaining[step_id] = sum(1 for dependency in dependencies if dependency not in completed)
+
+        status = step.get('status', 'pending')
+        counts[status] = counts.get(status, 0) + 1
+        if status == 'pending' and remaining[step_id] == 0:
+            ready.append(step_id)
+        elif status == 'running':
+            running.append(step_id)
+
+    return {
+        "index": index,
+        "dependents": dependents,
+        "remaining": remaining,
+        "ready": ready,
+        "running": running,
+        "counts": counts
+    }
+
+
+def get_run_graph(flow_state: dict) -> dict:
+    """
+    Obtiene el grafo persistido en el estado, compilándolo si no existe
+    (estados antiguos) o si ya no corresponde con la lista de pasos.
+
+    Args:
+        flow_state: Estado de ejecución del flujo
+
+    Returns:
+        dict: Grafo compilado
+    """
+    steps = flow_state.get('flow_config', {}).get('steps', [])
+    graph = flow_state.get(RUN_GRAPH_KEY)
+    if not graph or len(graph.get('index', {})) != len([s for s in steps if s.get('id')]):
+        logger.info(f"🧮 Compilando grafo de ejecución: {len(steps)} pasos")
+        graph = compile_run_graph(steps)
+        flow_state[RUN_GRAPH_KEY] = graph
+    return graph
+
+
+def find_step(flow_state: dict, graph: dict, step_id: str) -> Optional[dict]:
+    """
+    Localiza un paso por id usando el índice del grafo.
+
+    Args:
+        flow_state: Estado de ejecución del flujo
+        graph: Grafo compilado
+        step_id: Id del paso
+
+    Returns:
+        dict: Paso encontrado o None
+    """
+    steps = flow_state.get('flow_config', {}).get('steps', [])
+    position = graph['index'].get(step_id)
+    if position is None or position >= len(steps):
+        return None
+    step = steps[position]
+    if step.get('id') != step_id:
+        # El índice no corresponde con la lista; se recompila
+        graph.update(compile_run_graph(steps))
+        position = graph['index'].get(step_id)
+        return steps[position] if position is not None else None
+    return step
+
+
+def record_transition(graph: dict, step_id: str, previous_status: Optional[str], new_status: str) -> List[str]:
+    """
+    Registra el cambio de estado de un paso en el grafo.
+
+    Mantiene los contadores por estado y las listas 'running'/'ready'. Cuando un paso
+    pasa a 'completed', decrementa el contador de dependencias de sus sucesores
+    directos y devuelve los que quedan liberados.
+
+    Args:
+        graph: Grafo compilado
+        step_id: Id del paso
+        previous_status: Estado anterior del paso
+        new_status: Estado nuevo del paso
+
+    Returns:
+        list: Ids de los pasos liberados por esta transición
+    """
+    previous_status = previous_status or 'pending'
+    if previous_status == new_status:
+        return []
+
+    counts = graph.setdefault('counts', {})
+    if counts.get(previous_status):
+        counts[previous_status] -= 1
+    counts[new_status] = counts.get(new_status, 0) + 1
+
+    running = graph.setdefault('running', [])
+    if new_status == 'running':
+        if step_id not in running:
+            running.append(step_id)
+    elif step_id in running:
+        running.remove(step_id)
+
+    ready = graph.setdefault('ready', [])
+    if new_status != 'pending' and step_id in ready:
+        ready.remove(step_id)
+
+    released: List[str] = []
+    if new_status == 'completed':
+        remaining = graph['remaining']
+        for dependent in graph['dependents'].get(step_id, []):
+            remaining[dependent] = max(remaining.get(dependent, 0) - 1, 0)
+            if remaining[dependent] == 0:
+                released.append(dependent)
+                if dependent not in ready:
+                    ready.append(dependent)
+    return released
+
+
+def get_ready_steps(flow_state: dict, graph: dict) -> List[Dict[str, Any]]:
+    """
+    Devuelve los pasos de la frontera que siguen en estado 'pending'.
+
+    Args:
+        flow_state: Estado de ejecución del flujo
+        graph: Grafo compilado
+
+    Returns:
+        list: Pasos listos para ejecutarse
+    """
+    ready = []
+    for step_id in list(graph.get('ready', [])):
+        step = find_step(flow_state, graph, step_id)
+        if step is not None and step.get('status', 'pending') == 'pending':
+            ready.append(step)
+        else:
+            graph['ready'].remove(step_id)
+    return ready
@@ -0,0 +1,74 @@
+"""
+Registro de callbacks procesados (idempotencia).
+
+Pub/Sub entrega los mensajes al menos una vez, así que un mismo callback puede
+llegar varias veces. El registro se guarda junto al estado del run (clave
+``callback_ledger``) y permite descartar un duplicado antes de modificar el
+estado, por dos vías:
+    - message_ids: ids de mensaje de Pub/Sub ya procesados (acotado)
+    - transitions: transiciones ``task_id:status:attempt`` ya aplicadas
+
+Ambos se guardan como diccionarios {clave: fecha}, de modo que el log de
+eventos solo registra las claves añadidas o eliminadas.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+CALLBACK_LEDGER_KEY = 'callback_ledger'
+
+
+def transition_key(task_id: Optional[str], status: str, attempt: int) -> str:
+    """
+    Clave de una transición de paso.
+
+    Args:
+        task_id: ID del paso
+        status: Estado reportado por el callback
+        attempt: Intento del paso al que corresponde el callback
+
+    Returns:
+        str: Clave de la transición
+    """
+    return f"{task_id}:{status}:{attempt}"
+
+
+def is_duplicate(flow_state: dict, message_id: Optional[str], transition: Optional[str]) -> bool:
+    """
+    Indica si el callback ya fue procesado.
+
+    Args:
+        flow_state: Estado del flujo
+        message_id: ID del mensaje de Pub/Sub (si se conoce)
+        transition: Clave de la transición (si se conoce el paso)
+
+    Returns:
+        bool: True si el mensaje o la transición ya están registrados
+    """
+    ledger = flow_state.get(CALLBACK_LEDGER_KEY) or {}
+    if message_id and message_id in (ledger.get('message_ids') or {}):
+        return True
+    return bool(transition) and transition in (ledger.get('transitions') or {})
+
+
+def record_callback(flow_state: dict, message_id: Optional[str], transition: Optional[str], max_message_ids: int) -> None:
+    """
+    Registra el callback en el estado; se persiste con el siguiente guardado.
+
+    Los ids de mensaje más antiguos se descartan al superar max_message_ids. Las
+    transiciones no se descartan: están acotadas por pasos x estados x intentos.
+
+    Args:
+        flow_state: Estado del flujo
+        message_id: ID del mensaje de Pub/Sub
+        transition: Clave de la transición
+        max_message_ids: Número máximo de ids de mensaje conservados
+    """
+    ledger = flow_state.setdefault(CALLBACK_LEDGER_KEY, {})
+    recorded_at = datetime.now(timezone.utc).isoformat()
+    if message_id:
+        message_ids = ledger.setdefault('message_ids', {})
+        message_ids[message_id] = recorded_at
+        while len(message_ids) > max_message_ids:
+            del message_ids[next(iter(message_ids))]
+    if transition:
+        ledger.setdefault('transitions', {})[transition] = recorded_at
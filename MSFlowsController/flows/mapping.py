@@ -0,0 +1,254 @@
+"""
+Pasos 'map': expansión de una lista en N pasos hijos paralelos.
+
+    {"id": "kpis", "type": "map", "depends_on": ["list_hotels"],
+     "config": {
+         "items": ["H1", "H2"],                                   # lista estática, o bien
+         "items_from": {"step": "list_hotels", "path": "hotels"},  # lista del resultado de otro paso
+         "item_key": "hotel_id",                                  # clave del elemento en la config del hijo
+         "parallelism": 10,                                       # hijos en ejecución a la vez
+         "step": {"type": "ms-kpi-engine", "config": {...}}       # plantilla de cada hijo
+     }}
+
+Cuando el paso map queda listo se añaden al run los hijos ``kpis[0]``,
+``kpis[1]``... (plantilla + elemento) y el paso map pasa a 'running'. El paso
+map actúa de join: se completa cuando terminan todos sus hijos, con sus
+resultados en orden, y entonces libera a sus dependientes.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from core.config import config
+from core.exceptions import FlowConfigurationError, StepExecutionError
+from flows.critical_path import CRITICAL_PATH_KEY
+from flows.expressions import TEMPLATE_PATHS_KEY
+from flows.graph import RUN_GRAPH_KEY, compile_run_graph, find_step, get_ready_steps, get_run_graph, record_transition
+from flows.routing import ROUTING_INDEX_KEY, build_routing_index
+
+logger = logging.getLogger(__name__)
+
+MAP_STEP_TYPE = 'map'
+MAP_PARENT_KEY = 'map_parent'
+
+# Claves de la plantilla que heredan los hijos además de type y config
+_INHERITED_KEYS = ('name', 'retry', 'timeout_minutes', 'cache_key', TEMPLATE_PATHS_KEY)
+
+
+def is_map_step(step: Dict[str, Any]) -> bool:
+    return step.get('type') == MAP_STEP_TYPE
+
+
+def normalize_map_step(step: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida la configuración de un paso map y completa sus valores por defecto.
+
+    Args:
+        step: Paso de tipo 'map'
+
+    Returns:
+        dict: El mismo paso, normalizado
+
+    Raises:
+        FlowConfigurationError: Si falta la plantilla o la fuente de elementos, o si
+            el paso no depende del paso del que lee los elementos
+    """
+    map_config = step.setdefault('config', {})
+    template = map_config.get('step')
+    if not isinstance(template, dict) or not template.get('type'):
+        raise FlowConfigurationError(f"Map step '{step.get('id')}' requires a 'step' template with a type")
+    if 'items' not in map_config and 'items_from' not in map_config:
+        raise FlowConfigurationError(f"Map step '{step.get('id')}' requires 'items' or 'items_from'")
+    source = map_config.get('items_from')
+    source_step = source.get('step') if isinstance(source, dict) else str(source or '').partition('.')[0]
+    if 'items' not in map_config and source_step not in (step.get('depends_on') or []):
+        raise FlowConfigurationError(f"Map step '{step.get('id')}' must depend on '{source_step}' to read its items")
+    map_config.setdefault('item_key', 'item')
+    map_config['parallelism'] = max(int(map_config.get('parallelism') or config.MAP_DEFAULT_PARALLELISM), 1)
+    return step
+
+
+def _lookup(data: Any, path: Optional[str]) -> Any:
+    for part in (path or '').split('.'):
+        if not part:
+            continue
+        if isinstance(data, dict):
+            data = data.get(part)
+        elif isinstance(data, list) and part.isdigit() and int(part) < len(data):
+            data = data[int(part)]
+        else:
+            return None
+    return data
+
+
+def resolve_items(flow_state: dict, graph: dict, step: Dict[str, Any]) -> List[Any]:
+    """
+    Obtiene la lista a expandir: estática o del resultado de un paso previo.
+
+    Raises:
+        StepExecutionError: Si la fuente no contiene una lista
+    """
+    map_config = step.get('config') or {}
+    if 'items' in map_config:
+        items = map_config['items']
+    else:
+        source = map_config['items_from']
+        if isinstance(source, str):
+            source_step, _, path = source.partition('.')
+            source = {"step": source_step, "path": path}
+        producer = find_step(flow_state, graph, source.get('step'))
+        items = _lookup((producer or {}).get('result'), source.get('path'))
+    if not isinstance(items, list):
+        raise StepExecutionError(f"map items are not a list ({type(items).__name__})", step.get('id'))
+    return items
+
+
+def expand_map_step(flow_state: dict, step: Dict[str, Any]) -> List[str]:
+    """
+    Expande un paso map listo en sus hijos y recompila grafo e índice de enrutamiento.
+
+    Una lista vacía completa el paso map en el acto. Si la lista no se puede
+    resolver, el paso map queda 'failed' y se lanza StepExecutionError.
+
+    Args:
+        flow_state: Estado de ejecución del flujo (se modifica en sitio)
+        step: Paso map en estado 'pending'
+
+    Returns:
+        list: Ids de los hijos creados
+    """
+    graph = get_run_graph(flow_state)
+    now = datetime.now(timezone.utc).isoformat()
+    try:
+        items = resolve_items(flow_state, graph, step)
+    except StepExecutionError as e:
+        step['status'] = 'failed'
+        step['error'] = str(e)
+        record_transition(graph, step['id'], 'pending', 'failed')
+        raise
+
+    map_config = step['config']
+    template = map_config['step']
+    item_key = map_config.get('item_key', 'item')
+    children = []
+    for position, item in enumerate(items):
+        child = {key: template[key] for key in _INHERITED_KEYS if key in template}
+        child.update({
+            "id": f"{step['id']}[{position}]",
+            "type": template['type'],
+            "config": {**(template.get('config') or {}), item_key: item},
+            "depends_on": [],
+            MAP_PARENT_KEY: step['id'],
+            "map_index": position,
+        })
+        children.append(child)
+
+    step['started_at'] = now
+    step['map_children'] = [child['id'] for child in children]
+    if not children:
+        step['status'] = 'completed'
+        step['completed_at'] = now
+        step['result'] = {"items": 0, "results": []}
+        record_transition(graph, step['id'], 'pending', 'completed')
+        logger.info(f"🗺️ Map {step['id']} sin elementos: completado")
+        return []
+
+    step['status'] = 'running'
+    steps = flow_state['flow_config']['steps']
+    steps.extend(children)
+    flow_state[RUN_GRAPH_KEY] = compile_run_graph(steps)
+    flow_state[ROUTING_INDEX_KEY], _ = build_routing_index(steps)
+    critical_path = flow_state.get(CRITICAL_PATH_KEY)
+    if critical_path is not None:
+        for child in children:
+            critical_path[child['id']] = critical_path.get(step['id'], 0.0)
+    logger.info(f"🗺️ Map {step['id']} expandido en {len(children)} hijos")
+    return [child['id'] for child in children]
+
+
+def limit_map_parallelism(flow_state: dict, ready: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Filtra los hijos listos para no superar el paralelismo de su paso map.
+
+    Args:
+        flow_state: Estado de ejecución del flujo
+        ready: Pasos listos
+
+    Returns:
+        list: Pasos listos que se pueden despachar ahora
+    """
+    if not any(step.get(MAP_PARENT_KEY) for step in ready):
+        return ready
+    graph = get_run_graph(flow_state)
+    steps = flow_state.get('flow_config', {}).get('steps', [])
+    active: Dict[str, int] = {}
+    for step in steps:
+        if step.get(MAP_PARENT_KEY) and step.get('status') in ('running', 'queued', 'retry_wait'):
+            active[step[MAP_PARENT_KEY]] = active.get(step[MAP_PARENT_KEY], 0) + 1
+
+    allowed = []
+    for step in ready:
+        parent_id = step.get(MAP_PARENT_KEY)
+        if not parent_id:
+            allowed.append(step)
+            continue
+        parent = find_step(flow_state, graph, parent_id) or {}
+        parallelism = (parent.get('config') or {}).get('parallelism') or config.MAP_DEFAULT_PARALLELISM
+        if active.get(parent_id, 0) < parallelism:
+            active[parent_id] = active.get(parent_id, 0) + 1
+            allowed.append(step)
+    return allowed
+
+
+def get_dispatchable_steps(flow_state: dict) -> List[Dict[str, Any]]:
+    """
+    Pasos listos para despachar: expande los pasos map de la frontera (y los que
+    quedan listos porque un map vacío se completa) y aplica el paralelismo de
+    cada map a sus hijos.
+
+    Args:
+        flow_state: Estado de ejecución del flujo (se modifica en sitio)
+
+    Returns:
+        list: Pasos a despachar, sin ordenar
+
+    Raises:
+        StepExecutionError: Si la lista de un paso map no se puede resolver
+    """
+    ready = get_ready_steps(flow_state, get_run_graph(flow_state))
+    while any(is_map_step(step) for step in ready):
+        for step in ready:
+            if is_map_step(step):
+                expand_map_step(flow_state, step)
+        ready = get_ready_steps(flow_state, get_run_graph(flow_state))
+    return limit_map_parallelism(flow_state, ready)
+
+
+def complete_map_parent(flow_state: dict, child_id: Optional[str]) -> Optional[str]:
+    """
+    Completa el paso map de un hijo cuando todos sus hermanos han terminado.
+
+    Args:
+        flow_state: Estado de ejecución del flujo
+        child_id: Id del paso hijo que acaba de completarse
+
+    Returns:
+        str: Id del paso map completado, o None
+    """
+    graph = get_run_graph(flow_state)
+    child = find_step(flow_state, graph, child_id) if child_id else None
+    if child is None or not child.get(MAP_PARENT_KEY):
+        return None
+    parent = find_step(flow_state, graph, child[MAP_PARENT_KEY])
+    if parent is None or parent.get('status') != 'running':
+        return None
+    siblings = [find_step(flow_state, graph, step_id) or {} for step_id in parent.get('map_children', [])]
+    if any(sibling.get('status') != 'completed' for sibling in siblings):
+        return None
+
+    parent['status'] = 'completed'
+    parent['completed_at'] = datetime.now(timezone.utc).isoformat()
+    parent['result'] = {"items": len(siblings), "results": [sibling.get('result') for sibling in siblings]}
+    record_transition(graph, parent['id'], 'running', 'completed')
+    logger.info(f"🗺️ Map {parent['id']} completado: {len(siblings)} hijos")
+    return parent['id']
@@ -0,0 +1,83 @@
+"""
+Claves de memoización de resultados de pasos.
+
+Un paso opta por la memoización con ``cache_key`` en su definición:
+
+    "cache_key": true                                  # todo el resultado de cada dependencia
+    "cache_key": {"fields": ["file_count", "max_extracted_at"]}   # solo esos campos
+
+La clave es un hash de su tipo y configuración más la huella de salida de cada
+dependencia, tomada de su resultado de callback: el campo ``fingerprint`` si la
+dependencia lo reporta, los campos indicados en la política o, en su defecto,
+el resultado completo. Si la clave coincide con la del último run exitoso, el
+paso se da por completado con el resultado guardado, sin despacharlo.
+"""
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_FINGERPRINT_KEY = 'cache_fingerprint'
+
+
+def cache_policy(step: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Política de memoización del paso.
+
+    Args:
+        step: Paso del flujo
+
+    Returns:
+        dict: Política ({"fields": [...]} opcional) o None si el paso no la usa
+    """
+    policy = step.get('cache_key')
+    if policy is True:
+        return {}
+    if isinstance(policy, dict) and policy.get('enabled', True):
+        return policy
+    return None
+
+
+def output_fingerprint(result: Optional[Dict[str, Any]], fields: Optional[list] = None) -> Any:
+    """
+    Huella de salida de una dependencia a partir de su resultado.
+
+    Args:
+        result: Resultado del callback de la dependencia
+        fields: Campos del resultado que definen la huella
+
+    Returns:
+        Valor serializable que identifica la salida
+    """
+    result = result or {}
+    if 'fingerprint' in result:
+        return result['fingerprint']
+    if fields:
+        return {field: result.get(field) for field in fields}
+    return result
+
+
+def compute_cache_key(step: Dict[str, Any], dependency_results: Dict[str, Optional[Dict[str, Any]]]) -> str:
+    """
+    Calcula la clave de memoización de un paso.
+
+    Args:
+        step: Paso del flujo (con política de memoización)
+        dependency_results: Id de dependencia -> resultado de su callback
+
+    Returns:
+        str: Hash sha256 en hexadecimal
+    """
+    fields = (cache_policy(step) or {}).get('fields')
+    material = {
+        "type": step.get('type'),
+        "config": step.get('config') or {},
+        "inputs": {
+            dependency: output_fingerprint(result, fields)
+            for dependency, result in sorted(dependency_results.items())
+        }
+    }
+    encoded = json.dumps(material, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
@@ -3,6 +3,10 @@ Utilidades para normalización de definiciones de flujos.
 """
 import logging
 
+from flows.expressions import annotate_templates
+from flows.mapping import is_map_step, normalize_map_step
+from flows.subflows import is_subflow_step, normalize_subflow_step
+
 logger = logging.getLogger(__name__)
 
 
@@ -36,6 +40,15 @@ def normalize_steps(flow_config: dict) -> list:
             steps = []
             logger.warning(f"⚠️ No se encontraron 'tasks' válidos, usando lista vacía")
     
+    for step in steps:
+        if is_map_step(step):
+            # Las plantillas son del paso que se repite, no del map
+            annotate_templates(normalize_map_step(step)['config']['step'])
+            continue
+        if is_subflow_step(step):
+            normalize_subflow_step(step)
+        annotate_templates(step)
+    
     return steps
 
 
@@ -0,0 +1,84 @@
+"""
+Informe de rendimiento de un flujo a partir del histórico de duraciones.
+
+Muestra el camino crítico esperado (con la mediana de cada paso) y los pasos
+más lentos por p90, con sus tiempos de espera en cola. Desde línea de
+comandos: ``python -m flows.report_cli``.
+"""
+from typing import Any, Dict, List, Optional
+
+from flows.critical_path import compute_critical_path
+from flows.normalization import normalize_steps
+
+
+def build_flow_report(steps: List[Dict[str, Any]], history: Dict[str, Dict[str, Any]], top: int = 5) -> Dict[str, Any]:
+    """
+    Construye el informe de un flujo.
+
+    Args:
+        steps: Pasos de la definición del flujo
+        history: Estadísticas por id de paso (StepHistoryRepository.get_history)
+        top: Número de pasos lentos a listar
+
+    Returns:
+        dict: critical_path, critical_path_seconds, slowest_steps y steps_without_history
+    """
+    steps = [step for step in steps if step.get('id')]
+    durations = {step_id: entry['p50_seconds'] for step_id, entry in history.items() if 'p50_seconds' in entry}
+    lengths = compute_critical_path(steps, durations)
+    dependents: Dict[str, List[str]] = {}
+    for step in steps:
+        for dependency in step.get('depends_on', []) or []:
+            dependents.setdefault(dependency, []).append(step['id'])
+
+    # El camino parte del paso inicial más largo y sigue siempre al sucesor más largo
+    path: List[str] = []
+    roots = [s['id'] for s in steps if not s.get('depends_on')]
+    current = max(roots, key=lambda step_id: lengths.get(step_id, 0.0), default=None)
+    while current is not None and current not in path:
+        path.append(current)
+        current = max(dependents.get(current, []), key=lambda step_id: lengths.get(step_id, 0.0), default=None)
+
+    def stats(step_id: str) -> Dict[str, Any]:
+        entry = history.get(step_id, {})
+        return {
+            "step_id": step_id,
+            "samples": entry.get('samples', 0),
+            "p50_seconds": entry.get('p50_seconds'),
+            "p90_seconds": entry.get('p90_seconds'),
+            "max_seconds": entry.get('max_seconds'),
+            "queue_p50_seconds": entry.get('queue_p50_seconds'),
+            "queue_p90_seconds": entry.get('queue_p90_seconds'),
+        }
+
+    step_ids = [s['id'] for s in steps]
+    with_history = [step_id for step_id in step_ids if history.get(step_id, {}).get('p90_seconds') is not None]
+    slowest = sorted(with_history, key=lambda step_id: -history[step_id]['p90_seconds'])[:top]
+    return {
+        "critical_path": [stats(step_id) for step_id in path],
+        "critical_path_seconds": lengths.get(path[0], 0.0) if path else 0.0,
+        "slowest_steps": [stats(step_id) for step_id in slowest],
+        "steps_without_history": [step_id for step_id in step_ids if step_id not in durations],
+    }
+
+
+def get_flow_report(flow_repo, step_history, account: str, flow_id: str, top: int = 5) -> Dict[str, Any]:
+    """
+    Informe de un flujo a partir de su definición y su histórico.
+
+    Args:
+        flow_repo: Repositorio de definiciones
+        step_history: Repositorio del histórico de pasos
+        account: Cuenta/organización
+        flow_id: ID del flujo
+        top: Número de pasos lentos a listar
+
+    Returns:
+        dict: Informe (status 'error' si el flujo no tiene definición)
+    """
+    definition: Optional[Dict[str, Any]] = flow_repo.get_flow_definition(account, flow_id)
+    if not definition:
+        return {"status": "error", "error": f"Flow definition not found for {account}/{flow_id}"}
+    report = build_flow_report(normalize_steps(definition), step_history.get_history(account, flow_id), top)
+    return {"status": "success", "account": account, "flow_id": flow_id, **report}
+
@@ -0,0 +1,31 @@
+"""
+Informe de rendimiento de un flujo desde línea de comandos.
+
+Lee la definición y el histórico de duraciones del flujo en GCS (con la
+configuración del entorno, como la Cloud Function) e imprime el informe de
+flows.report: camino crítico esperado y pasos más lentos por p90.
+
+Uso:
+    python -m flows.report_cli --account acme --flow-id daily_sales --top 10
+"""
+import argparse
+import json
+
+from core.container import Container
+from flows.report import get_flow_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--account', required=True, help='Cuenta/organización')
+    parser.add_argument('--flow-id', required=True, help='ID del flujo')
+    parser.add_argument('--top', type=int, default=5, help='Pasos lentos a listar')
+    args = parser.parse_args()
+
+    container = Container()
+    report = get_flow_report(container.flow_repo, container.step_history, args.account, args.flow_id, args.top)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Reanudación de un run fallido desde el punto de fallo.
+
+Los pasos fallidos (failed/timeout) y todos sus descendientes vuelven a
+'pending'; los pasos completados conservan su estado y su resultado. Los pasos
+que ya se ejecutaron incrementan su 'attempt', de modo que los callbacks del
+nuevo intento no se confunden con los del anterior en el registro de
+idempotencia.
+"""
+import logging
+from typing import List
+
+from flows.graph import RUN_GRAPH_KEY, compile_run_graph
+from flows.retries import RETRY_AT_KEY, RETRY_WAIT_STATUS
+from flows.timeouts import TIMEOUT_DEADLINE_KEY
+
+logger = logging.getLogger(__name__)
+
+FAILED_STATUSES = ('failed', 'timeout', RETRY_WAIT_STATUS)
+
+# Campos de ejecución que se descartan al volver un paso a 'pending'
+_EXECUTION_FIELDS = (
+    'result', 'error', 'started_at', 'completed_at', 'timeout_at', 'queued_at', 'admitted_at',
+    'cached', 'cached_from_run', TIMEOUT_DEADLINE_KEY, RETRY_AT_KEY
+)
+
+
+def reset_for_resume(flow_state: dict) -> List[str]:
+    """
+    Devuelve a 'pending' los pasos fallidos y sus descendientes y recompila el grafo.
+
+    Args:
+        flow_state: Estado de ejecución del flujo (se modifica en sitio)
+
+    Returns:
+        list: Ids de los pasos reiniciados, en el orden de la definición
+    """
+    steps = flow_state.get('flow_config', {}).get('steps', [])
+    dependents = {}
+    for step in steps:
+        for dependency in step.get('depends_on', []) or []:
+            dependents.setdefault(dependency, []).append(step.get('id'))
+
+    pending = [step['id'] for step in steps if step.get('status') in FAILED_STATUSES]
+    to_reset = set()
+    while pending:
+        step_id = pending.pop()
+        if step_id in to_reset:
+            continue
+        to_reset.add(step_id)
+        pending.extend(dependents.get(step_id, []))
+
+    reset = []
+    for step in steps:
+        # Un descendiente aún en ejecución (fallo en una rama paralela) se deja terminar
+        if step.get('id') not in to_reset or step.get('status') in ('running', 'queued'):
+            continue
+        if step.get('status') in ('failed', 'timeout', 'completed'):
+            # Un paso en 'retry_wait' ya tiene su intento incrementado
+            step['attempt'] = step.get('attempt', 1) + 1
+        step['status'] = 'pending'
+        for field in _EXECUTION_FIELDS:
+            step.pop(field, None)
+        reset.append(step['id'])
+
+    flow_state[RUN_GRAPH_KEY] = compile_run_graph(steps)
+    return reset
@@ -0,0 +1,130 @@
+"""
+Reintentos de pasos con backoff exponencial y jitter.
+
+Política por paso (clave ``retry``), con valores por defecto de configuración:
+
+    "retry": {
+        "max_attempts": 3,                 # intentos totales, incluido el primero
+        "base_delay_seconds": 60,          # espera antes del 2º intento
+        "max_delay_seconds": 900,          # tope de la espera
+        "jitter": 0.5,                     # fracción aleatoria que se resta a la espera
+        "retryable_errors": ["Timeout", "ConnectionError"]   # vacío = cualquier error
+    }
+
+La clase de error se toma del ``result`` del callback (``error_class``,
+``error_type`` o ``error_code``). Un paso a reintentar queda en estado
+'retry_wait' con ``retry_at``; su marcador en el índice de pasos en ejecución
+usa ``retry_at`` como fecha, y el barrido programado lo vuelve a despachar.
+"""
+import logging
+import random
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from core.config import config
+from flows.graph import record_transition
+
+logger = logging.getLogger(__name__)
+
+RETRY_WAIT_STATUS = 'retry_wait'
+RETRY_AT_KEY = 'retry_at'
+
+
+def retry_policy(step: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Política de reintentos del paso combinada con los valores por defecto.
+
+    Args:
+        step: Paso del flujo
+
+    Returns:
+        dict: max_attempts, base_delay_seconds, max_delay_seconds, jitter y retryable_errors
+    """
+    policy = {
+        "max_attempts": config.RETRY_MAX_ATTEMPTS,
+        "base_delay_seconds": config.RETRY_BASE_DELAY_SECONDS,
+        "max_delay_seconds": config.RETRY_MAX_DELAY_SECONDS,
+        "jitter": config.RETRY_JITTER,
+        "retryable_errors": list(config.RETRY_RETRYABLE_ERRORS),
+    }
+    if isinstance(step.get('retry'), dict):
+        policy.update({key: value for key, value in step['retry'].items() if key in policy})
+    return policy
+
+
+def error_class(result: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Clase de error reportada por el callback.
+
+    Args:
+        result: Resultado del callback
+
+    Returns:
+        str: Clase de error o None si no se reporta
+    """
+    result = result or {}
+    value = result.get('error_class') or result.get('error_type') or result.get('error_code')
+    return str(value) if value is not None else None
+
+
+def should_retry(step: Dict[str, Any], result: Optional[Dict[str, Any]]) -> bool:
+    """
+    Indica si un fallo del paso debe reintentarse.
+
+    Args:
+        step: Paso fallido
+        result: Resultado del callback de fallo
+
+    Returns:
+        bool: True si quedan intentos y el error es reintentable
+    """
+    policy = retry_policy(step)
+    if step.get('attempt', 1) >= int(policy['max_attempts']):
+        return False
+    retryable = policy['retryable_errors']
+    return not retryable or error_class(result) in retryable
+
+
+def retry_delay_seconds(policy: Dict[str, Any], attempt: int) -> float:
+    """
+    Espera antes del siguiente intento: base * 2^(intento-1), con tope y jitter.
+
+    Args:
+        policy: Política de reintentos
+        attempt: Intento que acaba de fallar (1 = primero)
+
+    Returns:
+        float: Segundos de espera
+    """
+    delay = min(float(policy['max_delay_seconds']), float(policy['base_delay_seconds']) * (2 ** (attempt - 1)))
+    jitter = min(max(float(policy['jitter']), 0.0), 1.0)
+    return delay * random.uniform(1.0 - jitter, 1.0)
+
+
+def schedule_retry(graph: dict, step: Dict[str, Any], result: Optional[Dict[str, Any]], now: datetime) -> int:
+    """
+    Pasa un paso fallido a 'retry_wait' e incrementa su intento.
+
+    Args:
+        graph: Grafo compilado
+        step: Paso fallido (estado 'failed')
+        result: Resultado del callback de fallo
+        now: Instante actual
+
+    Returns:
+        int: Momento del reintento (epoch en segundos)
+    """
+    attempt = step.get('attempt', 1)
+    retry_at = int(now.timestamp() + retry_delay_seconds(retry_policy(step), attempt))
+    step.setdefault('attempts_history', []).append({
+        "attempt": attempt,
+        "error_class": error_class(result),
+        "error": (result or {}).get('message'),
+        "failed_at": now.isoformat()
+    })
+    previous_status = step.get('status')
+    step['status'] = RETRY_WAIT_STATUS
+    step['attempt'] = attempt + 1
+    step[RETRY_AT_KEY] = retry_at
+    record_transition(graph, step['id'], previous_status, RETRY_WAIT_STATUS)
+    return retry_at
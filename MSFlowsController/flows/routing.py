@@ -0,0 +1,123 @@
+"""
+Índice de enrutamiento de callbacks a pasos.
+
+Cuando un callback llega sin task_id hay que deducir a qué paso corresponde a
+partir de su tipo (step/topic/source) y de los valores de configuración que
+devuelve. El índice se construye una vez por ejecución y se guarda en el estado
+del run (clave ``routing_index``):
+
+    {tipo: {"keys": [claves que distinguen los pasos de ese tipo],
+            "routes": {firma de esos valores: [ids de paso]}}}
+
+Así, resolver un callback es una búsqueda directa en lugar de puntuar todos los
+pasos. Los pasos del mismo tipo que no se pueden distinguir por su configuración
+se reportan al construir el índice (inicio del flujo).
+"""
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROUTING_INDEX_KEY = 'routing_index'
+
+
+def flatten_scalars(data: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Devuelve los valores escalares de primer nivel de un diccionario como texto.
+
+    Args:
+        data: Diccionario a aplanar
+
+    Returns:
+        dict: Clave -> valor como texto
+    """
+    flat = {}
+    for key, value in (data or {}).items():
+        if isinstance(value, (str, int, float, bool)) and value is not None:
+            flat[key] = str(value)
+    return flat
+
+
+def _route_signature(fields: Dict[str, str], keys: List[str]) -> str:
+    return json.dumps([fields.get(key) for key in keys])
+
+
+def build_routing_index(steps: list) -> Tuple[dict, List[dict]]:
+    """
+    Construye el índice de enrutamiento de los pasos de un flujo.
+
+    Para cada tipo, las claves distintivas son las claves escalares de configuración
+    cuyo valor difiere entre los pasos de ese tipo.
+
+    Args:
+        steps: Lista de pasos normalizados
+
+    Returns:
+        tuple: (índice, ambigüedades). Cada ambigüedad es
+            {"type", "steps", "keys"} con pasos que comparten firma.
+    """
+    by_type: Dict[str, List[dict]] = {}
+    for step in steps:
+        if step.get('id'):
+            by_type.setdefault(step.get('type'), []).append(step)
+
+    index: Dict[str, dict] = {}
+    ambiguities: List[dict] = []
+    for step_type, group in by_type.items():
+        configs = [flatten_scalars(step.get('config')) for step in group]
+        keys: List[str] = []
+        if len(group) > 1:
+            all_keys = sorted(set().union(*configs))
+            keys = [key for key in all_keys if len({config.get(key) for config in configs}) > 1]
+
+        routes: Dict[str, List[str]] = {}
+        for step, step_config in zip(group, configs):
+            routes.setdefault(_route_signature(step_config, keys), []).append(step['id'])
+
+        for step_ids in routes.values():
+            if len(step_ids) > 1:
+                ambiguities.append({"type": step_type, "steps": step_ids, "keys": keys})
+        index[str(step_type)] = {"keys": keys, "routes": routes}
+
+    for ambiguity in ambiguities:
+        logger.warning(
+            f"⚠️ Pasos de tipo '{ambiguity['type']}' indistinguibles por configuración: {ambiguity['steps']}; "
+            f"los callbacks sin task_id se asignarán por estado (running antes que pending)"
+        )
+    return index, ambiguities
+
+
+def get_routing_index(flow_state: dict) -> dict:
+    """
+    Obtiene el índice persistido en el estado, construyéndolo si no existe (estados antiguos).
+
+    Args:
+        flow_state: Estado de ejecución del flujo
+
+    Returns:
+        dict: Índice de enrutamiento
+    """
+    routing_index = flow_state.get(ROUTING_INDEX_KEY)
+    if routing_index is None:
+        routing_index, _ = build_routing_index(flow_state.get('flow_config', {}).get('steps', []))
+        flow_state[ROUTING_INDEX_KEY] = routing_index
+    return routing_index
+
+
+def resolve_route(routing_index: dict, step_type: str, fields: Dict[str, str]) -> Optional[List[str]]:
+    """
+    Busca los pasos que corresponden a un callback.
+
+    Args:
+        routing_index: Índice de enrutamiento
+        step_type: Tipo de paso indicado por el callback
+        fields: Campos escalares del callback (mensaje y resultado)
+
+    Returns:
+        list: Ids de los pasos candidatos, o None si el índice no lo resuelve
+    """
+    entry = routing_index.get(step_type)
+    if entry is None:
+        return None
+    return entry['routes'].get(_route_signature(fields, entry['keys']))
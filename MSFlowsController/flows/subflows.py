@@ -0,0 +1,124 @@
+"""
+Pasos 'subflow': ejecución de otra definición como run hijo enlazado al run padre.
+
+    {"id": "kpi_chain", "type": "subflow", "depends_on": ["extract"],
+     "config": {
+         "flow_id": "extractor_dbt_qlik",   # definición en graphs/{account}/{flow_id}.json
+         "account": "acme",                 # opcional: por defecto, la cuenta del run padre
+         "context": {"source": "pms"}       # opcional: contexto inicial del run hijo
+     }}
+
+Despachar el paso publica un mensaje de arranque para el propio controlador. El
+run hijo tiene un id determinista (``{run padre}.{paso}.{intento}``), de modo
+que un mensaje de arranque reentregado no crea otro run, y guarda el enlace a su
+padre (``parent_run``). Cuando el run hijo termina, su resultado se publica como
+el callback del paso padre.
+"""
+from typing import Any, Dict, Optional
+
+from core.exceptions import FlowConfigurationError
+
+SUBFLOW_STEP_TYPE = 'subflow'
+PARENT_RUN_KEY = 'parent_run'
+CHILD_RUN_KEY = 'child_run_id'
+
+# Acción del mensaje de arranque de un run hijo
+START_SUBFLOW_ACTION = 'start_subflow'
+
+
+def is_subflow_step(step: Dict[str, Any]) -> bool:
+    return step.get('type') == SUBFLOW_STEP_TYPE
+
+
+def normalize_subflow_step(step: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida que un paso subflow indique la definición a ejecutar.
+
+    Raises:
+        FlowConfigurationError: Si falta config.flow_id
+    """
+    if not (step.get('config') or {}).get('flow_id'):
+        raise FlowConfigurationError(f"Sub-flow step '{step.get('id')}' requires config.flow_id")
+    return step
+
+
+def child_run_id(parent_run_id: str, step: Dict[str, Any]) -> str:
+    """
+    Id del run hijo de un paso subflow: estable para cada intento del paso.
+
+    Args:
+        parent_run_id: Id del run padre
+        step: Paso subflow
+
+    Returns:
+        str: Id del run hijo
+    """
+    return f"{parent_run_id}.{step['id']}.{step.get('attempt', 1)}"
+
+
+def build_subflow_start(flow_id: str, run_id: str, flow_state: dict, step: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Mensaje de arranque del run hijo de un paso subflow.
+
+    Args:
+        flow_id: Id del flujo padre
+        run_id: Id del run padre
+        flow_state: Estado del run padre
+        step: Paso subflow
+
+    Returns:
+        dict: Mensaje para el controlador
+    """
+    subflow_config = step.get('config') or {}
+    depth = (flow_state.get(PARENT_RUN_KEY) or {}).get('depth', 0) + 1
+    return {
+        "action": START_SUBFLOW_ACTION,
+        "flow_id": subflow_config.get('flow_id'),
+        "account": subflow_config.get('account') or flow_state.get('account'),
+        "subflow_run_id": child_run_id(run_id, step),
+        "context": {**(subflow_config.get('context') or {}), "parent_flow_id": flow_id, "parent_run_id": run_id},
+        PARENT_RUN_KEY: {
+            "flow_id": flow_id,
+            "run_id": run_id,
+            "account": flow_state.get('account'),
+            "task_id": step['id'],
+            "depth": depth
+        }
+    }
+
+
+def build_parent_callback(flow_state: dict) -> Optional[Dict[str, Any]]:
+    """
+    Callback del paso padre a partir de un run hijo terminado.
+
+    El resultado incluye el id del run hijo y los resultados de sus pasos finales
+    (los que no tienen dependientes).
+
+    Args:
+        flow_state: Estado del run hijo, en estado 'completed' o 'error'
+
+    Returns:
+        dict: Mensaje de callback, o None si el run no es hijo de otro
+    """
+    parent = flow_state.get(PARENT_RUN_KEY)
+    if not parent:
+        return None
+    steps = flow_state.get('flow_config', {}).get('steps', [])
+    upstream = {dependency for step in steps for dependency in step.get('depends_on', []) or []}
+    completed = flow_state.get('status') == 'completed'
+    result = {
+        "subflow_id": flow_state.get('flow_id'),
+        "subflow_run_id": flow_state.get('run_id'),
+        "results": {step['id']: step.get('result') for step in steps if step.get('id') not in upstream and not step.get('map_parent')}
+    }
+    if not completed:
+        result["message"] = flow_state.get('error', 'Sub-flow failed')
+        result["error_class"] = "SubflowFailed"
+    return {
+        "flow_id": parent['flow_id'],
+        "run_id": parent['run_id'],
+        "account": parent.get('account'),
+        "task_id": parent['task_id'],
+        "status": "completed" if completed else "failed",
+        "result": result
+    }
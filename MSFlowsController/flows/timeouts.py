@@ -0,0 +1,66 @@
+"""
+Fechas límite y expiración de pasos en ejecución.
+
+Cada paso puede definir su propio ``timeout_minutes``; si no lo hace se usa
+STEP_TIMEOUT_MINUTES. La fecha límite (epoch en segundos) se guarda en el paso
+(``timeout_deadline``) al pasar a 'running' y es la que usa el índice de pasos
+en ejecución.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from core.config import config
+from flows.graph import record_transition
+
+TIMEOUT_DEADLINE_KEY = 'timeout_deadline'
+
+
+def step_timeout_minutes(step: dict) -> float:
+    """
+    Timeout del paso en minutos.
+
+    Args:
+        step: Paso del flujo
+
+    Returns:
+        float: Minutos configurados en el paso o el valor por defecto
+    """
+    timeout = step.get('timeout_minutes')
+    return float(timeout) if timeout else float(config.STEP_TIMEOUT_MINUTES)
+
+
+def compute_deadline(step: dict, started_at: datetime) -> int:
+    """
+    Calcula la fecha límite del paso.
+
+    Args:
+        step: Paso del flujo
+        started_at: Inicio de la ejecución del paso
+
+    Returns:
+        int: Fecha límite (epoch en segundos)
+    """
+    return int((started_at + timedelta(minutes=step_timeout_minutes(step))).timestamp())
+
+
+def expire_step(flow_state: dict, graph: dict, step: dict, now: datetime, started_at: Optional[datetime] = None):
+    """
+    Marca un paso en ejecución como 'timeout'.
+
+    Args:
+        flow_state: Estado de ejecución del flujo
+        graph: Grafo compilado
+        step: Paso a expirar
+        now: Instante actual
+        started_at: Inicio del paso, para el mensaje de error
+    """
+    if started_at is None and isinstance(step.get('started_at'), str):
+        started_at = datetime.fromisoformat(step['started_at'].replace('Z', '+00:00'))
+    elapsed_minutes = (now - started_at).total_seconds() / 60 if started_at else step_timeout_minutes(step)
+
+    step['status'] = 'timeout'
+    step['timeout_at'] = now.isoformat()
+    step['error'] = f"Timeout after {elapsed_minutes:.1f} minutes"
+    record_transition(graph, step['id'], 'running', 'timeout')
+    counts = graph.get('counts', {})
+    flow_state['failed_steps_count'] = counts.get('failed', 0) + counts.get('timeout', 0)
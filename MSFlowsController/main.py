@@ -1,55 +1,52 @@
 """
 Main entry point for the FlowController Cloud Function.
 """
+import time
+_import_started = time.perf_counter()
+
 import logging
-from functions_framework import cloud_event
+from functions_framework import cloud_event, http
 
-from core.utils.message_utils import decode_message_data, extract_flow_identifiers
-from core.handlers.flow_handlers import FlowStartHandler, FlowContinuationHandler
-from core.handlers.callback_handler import CallbackHandler
-from core.services.publisher import PubSubPublisher
-from core.services.dynamic_flow_service import DynamicFlowService
-from storage.repositories import FlowDefinitionRepository, FlowRunStateRepository
-from core.notifications import NotificationService
-from worker.flowscontroller import FlowController
+from core.config import config
+from core.container import Container
+from core.utils.message_utils import decode_message_data, extract_flow_identifiers, get_message_id
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Dependency Injection Wiring ---
+# Components (and the GCP clients they share) are built lazily on first use,
+# so each invocation only pays for the path it takes.
+container = Container()
 
-# 1. Infrastructure / Repositories
-publisher = PubSubPublisher()
-flow_repo = FlowDefinitionRepository()
-state_repo = FlowRunStateRepository()
-notification_service = NotificationService()
-
-# 2. Domain Services
-dynamic_flow_service = DynamicFlowService(
-    flow_repo=flow_repo,
-    state_repo=state_repo,
-    publisher=publisher
-)
-classic_flow_controller = FlowController() # Legacy controller
+if config.STARTUP_PROFILE:
+    logger.info(f"⏱️ STARTUP - main imported in {(time.perf_counter() - _import_started) * 1000:.1f} ms")
 
-# 3. Handlers
-flow_start_handler = FlowStartHandler(
-    dynamic_flow_service=dynamic_flow_service,
-    classic_flow_controller=classic_flow_controller
-)
-
-flow_continuation_handler = FlowContinuationHandler(
-    dynamic_flow_service=dynamic_flow_service
-)
+# -----------------------------------
 
-callback_handler = CallbackHandler(
-    state_repo=state_repo,
-    notification_service=notification_service,
-    publisher=publisher
-)
+def list_runs(params) -> dict:
+    """
+    Queries the run index with the filters of a message or an HTTP request.
+    
+    Args:
+        params: Mapping with optional account, flow_id, status (list or comma-separated),
+            since, until (ISO 8601) and limit.
+    """
+    statuses = params.get('status') or None
+    if isinstance(statuses, str):
+        statuses = [status.strip() for status in statuses.split(',') if status.strip()]
+    limit = params.get('limit')
+    runs = container.run_index.list_runs(
+        account=params.get('account'),
+        flow_id=params.get('flow_id'),
+        statuses=statuses,
+        since=params.get('since'),
+        until=params.get('until'),
+        limit=int(limit) if limit else None
+    )
+    return {"status": "success", "count": len(runs), "runs": runs}
 
-# -----------------------------------
 
 @cloud_event
 def FlowWorker(cloud_event):
@@ -72,20 +69,57 @@ def FlowWorker(cloud_event):
         flow_id, account, task_id, run_id = extract_flow_identifiers(message_json)
         
         # Determine processing type and execute
-        if not task_id and not run_id:
+        if message_json.get('action') == 'sweep_timeouts':
+            # Scheduled (Cloud Scheduler) pass over the running-steps index
+            logger.info("⏰ Processing timeout sweep")
+            return container.timeout_sweeper.sweep()
+        elif message_json.get('action') == 'resume':
+            # Re-run a failed run from the point of failure, keeping its run_id
+            logger.info(f"🔁 Processing run resume: {flow_id}/{run_id}")
+            return container.resume_handler.handle_resume(flow_id, run_id)
+        elif message_json.get('action') == 'flow_report':
+            # Critical path and slowest steps from the step-duration history
+            logger.info(f"📈 Processing flow report: {account}/{flow_id}")
+            from flows.report import get_flow_report
+            return get_flow_report(container.flow_repo, container.step_history, account, flow_id, message_json.get('top', 5))
+        elif message_json.get('action') == 'list_runs':
+            # Active and recent runs from the run index (no state documents are read)
+            logger.info(f"📋 Processing run listing: account={account}")
+            return list_runs(message_json)
+        elif message_json.get('action') == 'start_subflow':
+            # Child run of a sub-flow step, linked to its parent run
+            logger.info(f"🔗 Processing sub-flow start: {account}/{flow_id}")
+            return container.dynamic_flow_service.execute_subflow(message_json)
+        elif message_json.get('action') == 'batch_start':
+            # Several flow starts in one message (e.g. the morning scheduler run)
+            logger.info(f"📦 Processing batch start: {len(message_json.get('flows') or [])} flows")
+            return container.flow_start_handler.handle_batch_start(message_json)
+        elif not task_id and not run_id:
             # New flow start
             logger.info(f"Processing new flow start: {message_json}")
-            return flow_start_handler.handle_flow_start(message_json, flow_id, account)
+            return container.flow_start_handler.handle_flow_start(message_json, flow_id, account)
         elif message_json.get('status') in ['completed', 'failed', 'success']:
             logger.info(f"Processing Cloud Function callback: {message_json}")
             # Cloud Function callback (completed or failed)
             source_step = message_json.get('step') or message_json.get('topic') or message_json.get('source') or 'unknown'
             logger.info(f"🔄 Processing Cloud Function callback: status={message_json.get('status')}, step={source_step}")
-            return callback_handler.handle_task_callback(message_json)
+            return container.callback_handler.handle_task_callback(message_json, message_id=get_message_id(cloud_event))
         else:
             # Existing flow continuation
             logger.info(f"Processing existing flow continuation: {message_json}")
-            return flow_continuation_handler.handle_flow_continuation(message_json, flow_id, account, task_id, run_id)
+            return container.flow_continuation_handler.handle_flow_continuation(message_json, flow_id, account, task_id, run_id)
     except Exception as e:
         logger.error(f"Error processing event: {str(e)}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+@http
+def FlowRuns(request):
+    """
+    HTTP entry point for dashboards: lists runs from the run index.
+    Filters are taken from the query string (see list_runs).
+    """
+    try:
+        return list_runs(request.args)
+    except Exception as e:
+        logger.error(f"Error listing runs: {str(e)}", exc_info=True)
+        return {"status": "error", "error": str(e)}, 500
@@ -8,6 +8,8 @@ import logging
 from datetime import datetime, timezone
 from typing import Dict, Any, List, Optional, Union
 
+from flows.expressions import TEMPLATE_PATHS_KEY, find_template_paths, render_templates, render_value
+
 # Assuming publisher has a specific type, but for now using Any or duck typing
 # from google.cloud.pubsub_v1 import PublisherClient
 
@@ -57,6 +59,17 @@ class N8NLikeEngine:
                     logger.info(f"⏭️ Skipping step {step_id} - already completed")
                     continue
 
+                if step_status == 'queued':
+                    # Waiting for an admission slot: the controller dispatches it once admitted
+                    logger.info(f"🚦 Skipping step {step_id} - queued for admission")
+                    continue
+
+                if step.get('type') in ('map', 'subflow') or step.get('map_parent'):
+                    # Map and sub-flow steps are started by the controller: map children within the
+                    # map's parallelism, sub-flows as linked child runs
+                    logger.info(f"🗺️ Skipping step {step_id} - started by the controller")
+                    continue
+
                 if not dependencies:
                     logger.info(f"🚀 Executing initial step {step_id} (no dependencies)")
                     try:
@@ -199,26 +212,19 @@ class N8NLikeEngine:
     
     def _transform_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Transforms data using the current context.
+        Transforms data using the current context (see flows.expressions).
         """
-        transformed = {}
-        for k, v in data.items():
-            if isinstance(v, str) and v.startswith('{{') and v.endswith('}}'):
-                # Simple variable substitution
-                var_name = v[2:-2].strip()
-                transformed[k] = self.context.get(var_name, v)
-            else:
-                transformed[k] = v
-        return transformed
+        return render_templates(data, find_template_paths(data), self._scope())
 
     def _evaluate_expression(self, expression: str) -> Any:
         """
-        Evaluates a simple expression.
+        Evaluates an expression against the current context; compiled expressions are cached.
         """
-        if expression.startswith('{{') and expression.endswith('}}'):
-            var_name = expression[2:-2].strip()
-            return self.context.get(var_name, expression)
-        return expression
+        return render_value(expression, self._scope())
+
+    def _scope(self, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Names available to expressions: context keys, 'context' and the step's own 'config'."""
+        return {**self.context, 'context': self.context, 'config': config or {}}
 
     def _execute_data_transformation_step(self, step: Dict[str, Any]) -> Dict[str, Any]:
         """Executes a data transformation step."""
@@ -249,7 +255,9 @@ class N8NLikeEngine:
         """
         Executes a Cloud Function completely dynamically.
         """
+        # Templates were located when the definition was normalized; only those paths are rendered
         config = step.get('config', {})
+        config = render_templates(config, step.get(TEMPLATE_PATHS_KEY), self._scope(config))
         step_type = step.get('type', 'cloud_function')
         step_name = step.get('name', 'unnamed_step')
         
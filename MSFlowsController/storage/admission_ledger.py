@@ -0,0 +1,122 @@
+"""
+Registro compartido de admisión de pasos (límites de concurrencia).
+
+El registro se reparte en un documento por ámbito de límite, en el bucket de
+runs; cada uno guarda los pasos que ocupan un hueco de ese ámbito y la cola de
+los que esperan por él:
+
+    admission/global.json            (solo con ADMISSION_GLOBAL_LIMIT)
+    admission/account/{account}.json
+    admission/topic/{topic}.json
+
+    = {"running": {clave: entrada}, "queue": [entrada, ...]}
+
+Cada modificación es un compare-and-swap sobre la generación del blob: si otro
+proceso escribió antes, se relee el documento y se reaplica el cambio. Las
+modificaciones que no cambian el documento no se escriben.
+
+Ritmo de escritura esperado: admitir o liberar un paso escribe una vez en el
+documento de cada ámbito limitado que le afecta (su topic, su cuenta y, si hay
+límite global, el global); los pasos de cuentas y topics sin límite no tocan el
+registro. Cloud Storage admite del orden de una escritura por segundo sostenida
+en un mismo objeto, así que cada documento aguanta aproximadamente un arranque
+o fin de paso por segundo de su cuenta o topic, con picos absorbidos por los
+reintentos. Un límite global concentra todas las escrituras en un único objeto:
+para ráfagas como la de la mañana conviene limitar por cuenta y por topic.
+"""
+import json
+import logging
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+from google.api_core.exceptions import NotFound, PreconditionFailed, TooManyRequests
+
+from core.config import config
+from core.exceptions import StateConflictError
+from storage.repositories import StorageRepository
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_LEDGER_PREFIX = 'admission/'
+
+# Espera máxima (segundos) entre reintentos por conflicto, multiplicada por el número de intento
+LEDGER_CONFLICT_BACKOFF_SECONDS = 0.02
+
+
+class AdmissionLedger(StorageRepository):
+    """Documentos de admisión por ámbito con actualizaciones compare-and-swap."""
+
+    def _blob_name(self, scope: str) -> str:
+        return f"{ADMISSION_LEDGER_PREFIX}{scope}.json"
+
+    def read(self, scope: str) -> Dict[str, Any]:
+        """
+        Lee el documento de admisión de un ámbito.
+
+        Args:
+            scope: Ámbito ('global', 'account/{account}' o 'topic/{topic}')
+
+        Returns:
+            dict: {"running": {...}, "queue": [...]}
+        """
+        document, _ = self._read(scope)
+        return document
+
+    def scopes(self) -> List[str]:
+        """Ámbitos con documento de admisión."""
+        bucket = self._get_bucket(config.RUNS_BUCKET)
+        return [
+            blob.name[len(ADMISSION_LEDGER_PREFIX):-len('.json')]
+            for blob in bucket.list_blobs(prefix=ADMISSION_LEDGER_PREFIX)
+            if blob.name.endswith('.json')
+        ]
+
+    def update(self, scope: str, mutator: Callable[[Dict[str, Any]], Any]) -> Any:
+        """
+        Aplica 'mutator' sobre el documento de un ámbito y lo guarda de forma condicional.
+
+        El mutator recibe el documento actual, lo modifica en sitio y devuelve el
+        resultado de la operación; puede ejecutarse varias veces si hay conflictos.
+
+        Args:
+            scope: Ámbito del documento
+            mutator: Función que modifica el documento
+
+        Returns:
+            Resultado devuelto por el mutator en el intento que se guardó
+
+        Raises:
+            StateConflictError: Si se agotan los reintentos
+        """
+        blob_name = self._blob_name(scope)
+        bucket = self._get_bucket(config.RUNS_BUCKET)
+        for attempt in range(1, config.ADMISSION_LEDGER_MAX_ATTEMPTS + 1):
+            document, generation = self._read(scope)
+            before = json.dumps(document, separators=(',', ':'), sort_keys=True)
+            result = mutator(document)
+            content = json.dumps(document, separators=(',', ':'), sort_keys=True)
+            if content == before:
+                return result
+            try:
+                bucket.blob(blob_name).upload_from_string(
+                    content,
+                    content_type='application/json',
+                    if_generation_match=generation
+                )
+                return result
+            except (PreconditionFailed, TooManyRequests):
+                logger.info(f"Conflicto en el registro de admisión {scope} (intento {attempt}); se reintenta")
+                time.sleep(random.uniform(0, LEDGER_CONFLICT_BACKOFF_SECONDS * attempt))
+        raise StateConflictError(f"Admission ledger {scope} was modified concurrently too many times")
+
+    def _read(self, scope: str):
+        blob = self._get_bucket(config.RUNS_BUCKET).blob(self._blob_name(scope))
+        try:
+            document = json.loads(blob.download_as_text())
+            generation = blob.generation
+        except NotFound:
+            document, generation = {}, 0
+        document.setdefault('running', {})
+        document.setdefault('queue', [])
+        return document, generation
@@ -0,0 +1,286 @@
+"""
+Almacén de estados de ejecución basado en eventos (append-only).
+
+En lugar de reescribir el JSON completo del run en cada callback, cada guardado
+añade un objeto de evento pequeño e inmutable con las diferencias respecto al
+último estado conocido. El estado actual se reconstruye a partir de un snapshot
+periódico más los eventos posteriores.
+
+Cada evento es un objeto nuevo creado con if_generation_match=0, por lo que
+ninguna escritura sobrescribe a otra. Dos escritores que compiten por el mismo
+número de secuencia no pueden tener éxito ambos: el perdedor recibe
+StateConflictError y reaplica su cambio (pequeño) sobre el estado actualizado.
+
+Estructura en el bucket de runs:
+    flow-runs/{flow_id}/{run_id}/snapshot.json
+    flow-runs/{flow_id}/{run_id}/events/{secuencia}.json
+"""
+import copy
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Tuple
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from core.config import config
+from core.exceptions import StateConflictError
+from core.utils.codecs import decode
+from flows.graph import RUN_GRAPH_KEY, compile_run_graph
+from storage.repositories import RETRYABLE_WRITE_ERRORS, STATE_GENERATION_KEY, FlowRunStateRepository
+
+logger = logging.getLogger(__name__)
+
+# Número máximo de estados base (último estado conocido por run) mantenidos en memoria
+BASELINE_CACHE_SIZE = 128
+
+# Dígitos del número de secuencia en el nombre de los eventos (orden lexicográfico = orden de aplicación)
+EVENT_SEQUENCE_DIGITS = 10
+
+
+def diff_state(old: Any, new: Any, path: Optional[list] = None) -> List[list]:
+    """
+    Calcula las operaciones que transforman 'old' en 'new'.
+
+    Los diccionarios se comparan clave a clave y las listas de igual longitud
+    elemento a elemento, de modo que el cambio de estado de un paso produce
+    solo las operaciones de ese paso.
+
+    Args:
+        old: Valor anterior
+        new: Valor nuevo
+        path: Ruta actual dentro del estado
+
+    Returns:
+        list: Operaciones ["set", ruta, valor] o ["del", ruta]
+    """
+    path = path or []
+    ops: List[list] = []
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            if key not in old:
+                ops.append(["set", path + [key], value])
+            elif old[key] != value:
+                ops.extend(diff_state(old[key], value, path + [key]))
+        for key in old:
+            if key not in new:
+                ops.append(["del", path + [key]])
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new) and path:
+        for position, (old_item, new_item) in enumerate(zip(old, new)):
+            if old_item != new_item:
+                ops.extend(diff_state(old_item, new_item, path + [position]))
+    else:
+        ops.append(["set", path, new])
+    return ops
+
+
+def apply_ops(state: dict, ops: List[list]) -> dict:
+    """
+    Aplica sobre el estado las operaciones generadas por diff_state.
+
+    Args:
+        state: Estado a modificar
+        ops: Operaciones a aplicar
+
+    Returns:
+        dict: Estado modificado
+    """
+    for op in ops:
+        action, path = op[0], op[1]
+        if not path:
+            state = copy.deepcopy(op[2])
+            continue
+        target = state
+        for key in path[:-1]:
+            target = target[key]
+        if action == "set":
+            target[path[-1]] = op[2]
+        elif action == "del":
+            try:
+                del target[path[-1]]
+            except (KeyError, IndexError):
+                pass
+    return state
+
+
+class FlowRunEventStore(FlowRunStateRepository):
+    """Repositorio de estados de ejecución con log de eventos append-only."""
+
+    def __init__(self, storage_client=None, run_index=None):
+        super().__init__(storage_client, run_index=run_index)
+        self.snapshot_interval = config.EVENT_SNAPSHOT_INTERVAL
+        # Los estados base son por hilo: cada petición concurrente diffea contra lo que ella leyó
+        self._local = threading.local()
+
+    def _run_prefix(self, flow_id: str, run_id: str) -> str:
+        return f"flow-runs/{flow_id}/{run_id}"
+
+    def get_flow_run_state(self, flow_id: str, run_id: str) -> dict:
+        """
+        Reconstruye el estado a partir del último snapshot y los eventos posteriores.
+
+        Args:
+            flow_id: ID del flujo
+            run_id: ID de la ejecución
+
+        Returns:
+            dict: Estado del flujo o None si no existe
+        """
+        try:
+            bucket = self._get_bucket(config.RUNS_BUCKET)
+            prefix = self._run_prefix(flow_id, run_id)
+            snapshot_blob = bucket.blob(f"{prefix}/snapshot.json")
+            try:
+                snapshot = decode(snapshot_blob.download_as_bytes(), snapshot_blob.content_type)
+            except NotFound:
+                snapshot = None
+
+            if snapshot is None:
+                # Runs creados con el formato de documento único (o clásico)
+                state = super().get_flow_run_state(flow_id, run_id)
+                if state is not None:
+                    state.pop(STATE_GENERATION_KEY, None)
+                    self._remember(flow_id, run_id, state, None, has_snapshot=False)
+                return state
+
+            state = snapshot["state"]
+            events = self._list_events_after(bucket, prefix, snapshot.get("last_event"))
+            for blob in events:
+                event = json.loads(blob.download_as_text())
+                state = apply_ops(state, event.get("ops", []))
+            last_event = events[-1].name if events else snapshot.get("last_event")
+
+            # El grafo es derivado: se recompila para que sea coherente con los estados de los pasos
+            if RUN_GRAPH_KEY in state:
+                state[RUN_GRAPH_KEY] = compile_run_graph(state.get('flow_config', {}).get('steps', []))
+
+            if len(events) >= self.snapshot_interval:
+                self._write_snapshot(snapshot_blob, state, last_event)
+
+            self._remember(flow_id, run_id, state, last_event, has_snapshot=True)
+            return state
+
+        except Exception as e:
+            logger.error(f"Error reconstruyendo estado de flujo {flow_id}/{run_id}: {str(e)}")
+            return None
+
+    def save_flow_run_state(self, flow_id: str, run_id: str, state: dict):
+        """
+        Añade un evento con las diferencias respecto al último estado conocido.
+        Si el run aún no tiene snapshot, el estado completo se guarda como snapshot inicial.
+
+        El evento se crea con el número de secuencia siguiente al último leído; si otro
+        proceso ya lo creó, no se escribe nada y se lanza StateConflictError para que
+        el llamador reaplique su cambio. Lo mismo ocurre si el estado se leyó sin
+        snapshot (documento único) y otro proceso ya lo ha creado.
+
+        Args:
+            flow_id: ID del flujo
+            run_id: ID de la ejecución
+            state: Estado a guardar
+
+        Raises:
+            StateConflictError: Si hay eventos (o un snapshot) posteriores a lo leído, o si
+                la escritura se rechazó por contención o indisponibilidad transitoria
+        """
+        try:
+            bucket = self._get_bucket(config.RUNS_BUCKET)
+            prefix = self._run_prefix(flow_id, run_id)
+            state.pop(STATE_GENERATION_KEY, None)
+            state['last_updated'] = datetime.now(timezone.utc).isoformat()
+            indexed = self._prepare_run_index(flow_id, run_id, state)
+
+            read = (flow_id, run_id) in self._baselines()
+            baseline, last_event, has_snapshot = self._baselines().get((flow_id, run_id), (None, None, False))
+            if not has_snapshot:
+                snapshot_blob = bucket.blob(f"{prefix}/snapshot.json")
+                # Run nuevo (o en formato de documento único): el estado completo pasa a ser el snapshot
+                if not snapshot_blob.exists() and self._write_snapshot(snapshot_blob, state, None, create_only=True):
+                    self._remember(flow_id, run_id, state, None, has_snapshot=True)
+                    logger.info(f"Snapshot inicial de flujo {flow_id}/{run_id} guardado en GCS")
+                    self._record_run_index(flow_id, run_id, state, indexed)
+                    return
+                if read:
+                    # Otro proceso creó el snapshot después de nuestra lectura: un diff contra
+                    # su estado revertiría sus cambios
+                    logger.warning(f"Snapshot de flujo {flow_id}/{run_id} creado por otro proceso; estado desactualizado")
+                    raise StateConflictError(f"Flow state {flow_id}/{run_id} has an unseen snapshot", flow_id, run_id)
+                # Guardado sin lectura previa: el estado se escribe sobre el último conocido
+                baseline = self.get_flow_run_state(flow_id, run_id) or {}
+                _, last_event, _ = self._baselines()[(flow_id, run_id)]
+
+            ops = [op for op in diff_state(baseline, state) if op[1][:1] != [RUN_GRAPH_KEY]]
+            if not ops:
+                return
+
+            sequence = self._event_sequence(last_event) + 1
+            event = {"ops": ops, "sequence": sequence, "recorded_at": state['last_updated']}
+            event_name = f"{prefix}/events/{sequence:0{EVENT_SEQUENCE_DIGITS}d}.json"
+            try:
+                bucket.blob(event_name).upload_from_string(
+                    json.dumps(event, separators=(',', ':')),
+                    content_type='application/json',
+                    if_generation_match=0
+                )
+            except (PreconditionFailed, *RETRYABLE_WRITE_ERRORS) as e:
+                logger.warning(f"Evento {sequence} de flujo {flow_id}/{run_id} no escrito ({str(e)}); estado desactualizado")
+                raise StateConflictError(f"Flow state {flow_id}/{run_id} has unseen events", flow_id, run_id) from e
+            self._remember(flow_id, run_id, state, event_name, has_snapshot=True)
+            logger.info(f"Evento de flujo {flow_id}/{run_id} añadido en GCS ({len(ops)} cambios)")
+            self._record_run_index(flow_id, run_id, state, indexed)
+
+        except StateConflictError:
+            raise
+        except RETRYABLE_WRITE_ERRORS as e:
+            logger.warning(f"Escritura rechazada guardando flujo {flow_id}/{run_id}: {str(e)}")
+            raise StateConflictError(f"Flow state {flow_id}/{run_id} could not be written", flow_id, run_id) from e
+        except Exception as e:
+            logger.error(f"Error guardando evento de flujo {flow_id}/{run_id}: {str(e)}")
+            raise
+
+    def _event_sequence(self, event_name: Optional[str]) -> int:
+        """Número de secuencia de un evento a partir de su nombre (0 si no hay eventos)."""
+        if not event_name:
+            return 0
+        return int(event_name.rsplit('/', 1)[-1].split('.', 1)[0])
+
+    def _list_events_after(self, bucket, prefix: str, last_event: Optional[str]) -> list:
+        """Lista, en orden, los eventos posteriores a last_event."""
+        last_event = last_event or ""
+        return [
+            blob for blob in bucket.list_blobs(prefix=f"{prefix}/events/", start_offset=last_event or None)
+            if blob.name > last_event
+        ]
+
+    def _write_snapshot(self, snapshot_blob, state: dict, last_event: Optional[str], create_only: bool = False) -> bool:
+        """Guarda un snapshot; si otro proceso lo hizo antes, se descarta sin error."""
+        content = self.codec.encode({"state": state, "last_event": last_event})
+        try:
+            if create_only:
+                snapshot_blob.upload_from_string(content, content_type=self.codec.content_type, if_generation_match=0)
+            else:
+                snapshot_blob.upload_from_string(
+                    content, content_type=self.codec.content_type, if_generation_match=snapshot_blob.generation
+                )
+        except PreconditionFailed:
+            logger.info(f"Snapshot {snapshot_blob.name} actualizado por otro proceso; se omite")
+            return False
+        return True
+
+    def _baselines(self) -> "OrderedDict[Tuple[str, str], Tuple[dict, Optional[str], bool]]":
+        """Estados base del hilo actual."""
+        baselines = getattr(self._local, 'baselines', None)
+        if baselines is None:
+            baselines = self._local.baselines = OrderedDict()
+        return baselines
+
+    def _remember(self, flow_id: str, run_id: str, state: dict, last_event: Optional[str], has_snapshot: bool):
+        """Guarda una copia del último estado conocido como base del siguiente diff."""
+        baselines = self._baselines()
+        key = (flow_id, run_id)
+        baselines[key] = (copy.deepcopy(state), last_event, has_snapshot)
+        baselines.move_to_end(key)
+        while len(baselines) > BASELINE_CACHE_SIZE:
+            baselines.popitem(last=False)
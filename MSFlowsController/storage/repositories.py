@@ -1,19 +1,85 @@
 """
 Repositorios para manejo de datos en Cloud Storage.
 """
+import copy
 import json
 import logging
+import threading
+import time
+from collections import OrderedDict
+from google.api_core.exceptions import NotFound, PreconditionFailed, ServiceUnavailable, TooManyRequests
 from google.cloud import storage
 from core.config import config
+from core.exceptions import StateConflictError
+from core.utils.codecs import decode, get_codec
+from flows.classic import STATE_LOCATION_KEY, classic_state_path, convert_classic_state
 
 logger = logging.getLogger(__name__)
 
+# Clave (no persistida) con la generación del blob desde el que se leyó el estado
+STATE_GENERATION_KEY = '_generation'
+
+# Errores de escritura por contención (429) o indisponibilidad (503) del objeto: como un
+# conflicto, el llamador debe releer el estado y reaplicar su cambio
+RETRYABLE_WRITE_ERRORS = (TooManyRequests, ServiceUnavailable)
+
+
+class _FlowDefinitionCache:
+    """
+    Caché LRU acotada de definiciones de flujo.
+    
+    Vive a nivel de módulo, por lo que se conserva entre invocaciones en caliente
+    de la Cloud Function. Cada entrada guarda la generación del blob y se revalida
+    contra GCS (una petición de metadatos) cuando supera el TTL.
+    """
+    
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: tuple):
+        """Devuelve (definición, generación, validada_en) o None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+    
+    def put(self, key: tuple, definition, generation):
+        """Guarda o revalida una entrada."""
+        with self._lock:
+            self._entries[key] = (definition, generation, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def discard(self, key: tuple):
+        """Elimina una entrada, si existe."""
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def is_fresh(self, entry) -> bool:
+        """Indica si la entrada está dentro del TTL y no requiere revalidación."""
+        return time.monotonic() - entry[2] < self.ttl_seconds
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_definition_cache = _FlowDefinitionCache(
+    max_size=config.FLOW_DEFINITION_CACHE_SIZE,
+    ttl_seconds=config.FLOW_DEFINITION_CACHE_TTL_SECONDS
+)
+
 
 class StorageRepository:
     """Repositorio base para operaciones de Cloud Storage."""
     
-    def __init__(self):
-        self.storage_client = storage.Client()
+    def __init__(self, storage_client=None):
+        self.storage_client = storage_client or storage.Client()
     
     def _get_bucket(self, bucket_name: str):
         """Obtiene un bucket de Cloud Storage."""
@@ -27,6 +93,11 @@ class FlowDefinitionRepository(StorageRepository):
         """
         Lee la definición del flujo desde Cloud Storage
         
+        Las definiciones se sirven desde una caché en memoria. Dentro del TTL no se
+        hace ninguna petición; después, una petición de metadatos revalida la
+        generación del blob y solo se descarga si ha cambiado. Las definiciones
+        que no existen no se cachean.
+        
         Args:
             account: Cuenta/organización
             flow_id: ID del flujo
@@ -35,18 +106,31 @@ class FlowDefinitionRepository(StorageRepository):
             dict: Definición del flujo o None si no existe
         """
         try:
-            bucket = self._get_bucket(config.FLOWS_BUCKET)
-            
             # Estructura organizada por cuenta
             blob_name = f"graphs/{account}/{flow_id}.json"
-            blob = bucket.blob(blob_name)
+            cache_key = (config.FLOWS_BUCKET, blob_name)
             
-            if blob.exists():
-                content = blob.download_as_text()
-                return json.loads(content)
-            else:
+            entry = _definition_cache.get(cache_key)
+            if entry is not None and _definition_cache.is_fresh(entry):
+                return copy.deepcopy(entry[0])
+            
+            bucket = self._get_bucket(config.FLOWS_BUCKET)
+            blob = bucket.get_blob(blob_name)
+            
+            if blob is None:
+                # Las ausencias no se cachean: una definición recién subida se ve en la siguiente lectura
+                _definition_cache.discard(cache_key)
                 logger.warning(f"Definición de flujo {flow_id} para cuenta {account} no encontrada en GCS")
                 return None
+            
+            if entry is not None and entry[1] == blob.generation:
+                # Sin cambios desde la última lectura: solo se renueva el TTL
+                _definition_cache.put(cache_key, entry[0], entry[1])
+                return copy.deepcopy(entry[0])
+            
+            definition = json.loads(blob.download_as_text())
+            _definition_cache.put(cache_key, definition, blob.generation)
+            return copy.deepcopy(definition)
                 
         except Exception as e:
             logger.error(f"Error leyendo definición de flujo {flow_id} para cuenta {account}: {str(e)}")
@@ -54,7 +138,27 @@ class FlowDefinitionRepository(StorageRepository):
 
 
 class FlowRunStateRepository(StorageRepository):
-    """Repositorio para estados de ejecución de flujos."""
+    """
+    Repositorio para estados de ejecución de flujos.
+    
+    El estado se escribe con el codec configurado (RUN_STATE_CODEC) y su content
+    type; al leer, el codec se deduce del content type del blob. Si se indica un
+    índice de runs (storage.run_index.RunIndex), se actualiza tras cada guardado.
+    """
+    
+    def __init__(self, storage_client=None, codec=None, run_index=None):
+        super().__init__(storage_client)
+        self.codec = codec or get_codec(config.RUN_STATE_CODEC)
+        self.run_index = run_index
+    
+    def _prepare_run_index(self, flow_id: str, run_id: str, state: dict):
+        """Anota en el estado la entrada del índice de runs a escribir; None si no hay que escribirla."""
+        return self.run_index.prepare(flow_id, run_id, state) if self.run_index else None
+    
+    def _record_run_index(self, flow_id: str, run_id: str, state: dict, previous):
+        """Escribe en el índice de runs la entrada preparada, una vez guardado el estado."""
+        if previous is not None:
+            self.run_index.record(flow_id, run_id, state, previous)
     
     def get_flow_run_state(self, flow_id: str, run_id: str) -> dict:
         """
@@ -75,23 +179,39 @@ class FlowRunStateRepository(StorageRepository):
             blob_name = f"flow-runs/{flow_id}/{run_id}.json"
             blob = bucket.blob(blob_name)
             
-            if blob.exists():
-                content = blob.download_as_text()
+            try:
+                content = blob.download_as_bytes()
+            except NotFound:
+                content = None
+            
+            if content is not None:
                 logger.info(f"Estado encontrado en formato dinámico: {blob_name}")
-                state = json.loads(content)
+                state = decode(content, blob.content_type)
+                # Generación leída, usada como precondición al guardar
+                state[STATE_GENERATION_KEY] = blob.generation
                 # Normalizar el estado para que sea compatible con CallbackHandler
                 return self._normalize_dynamic_state(state)
             
-            # PRIORIDAD 2: Buscar estado de ejecución en formato clásico (running/)
-            blob_name = f"running/{run_id}.json"
+            # PRIORIDAD 2: Run clásico (running/) aún sin convertir: se convierte una vez y
+            # el guardado del callback lo deja en flow-runs/, de donde se leerá en adelante
+            blob_name = classic_state_path(run_id)
             blob = bucket.blob(blob_name)
             
-            if blob.exists():
+            try:
                 content = blob.download_as_text()
-                logger.info(f"Estado encontrado en formato clásico: {blob_name}")
+            except NotFound:
+                content = None
+            
+            if content is not None:
                 state = json.loads(content)
-                # Normalizar el estado para que sea compatible con CallbackHandler
-                return self._normalize_classic_state(state)
+                if state.get(STATE_LOCATION_KEY):
+                    # Convertido al arrancar, pero el estado dinámico aún no está (o está en otro backend)
+                    logger.warning(f"Run clásico {run_id} marcado en {state[STATE_LOCATION_KEY]} sin estado dinámico; se convierte de nuevo")
+                logger.info(f"Estado encontrado en formato clásico: {blob_name}")
+                normalized = self._normalize_classic_state(state)
+                # El estado convertido aún no existe en flow-runs/: solo puede crearse
+                normalized[STATE_GENERATION_KEY] = 0
+                return normalized
             
             logger.info(f"Estado de ejecución {run_id} no encontrado en ninguna ubicación")
             return None
@@ -109,44 +229,11 @@ class FlowRunStateRepository(StorageRepository):
     
     def _normalize_classic_state(self, state: dict) -> dict:
         """
-        Normaliza el estado del formato clásico para que sea compatible con CallbackHandler
+        Convierte el estado clásico al formato dinámico (ver flows.classic)
         """
-        # Convertir formato clásico a formato dinámico
-        normalized = {
-            "flow_id": state.get("flow_id"),
-            "run_id": state.get("run_id"),
-            "account": state.get("account"),
-            "status": state.get("status"),
-            "flow_config": {
-                "steps": []
-            },
-            "started_at": state.get("created_at"),
-            "last_updated": state.get("last_updated")
-        }
-        
         # OBTENER LA DEFINICIÓN COMPLETA DEL FLUJO desde graphs/
         flow_definition = self._get_flow_definition_for_classic_state(state)
-        
-        # Convertir tasks a steps usando la definición completa
-        tasks = state.get("tasks", {})
-        for task_id, task_info in tasks.items():
-            # Buscar la definición completa del paso
-            step_definition = self._find_step_definition(task_id, flow_definition)
-            
-            step = {
-                "id": task_id,
-                "name": task_id,
-                "type": step_definition.get("type", "unknown"),
-                "status": task_info.get("status", "pending"),
-                "started_at": task_info.get("start"),
-                "ended_at": task_info.get("end"),
-                "config": step_definition.get("config", {}),
-                "depends_on": step_definition.get("depends_on", [])
-            }
-            normalized["flow_config"]["steps"].append(step)
-        
-        logger.info(f"Estado clásico normalizado: {len(normalized['flow_config']['steps'])} pasos")
-        return normalized
+        return convert_classic_state(state, flow_definition)
     
     def _get_flow_definition_for_classic_state(self, state: dict) -> dict:
         """
@@ -160,8 +247,8 @@ class FlowRunStateRepository(StorageRepository):
                 logger.warning("No se puede obtener definición: faltan flow_id o account")
                 return {}
             
-            # Usar FlowDefinitionRepository para obtener la definición
-            definition_repo = FlowDefinitionRepository()
+            # Usar FlowDefinitionRepository (compartiendo cliente y caché) para obtener la definición
+            definition_repo = FlowDefinitionRepository(self.storage_client)
             flow_definition = definition_repo.get_flow_definition(account, flow_id)
             
             if flow_definition:
@@ -175,33 +262,24 @@ class FlowRunStateRepository(StorageRepository):
             logger.error(f"Error obteniendo definición del flujo: {str(e)}")
             return {}
     
-    def _find_step_definition(self, task_id: str, flow_definition: dict) -> dict:
-        """
-        Encuentra la definición completa de un paso específico
-        """
-        steps = flow_definition.get("steps", [])
-        for step in steps:
-            if step.get("id") == task_id:
-                return step
-        
-        # Si no se encuentra, retornar estructura básica
-        logger.warning(f"No se encontró definición para el paso {task_id}")
-        return {
-            "id": task_id,
-            "type": "unknown",
-            "config": {},
-            "depends_on": []
-        }
-    
     def save_flow_run_state(self, flow_id: str, run_id: str, state: dict):
         """
         Guarda el estado de ejecución del flujo en Cloud Storage
         
+        Si el estado fue leído con get_flow_run_state, la escritura se condiciona a que
+        el blob siga en la misma generación (compare-and-swap).
+        
         Args:
             flow_id: ID del flujo
             run_id: ID de la ejecución
             state: Estado a guardar
+            
+        Raises:
+            StateConflictError: Si el estado fue modificado desde que se leyó, o si la
+                escritura se rechazó por contención o indisponibilidad transitoria
         """
+        conditional = STATE_GENERATION_KEY in state
+        generation = state.pop(STATE_GENERATION_KEY, None)
         try:
             bucket = self._get_bucket(config.RUNS_BUCKET)
             
@@ -211,9 +289,29 @@ class FlowRunStateRepository(StorageRepository):
             
             from datetime import datetime, timezone
             state['last_updated'] = datetime.now(timezone.utc).isoformat()
-            blob.upload_from_string(json.dumps(state, indent=2))
+            indexed = self._prepare_run_index(flow_id, run_id, state)
+            content = self.codec.encode(state)
+            
+            if conditional:
+                blob.upload_from_string(content, content_type=self.codec.content_type, if_generation_match=generation or 0)
+            else:
+                blob.upload_from_string(content, content_type=self.codec.content_type)
+            state[STATE_GENERATION_KEY] = blob.generation
             
             logger.info(f"Estado de flujo {flow_id}/{run_id} guardado en GCS")
+            self._record_run_index(flow_id, run_id, state, indexed)
             
+        except (PreconditionFailed, *RETRYABLE_WRITE_ERRORS) as e:
+            self._restore_generation(state, conditional, generation)
+            logger.warning(f"Conflicto de concurrencia guardando estado de flujo {flow_id}/{run_id}: {str(e)}")
+            raise StateConflictError(f"Flow state {flow_id}/{run_id} was modified concurrently", flow_id, run_id) from e
         except Exception as e:
+            # El estado no se ha guardado: el llamador no debe actuar como si lo estuviera
+            self._restore_generation(state, conditional, generation)
             logger.error(f"Error guardando estado de flujo {flow_id}/{run_id}: {str(e)}")
+            raise
+    
+    def _restore_generation(self, state: dict, conditional: bool, generation):
+        """Devuelve al estado la generación leída tras un guardado fallido."""
+        if conditional:
+            state[STATE_GENERATION_KEY] = generation
@@ -0,0 +1,59 @@
+"""
+Último resultado exitoso de cada paso memoizable.
+
+Un objeto por paso en el bucket de runs:
+
+    step-cache/{account}/{flow_id}/{step_id}.json = {"cache_key", "result", "run_id", "completed_at"}
+"""
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from google.api_core.exceptions import NotFound
+
+from core.config import config
+from storage.repositories import StorageRepository
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_PREFIX = 'step-cache/'
+
+
+class StepResultCache(StorageRepository):
+    """Resultados memoizados por (account, flow_id, step_id)."""
+
+    def _blob_name(self, account: str, flow_id: str, step_id: str) -> str:
+        return f"{RESULT_CACHE_PREFIX}{account}/{flow_id}/{step_id}.json"
+
+    def get(self, account: str, flow_id: str, step_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Lee la última entrada del paso.
+
+        Args:
+            account: Cuenta/organización
+            flow_id: ID del flujo
+            step_id: ID del paso
+
+        Returns:
+            dict: Entrada guardada o None si no existe
+        """
+        blob = self._get_bucket(config.RUNS_BUCKET).blob(self._blob_name(account, flow_id, step_id))
+        try:
+            return json.loads(blob.download_as_text())
+        except NotFound:
+            return None
+
+    def put(self, account: str, flow_id: str, step_id: str, entry: Dict[str, Any]) -> None:
+        """
+        Sustituye la entrada del paso por la de su último run exitoso.
+
+        Args:
+            account: Cuenta/organización
+            flow_id: ID del flujo
+            step_id: ID del paso
+            entry: {"cache_key", "result", "run_id", "completed_at"}
+        """
+        self._get_bucket(config.RUNS_BUCKET).blob(self._blob_name(account, flow_id, step_id)).upload_from_string(
+            json.dumps(entry, separators=(',', ':'), default=str),
+            content_type='application/json'
+        )
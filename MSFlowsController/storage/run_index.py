@@ -0,0 +1,222 @@
+"""
+Índice de runs activos y recientes.
+
+Cada run tiene un objeto marcador vacío en el bucket de runs; el estado y las
+fechas del run van en los metadatos del objeto, que el listado devuelve sin
+descargar nada:
+
+    run-index/active/{account}/{flow_id}/{run_id}
+    run-index/finished/{YYYY-MM-DD}/{account}/{flow_id}/{run_id}
+
+Los runs en curso se listan con un único listado por cuenta (o flujo); los
+terminados se reparten por día de finalización, de modo que una consulta por
+ventana de tiempo solo lista los días de la ventana. La retención de
+``run-index/finished/`` se configura con una regla de ciclo de vida del bucket.
+
+El índice se actualiza desde los repositorios de estado, tras cada guardado que
+cambia el estado del run (y, mientras sigue activo, como mucho cada
+RUN_INDEX_REFRESH_SECONDS para mantener ``last_updated``). Es un dato derivado:
+si su escritura falla, el siguiente guardado del run lo corrige.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from google.api_core.exceptions import NotFound
+
+from core.config import config
+from storage.repositories import StorageRepository
+
+logger = logging.getLogger(__name__)
+
+RUN_INDEX_PREFIX = 'run-index/'
+ACTIVE_PREFIX = f'{RUN_INDEX_PREFIX}active/'
+FINISHED_PREFIX = f'{RUN_INDEX_PREFIX}finished/'
+
+# Última entrada escrita en el índice, guardada en el propio estado del run:
+# {"status", "indexed_at", "finished": nombre del marcador de run terminado}
+RUN_INDEX_KEY = 'run_index'
+
+TERMINAL_STATUSES = ('completed', 'error', 'failed', 'cancelled')
+
+TimeValue = Union[datetime, str, None]
+
+
+def _parse_time(value: TimeValue) -> Optional[datetime]:
+    """Convierte una fecha ISO (o datetime) en datetime con zona horaria."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class RunIndex(StorageRepository):
+    """Marcadores (account, flow_id, run_id) con el estado y las fechas de cada run."""
+
+    def __init__(self, storage_client=None, refresh_seconds: Optional[float] = None):
+        super().__init__(storage_client)
+        self.refresh_seconds = config.RUN_INDEX_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+
+    def _active_name(self, account: str, flow_id: str, run_id: str) -> str:
+        return f"{ACTIVE_PREFIX}{account}/{flow_id}/{run_id}"
+
+    def _finished_name(self, day: str, account: str, flow_id: str, run_id: str) -> str:
+        return f"{FINISHED_PREFIX}{day}/{account}/{flow_id}/{run_id}"
+
+    def prepare(self, flow_id: str, run_id: str, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Decide si un guardado del estado debe actualizar el índice.
+
+        Si es así, anota en el estado (RUN_INDEX_KEY) la entrada que se escribirá,
+        de modo que se guarde junto con él.
+
+        Args:
+            flow_id: ID del flujo
+            run_id: ID de la ejecución
+            state: Estado que se va a guardar
+
+        Returns:
+            dict: Entrada anterior (posiblemente vacía) que hay que pasar a record,
+            o None si el índice ya está al día
+        """
+        status = state.get('status')
+        previous = state.get(RUN_INDEX_KEY) or {}
+        now = datetime.now(timezone.utc)
+        if previous.get('status') == status:
+            indexed_at = _parse_time(previous.get('indexed_at'))
+            if status in TERMINAL_STATUSES or (indexed_at and (now - indexed_at).total_seconds() < self.refresh_seconds):
+                return None
+
+        entry = {"status": status, "indexed_at": now.isoformat()}
+        if status in TERMINAL_STATUSES:
+            account = state.get('account') or 'unknown'
+            entry['finished'] = self._finished_name(now.strftime('%Y-%m-%d'), account, flow_id, run_id)
+        state[RUN_INDEX_KEY] = entry
+        return previous
+
+    def record(self, flow_id: str, run_id: str, state: Dict[str, Any], previous: Dict[str, Any]):
+        """
+        Escribe la entrada preparada con prepare, una vez guardado el estado.
+
+        Un run que termina pasa de active/ a finished/; uno que se reanuda vuelve a
+        active/ y pierde su entrada de terminado. Los errores se registran y no se
+        propagan: el estado ya está guardado.
+
+        Args:
+            flow_id: ID del flujo
+            run_id: ID de la ejecución
+            state: Estado guardado
+            previous: Entrada anterior devuelta por prepare
+        """
+        entry = state.get(RUN_INDEX_KEY) or {}
+        account = state.get('account') or 'unknown'
+        try:
+            bucket = self._get_bucket(config.RUNS_BUCKET)
+            active_name = self._active_name(account, flow_id, run_id)
+            marker = bucket.blob(entry.get('finished') or active_name)
+            marker.metadata = {
+                "status": str(state.get('status')),
+                "started": state.get('started_at') or '',
+                "last_updated": state.get('last_updated') or entry.get('indexed_at'),
+            }
+            marker.upload_from_string('', content_type='text/plain')
+
+            stale = [active_name] if entry.get('finished') else []
+            if previous.get('finished') and previous['finished'] != entry.get('finished'):
+                stale.append(previous['finished'])
+            for name in stale:
+                try:
+                    bucket.blob(name).delete()
+                except NotFound:
+                    pass
+            logger.debug(f"Índice de runs actualizado para {flow_id}/{run_id} ({entry.get('status')})")
+        except Exception as e:
+            logger.error(f"Error actualizando índice de runs para {flow_id}/{run_id}: {str(e)}")
+
+    def list_runs(
+        self,
+        account: Optional[str] = None,
+        flow_id: Optional[str] = None,
+        statuses: Optional[Iterable[str]] = None,
+        since: TimeValue = None,
+        until: TimeValue = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Lista runs del índice sin leer sus estados.
+
+        La ventana [since, until] se aplica a ``last_updated``. Los runs terminados
+        solo se buscan en los días de la ventana; si no se indica since, se usan
+        las últimas RUN_INDEX_RECENT_HOURS.
+
+        Args:
+            account: Cuenta (todas si no se indica)
+            flow_id: ID del flujo (todos si no se indica)
+            statuses: Estados a incluir (todos si no se indica)
+            since: Inicio de la ventana (datetime o ISO 8601)
+            until: Fin de la ventana (datetime o ISO 8601)
+            limit: Número máximo de runs a devolver
+
+        Returns:
+            list: Entradas {account, flow_id, run_id, status, started, last_updated},
+            de la más reciente a la más antigua
+        """
+        statuses = set(statuses) if statuses else None
+        since, until = _parse_time(since), _parse_time(until)
+        bucket = self._get_bucket(config.RUNS_BUCKET)
+        scope = f"{account}/" if account else ''
+        if account and flow_id:
+            scope += f"{flow_id}/"
+
+        entries = []
+        if statuses is None or statuses - set(TERMINAL_STATUSES):
+            entries.extend(self._list_prefix(bucket, f"{ACTIVE_PREFIX}{scope}"))
+        finished_since = since
+        if statuses is None or statuses & set(TERMINAL_STATUSES):
+            finished_until = until or datetime.now(timezone.utc)
+            finished_since = since or finished_until - timedelta(hours=config.RUN_INDEX_RECENT_HOURS)
+            day = finished_since.date()
+            while day <= finished_until.date():
+                entries.extend(self._list_prefix(bucket, f"{FINISHED_PREFIX}{day.isoformat()}/{scope}"))
+                day += timedelta(days=1)
+
+        runs: Dict[tuple, Dict[str, Any]] = {}
+        for entry in entries:
+            if flow_id and entry['flow_id'] != flow_id:
+                continue
+            if statuses is not None and entry['status'] not in statuses:
+                continue
+            updated = _parse_time(entry['last_updated'])
+            lower = finished_since if entry['status'] in TERMINAL_STATUSES else since
+            if updated is None or (lower and updated < lower) or (until and updated > until):
+                continue
+            key = (entry['flow_id'], entry['run_id'])
+            # Un run reanudado puede tener a la vez entrada activa y de terminado
+            if key not in runs or _parse_time(runs[key]['last_updated']) < updated:
+                runs[key] = entry
+
+        result = sorted(runs.values(), key=lambda entry: _parse_time(entry['last_updated']), reverse=True)
+        return result[:limit] if limit else result
+
+    def _list_prefix(self, bucket, prefix: str) -> List[Dict[str, Any]]:
+        entries = []
+        for blob in bucket.list_blobs(prefix=prefix):
+            parts = blob.name.split('/')[-3:]
+            if len(parts) != 3:
+                logger.warning(f"Marcador del índice de runs con formato inválido: {blob.name}")
+                continue
+            metadata = blob.metadata or {}
+            account, flow_id, run_id = parts
+            entries.append({
+                "account": account,
+                "flow_id": flow_id,
+                "run_id": run_id,
+                "status": metadata.get('status'),
+                "started": metadata.get('started') or None,
+                "last_updated": metadata.get('last_updated'),
+            })
+        return entries
@@ -0,0 +1,87 @@
+"""
+Índice de pasos en ejecución ordenado por fecha límite.
+
+Cada paso en ejecución con fecha límite tiene un objeto marcador vacío en el
+bucket de runs:
+
+    running-steps/{deadline (epoch, 12 dígitos)}/{flow_id}/{run_id}/{step_id}
+
+Como los nombres se listan en orden lexicográfico, los pasos vencidos de todos
+los runs activos se obtienen con un único listado acotado por end_offset, sin
+leer ningún documento de estado.
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from google.api_core.exceptions import NotFound
+
+from core.config import config
+from storage.repositories import StorageRepository
+
+logger = logging.getLogger(__name__)
+
+RUNNING_INDEX_PREFIX = 'running-steps/'
+DEADLINE_DIGITS = 12
+
+# (flow_id, run_id, step_id, deadline)
+IndexEntry = Tuple[str, str, str, int]
+
+
+class RunningStepIndex(StorageRepository):
+    """Marcadores (run_id, step_id, deadline) de los pasos en ejecución."""
+
+    def _marker_name(self, flow_id: str, run_id: str, step_id: str, deadline: int) -> str:
+        return f"{RUNNING_INDEX_PREFIX}{int(deadline):0{DEADLINE_DIGITS}d}/{flow_id}/{run_id}/{step_id}"
+
+    def add(self, entries: Iterable[IndexEntry]):
+        """
+        Registra pasos en ejecución.
+
+        Args:
+            entries: Tuplas (flow_id, run_id, step_id, deadline)
+        """
+        bucket = self._get_bucket(config.RUNS_BUCKET)
+        for flow_id, run_id, step_id, deadline in entries:
+            bucket.blob(self._marker_name(flow_id, run_id, step_id, deadline)).upload_from_string(
+                '', content_type='text/plain'
+            )
+            logger.debug(f"Marcador de ejecución creado para {flow_id}/{run_id}/{step_id} (límite {deadline})")
+
+    def remove(self, entries: Iterable[IndexEntry]):
+        """
+        Elimina marcadores; los que ya no existen se ignoran.
+
+        Args:
+            entries: Tuplas (flow_id, run_id, step_id, deadline)
+        """
+        bucket = self._get_bucket(config.RUNS_BUCKET)
+        for flow_id, run_id, step_id, deadline in entries:
+            try:
+                bucket.blob(self._marker_name(flow_id, run_id, step_id, deadline)).delete()
+            except NotFound:
+                pass
+            except Exception as e:
+                logger.error(f"Error eliminando marcador de {flow_id}/{run_id}/{step_id}: {str(e)}")
+
+    def list_overdue(self, now: int, max_results: Optional[int] = None) -> List[Dict[str, object]]:
+        """
+        Lista, en orden de fecha límite, los pasos cuyo límite ya pasó.
+
+        Args:
+            now: Instante actual (epoch en segundos)
+            max_results: Número máximo de marcadores a devolver
+
+        Returns:
+            list: Entradas {flow_id, run_id, step_id, deadline}
+        """
+        bucket = self._get_bucket(config.RUNS_BUCKET)
+        end_offset = f"{RUNNING_INDEX_PREFIX}{int(now) + 1:0{DEADLINE_DIGITS}d}"
+        overdue = []
+        for blob in bucket.list_blobs(prefix=RUNNING_INDEX_PREFIX, end_offset=end_offset, max_results=max_results):
+            parts = blob.name[len(RUNNING_INDEX_PREFIX):].split('/', 3)
+            if len(parts) != 4:
+                logger.warning(f"Marcador de ejecución con formato inválido: {blob.name}")
+                continue
+            deadline, flow_id, run_id, step_id = parts
+            overdue.append({"flow_id": flow_id, "run_id": run_id, "step_id": step_id, "deadline": int(deadline)})
+        return overdue
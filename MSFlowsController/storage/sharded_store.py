@@ -0,0 +1,248 @@
+"""
+Almacén de estados de ejecución repartido: cabecera del run y documentos por paso.
+
+La cabecera contiene el estado del run (estado, contadores, grafo compilado y los
+campos ligeros de cada paso). Las cargas de un paso (``result``, ``config``)
+que ocupan al menos STATE_SHARD_MIN_BYTES se guardan aparte y en la cabecera
+solo queda su referencia; se descargan la primera vez que se accede a ellas.
+Un callback lee la cabecera, escribe el documento de su paso si su carga ha
+cambiado y reescribe la cabecera: no lee ni reescribe los resultados de los
+demás pasos (p. ej. el ``transformation_result`` completo de dbt).
+
+Los documentos de paso son inmutables y su nombre es el hash de su contenido,
+así que un guardado que pierde la carrera (StateConflictError) no altera lo que
+referencia la cabecera vigente. Ese hash permite además detectar las cargas
+descargadas que se han modificado en sitio: al guardar se recodifican y, si no
+coinciden con su documento, se escribe uno nuevo. La cabecera se escribe con precondición de
+generación, igual que el documento único.
+
+Estructura en el bucket de runs:
+    flow-runs/{flow_id}/{run_id}/header.json
+    flow-runs/{flow_id}/{run_id}/steps/{step_id}/{hash}.json
+"""
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from core.config import config
+from core.exceptions import StateConflictError
+from core.utils.codecs import decode
+from storage.repositories import RETRYABLE_WRITE_ERRORS, STATE_GENERATION_KEY, FlowRunStateRepository
+
+logger = logging.getLogger(__name__)
+
+# Referencia del paso a su documento: {"doc": ruta relativa al run, "keys": [...]}
+SHARD_KEY = 'shard'
+# Cargas de un paso que pueden guardarse fuera de la cabecera
+SHARDABLE_KEYS = ('result', 'config')
+
+
+class ShardedStep(dict):
+    """
+    Paso leído de la cabecera: sus cargas se descargan al primer acceso y se
+    registra qué cargas se han reasignado desde la lectura (los cambios en sitio
+    de las cargas descargadas se detectan al guardar, por su contenido).
+    """
+
+    def __init__(self, data: Dict[str, Any], loader: Callable[[str], Dict[str, Any]]):
+        super().__init__(data)
+        self._loader = loader
+        self._pending = set((data.get(SHARD_KEY) or {}).get('keys') or [])
+        self._dirty = set()
+
+    @property
+    def dirty(self) -> bool:
+        """Indica si alguna carga se ha reasignado desde la lectura."""
+        return bool(self._dirty)
+
+    @property
+    def loaded(self) -> bool:
+        """Indica si el documento del paso ya se ha descargado (o no tiene)."""
+        return not self._pending
+
+    def load(self) -> None:
+        """Descarga el documento del paso (una sola vez); no pisa valores ya asignados."""
+        if not self._pending:
+            return
+        payload = self._loader(dict.__getitem__(self, SHARD_KEY)['doc'])
+        for key in self._pending:
+            if key in payload and not dict.__contains__(self, key):
+                dict.__setitem__(self, key, payload[key])
+        self._pending = set()
+
+    def __getitem__(self, key):
+        if key in self._pending:
+            self.load()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self._pending:
+            self.load()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        return key in self._pending or dict.__contains__(self, key)
+
+    def __setitem__(self, key, value):
+        if key in SHARDABLE_KEYS:
+            self._dirty.add(key)
+        dict.__setitem__(self, key, value)
+
+    def pop(self, key, *default):
+        if key in self._pending:
+            self.load()
+        if key in SHARDABLE_KEYS:
+            self._dirty.add(key)
+        return dict.pop(self, key, *default)
+
+
+class FlowRunShardedStore(FlowRunStateRepository):
+    """Repositorio de estados de ejecución con cabecera y documentos por paso."""
+
+    def __init__(self, storage_client=None, codec=None, run_index=None):
+        super().__init__(storage_client, codec, run_index)
+        self.min_shard_bytes = config.STATE_SHARD_MIN_BYTES
+
+    def _run_prefix(self, flow_id: str, run_id: str) -> str:
+        return f"flow-runs/{flow_id}/{run_id}"
+
+    def get_flow_run_state(self, flow_id: str, run_id: str) -> dict:
+        """
+        Lee la cabecera del run; las cargas de los pasos se descargan bajo demanda.
+
+        Args:
+            flow_id: ID del flujo
+            run_id: ID de la ejecución
+
+        Returns:
+            dict: Estado del flujo o None si no existe
+        """
+        try:
+            bucket = self._get_bucket(config.RUNS_BUCKET)
+            prefix = self._run_prefix(flow_id, run_id)
+            blob = bucket.blob(f"{prefix}/header.json")
+            try:
+                state = decode(blob.download_as_bytes(), blob.content_type)
+            except NotFound:
+                # Runs creados con el documento único (o clásicos): la cabecera se crea al guardar
+                state = super().get_flow_run_state(flow_id, run_id)
+                if state is not None:
+                    state[STATE_GENERATION_KEY] = 0
+                return state
+
+            state[STATE_GENERATION_KEY] = blob.generation
+            loader = self._shard_loader(bucket, prefix)
+            steps = state.get('flow_config', {}).get('steps', [])
+            state['flow_config']['steps'] = [ShardedStep(step, loader) for step in steps]
+            return state
+
+        except Exception as e:
+            logger.error(f"Error leyendo cabecera de flujo {flow_id}/{run_id}: {str(e)}")
+            return None
+
+    def save_flow_run_state(self, flow_id: str, run_id: str, state: dict):
+        """
+        Escribe los documentos de los pasos cuya carga ha cambiado y después la cabecera.
+
+        Si el estado fue leído con get_flow_run_state, la cabecera se escribe con
+        precondición de generación (compare-and-swap).
+
+        Args:
+            flow_id: ID del flujo
+            run_id: ID de la ejecución
+            state: Estado a guardar
+
+        Raises:
+            StateConflictError: Si la cabecera fue modificada desde que se leyó
+        """
+        conditional = STATE_GENERATION_KEY in state
+        generation = state.pop(STATE_GENERATION_KEY, None)
+        try:
+            bucket = self._get_bucket(config.RUNS_BUCKET)
+            prefix = self._run_prefix(flow_id, run_id)
+            state['last_updated'] = datetime.now(timezone.utc).isoformat()
+            indexed = self._prepare_run_index(flow_id, run_id, state)
+
+            flow_config = state.get('flow_config') or {}
+            header = dict(state)
+            header['flow_config'] = {
+                **flow_config,
+                'steps': [self._header_step(bucket, prefix, step) for step in flow_config.get('steps', [])]
+            }
+
+            blob = bucket.blob(f"{prefix}/header.json")
+            content = self.codec.encode(header)
+            if conditional:
+                blob.upload_from_string(content, content_type=self.codec.content_type, if_generation_match=generation or 0)
+            else:
+                blob.upload_from_string(content, content_type=self.codec.content_type)
+            state[STATE_GENERATION_KEY] = blob.generation
+            logger.info(f"Cabecera de flujo {flow_id}/{run_id} guardada en GCS")
+            self._record_run_index(flow_id, run_id, state, indexed)
+
+        except (PreconditionFailed, *RETRYABLE_WRITE_ERRORS) as e:
+            self._restore_generation(state, conditional, generation)
+            logger.warning(f"Conflicto de concurrencia guardando cabecera de flujo {flow_id}/{run_id}: {str(e)}")
+            raise StateConflictError(f"Flow state {flow_id}/{run_id} was modified concurrently", flow_id, run_id) from e
+        except Exception as e:
+            self._restore_generation(state, conditional, generation)
+            logger.error(f"Error guardando cabecera de flujo {flow_id}/{run_id}: {str(e)}")
+            raise
+
+    def _header_step(self, bucket, prefix: str, step: Dict[str, Any]) -> Dict[str, Any]:
+        """Versión del paso para la cabecera; guarda su documento si la carga es grande y ha cambiado."""
+        if isinstance(step, ShardedStep):
+            if not step.dirty and not self._changed_in_place(step):
+                # Cargas sin cambios desde la lectura: las referenciadas siguen en su documento,
+                # aunque una lectura las haya descargado
+                sharded = (dict.get(step, SHARD_KEY) or {}).get('keys') or []
+                return {key: value for key, value in dict.items(step) if key not in sharded}
+            # Se completan las cargas no reasignadas antes de reescribir el documento
+            step.load()
+
+        entry = dict(step)
+        entry.pop(SHARD_KEY, None)
+        payload = {
+            key: entry.pop(key) for key in SHARDABLE_KEYS
+            if key in entry and len(self.codec.encode(entry[key])) >= self.min_shard_bytes
+        }
+        if not payload:
+            return entry
+
+        content = self.codec.encode(payload)
+        doc = self._shard_doc(step.get('id'), content)
+        if (dict.get(step, SHARD_KEY) or {}).get('doc') != doc:
+            try:
+                bucket.blob(f"{prefix}/{doc}").upload_from_string(
+                    content, content_type=self.codec.content_type, if_generation_match=0
+                )
+            except PreconditionFailed:
+                # Mismo contenido ya guardado
+                pass
+        entry[SHARD_KEY] = {"doc": doc, "keys": list(payload)}
+        return entry
+
+    def _shard_doc(self, step_id: str, content: bytes) -> str:
+        """Ruta (relativa al run) del documento de un paso con este contenido."""
+        return f"steps/{step_id}/{hashlib.sha1(content).hexdigest()[:16]}.json"
+
+    def _changed_in_place(self, step: ShardedStep) -> bool:
+        """Indica si las cargas descargadas de un paso ya no coinciden con su documento."""
+        shard = dict.get(step, SHARD_KEY) or {}
+        if not shard or not step.loaded:
+            return False
+        payload = {key: dict.__getitem__(step, key) for key in shard.get('keys') or [] if dict.__contains__(step, key)}
+        return self._shard_doc(step.get('id'), self.codec.encode(payload)) != shard.get('doc')
+
+    def _shard_loader(self, bucket, prefix: str) -> Callable[[str], Dict[str, Any]]:
+        def load(doc: str) -> Dict[str, Any]:
+            blob = bucket.blob(f"{prefix}/{doc}")
+            try:
+                return decode(blob.download_as_bytes(), blob.content_type)
+            except NotFound:
+                logger.error(f"Documento de paso {prefix}/{doc} no encontrado")
+                return {}
+        return load
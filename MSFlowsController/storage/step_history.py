@@ -0,0 +1,155 @@
+"""
+Histórico de duraciones de pasos por (account, flow_id, step_id).
+
+Un documento por flujo en el bucket de runs:
+
+    step-history/{account}/{flow_id}.json = {
+        "runs": n, "updated_at": ...,
+        "steps": {step_id: {
+            "samples": n, "mean_seconds": s,
+            "p50_seconds", "p90_seconds", "max_seconds",
+            "queue_p50_seconds", "queue_p90_seconds", "queue_max_seconds",
+            "durations": [...], "queue_times": [...]
+        }}
+    }
+
+La media es exponencial (STEP_HISTORY_SMOOTHING pondera la muestra nueva); los
+percentiles y el máximo se calculan sobre una ventana de las últimas
+STEP_HISTORY_WINDOW muestras, de modo que el documento no crece con los runs.
+"""
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from core.config import config
+from storage.repositories import StorageRepository
+
+logger = logging.getLogger(__name__)
+
+STEP_HISTORY_PREFIX = 'step-history/'
+
+# Reintentos de la actualización condicional; el histórico es orientativo y no bloquea el run
+STEP_HISTORY_MAX_ATTEMPTS = 5
+
+
+def _percentile(values: List[float], quantile: float) -> float:
+    """Percentil por rango más cercano."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+def _summarize(entry: Dict[str, Any]) -> None:
+    """Recalcula los percentiles de la entrada a partir de sus ventanas."""
+    for prefix, key in (('', 'durations'), ('queue_', 'queue_times')):
+        window = entry.get(key) or []
+        if not window:
+            continue
+        entry[f'{prefix}p50_seconds'] = round(_percentile(window, 0.50), 3)
+        entry[f'{prefix}p90_seconds'] = round(_percentile(window, 0.90), 3)
+        entry[f'{prefix}max_seconds'] = round(max(window), 3)
+
+
+class StepHistoryRepository(StorageRepository):
+    """Duraciones y esperas históricas de los pasos de cada flujo."""
+
+    def _blob_name(self, account: str, flow_id: str) -> str:
+        return f"{STEP_HISTORY_PREFIX}{account}/{flow_id}.json"
+
+    def _read(self, account: str, flow_id: str) -> Tuple[Dict[str, Any], int]:
+        blob = self._get_bucket(config.RUNS_BUCKET).blob(self._blob_name(account, flow_id))
+        try:
+            document = json.loads(blob.download_as_text())
+            return document, blob.generation
+        except NotFound:
+            return {"steps": {}}, 0
+
+    def get_history(self, account: str, flow_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Estadísticas de cada paso del flujo.
+
+        Args:
+            account: Cuenta/organización
+            flow_id: ID del flujo
+
+        Returns:
+            dict: Id de paso -> estadísticas (vacío si no hay histórico)
+        """
+        try:
+            document, _ = self._read(account, flow_id)
+        except Exception as e:
+            logger.error(f"Error leyendo histórico de pasos de {account}/{flow_id}: {str(e)}")
+            return {}
+        return document.get('steps', {})
+
+    def get_durations(self, account: str, flow_id: str) -> Dict[str, float]:
+        """
+        Duración media de cada paso del flujo.
+
+        Args:
+            account: Cuenta/organización
+            flow_id: ID del flujo
+
+        Returns:
+            dict: Id de paso -> segundos (vacío si no hay histórico)
+        """
+        return {
+            step_id: entry['mean_seconds']
+            for step_id, entry in self.get_history(account, flow_id).items()
+            if entry.get('mean_seconds') is not None
+        }
+
+    def record_run(
+        self,
+        account: str,
+        flow_id: str,
+        durations: Dict[str, float],
+        queue_times: Optional[Dict[str, float]] = None
+    ) -> bool:
+        """
+        Incorpora los tiempos de un run terminado.
+
+        Args:
+            account: Cuenta/organización
+            flow_id: ID del flujo
+            durations: Id de paso -> segundos de ejecución observados
+            queue_times: Id de paso -> segundos de espera en la cola de admisión
+
+        Returns:
+            bool: True si se guardó
+        """
+        queue_times = queue_times or {}
+        if not durations and not queue_times:
+            return False
+        bucket = self._get_bucket(config.RUNS_BUCKET)
+        weight = config.STEP_HISTORY_SMOOTHING
+        window = config.STEP_HISTORY_WINDOW
+        for attempt in range(1, STEP_HISTORY_MAX_ATTEMPTS + 1):
+            document, generation = self._read(account, flow_id)
+            steps = document.setdefault('steps', {})
+            for step_id in set(durations) | set(queue_times):
+                entry = steps.setdefault(step_id, {"samples": 0})
+                if step_id in durations:
+                    seconds = durations[step_id]
+                    mean = entry.get('mean_seconds')
+                    entry['mean_seconds'] = round(seconds if mean is None else (1 - weight) * mean + weight * seconds, 3)
+                    entry['samples'] += 1
+                    entry['durations'] = (entry.get('durations', []) + [round(seconds, 3)])[-window:]
+                if step_id in queue_times:
+                    entry['queue_times'] = (entry.get('queue_times', []) + [round(queue_times[step_id], 3)])[-window:]
+                _summarize(entry)
+            document['runs'] = document.get('runs', 0) + 1
+            document['updated_at'] = datetime.now(timezone.utc).isoformat()
+            try:
+                bucket.blob(self._blob_name(account, flow_id)).upload_from_string(
+                    json.dumps(document, separators=(',', ':')),
+                    content_type='application/json',
+                    if_generation_match=generation
+                )
+                return True
+            except PreconditionFailed:
+                logger.info(f"Conflicto en el histórico de {account}/{flow_id} (intento {attempt}); se reintenta")
+        logger.warning(f"No se pudo actualizar el histórico de {account}/{flow_id}")
+        return False
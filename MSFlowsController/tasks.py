@@ -1,8 +1,8 @@
-from time import timezone
 from celery import shared_task
 import json
 import logging
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
 from typing import Dict, Any, Optional
 
 # Configure logging
@@ -10,10 +10,33 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Clientes compartidos por todas las tareas del proceso worker
+_flow_controller = None
+_publisher_client = None
+_clients_lock = threading.Lock()
+
+
 def _get_flow_controller():
-    # Importación perezosa para evitar dependencias en tiempo de importación durante los tests
-    from worker.flowscontroller import FlowController
-    return FlowController
+    """Devuelve el FlowController del proceso, creado en el primer uso."""
+    global _flow_controller
+    if _flow_controller is None:
+        with _clients_lock:
+            if _flow_controller is None:
+                # Importación perezosa para evitar dependencias en tiempo de importación durante los tests
+                from worker.flowscontroller import FlowController
+                _flow_controller = FlowController()
+    return _flow_controller
+
+
+def _get_publisher_client():
+    """Devuelve el cliente de Pub/Sub del proceso, creado en el primer uso."""
+    global _publisher_client
+    if _publisher_client is None:
+        with _clients_lock:
+            if _publisher_client is None:
+                from google.cloud import pubsub_v1
+                _publisher_client = pubsub_v1.PublisherClient()
+    return _publisher_client
 
 
 @shared_task(name="handle_task_completion")
@@ -47,10 +70,7 @@ def publish_to_pubsub(project_id: str, topic_name: str, payload: dict) -> str:
         payload: Datos a publicar
     """
     try:
-        from google.cloud import pubsub_v1
-        import json
-        
-        publisher = pubsub_v1.PublisherClient()
+        publisher = _get_publisher_client()
         topic_path = publisher.topic_path(project_id, topic_name)
         
         # Convertir payload a JSON
@@ -70,8 +90,13 @@ def publish_to_pubsub(project_id: str, topic_name: str, payload: dict) -> str:
 @shared_task(name="execute_single_task")
 def execute_single_task(task_name: str, task_definition: dict, run_id: str) -> str:
     """
-    Tarea Celery para ejecutar una única tarea: actualiza el estado, publica el mensaje a Pub/Sub
-    (usando Celery para desacoplar), y gestiona errores.
+    Tarea Celery para ejecutar una única tarea: marca la tarea como "executing",
+    publica su mensaje a Pub/Sub y gestiona errores.
+
+    La publicación se hace dentro de la propia tarea: esperar a otra tarea Celery
+    (``.delay(...).get()``) ocuparía el slot del worker y, con
+    ``worker_prefetch_multiplier=1``, puede bloquear todos los workers. Cada cambio
+    de estado es un único delta condicionado a la generación del estado.
 
     Args:
         task_name (str): Nombre de la tarea a ejecutar.
@@ -81,52 +106,29 @@ def execute_single_task(task_name: str, task_definition: dict, run_id: str) -> s
     Returns:
         str: ID del mensaje publicado en Pub/Sub.
     """
+    from worker.flowscontroller import TaskStatus
+
+    fc = _get_flow_controller()
     try:
-        fc = _get_flow_controller()
-        
-        # Carga el estado de ejecución
-        logger.info(f"Cargando estado de ejecución para run_id: {run_id}")
-        execution_status = fc._load_execution_status_running(run_id)
-        
-        # Actualiza el estado de la tarea a "executing"
-        logger.info(f"Actualizando estado de la tarea a executing: {task_name}")
-        execution_status["tasks"][task_name]["status"] = "executing"
-        execution_status["tasks"][task_name]["start"] = datetime.now(timezone.utc)
-        logger.info(f"Guardando estado de ejecución actualizado para run_id: {run_id}")
-        fc._save_execution_status_running(run_id, execution_status)
-        
-        # Prepara el mensaje para el worker correspondiente
-        logger.info(f"Preparando mensaje para el worker correspondiente: {task_name}")
-        # Obtener config del step (puede estar en 'config' o 'params' para compatibilidad)
-        step_config = task_definition.get("config", task_definition.get("params", {}))
-        task_message = {
-            "flow_id": execution_status["flow_id"],
-            "account": execution_status["account"],
-            "run_id": run_id,
-            "task_id": task_name,
-            "config": step_config  # Usar 'config' en lugar de 'params'
-        }
-        
-        # Determina el tópico según el tipo de tarea
-        logger.info(f"Determinando el tópico según el tipo de tarea: {task_definition["type"]}")
-        topic_name = fc._get_task_execution_topic(task_definition["type"])
-        project_id = fc.project_id
-        
-        # Encola la publicación a Pub/Sub (espera síncrona por el ID del mensaje)
-        logger.info(f"Encolando la publicación a Pub/Sub para el worker correspondiente: {task_name}")
-        msg_id = publish_to_pubsub.delay(project_id, topic_name, task_message).get()
-        
+        logger.info(f"Actualizando estado de la tarea a executing: {task_name} (run_id: {run_id})")
+        execution_status = fc._update_task_status(run_id, task_name, {
+            "status": TaskStatus.EXECUTING,
+            "start": datetime.now(timezone.utc)
+        })
+
+        logger.info(f"Publicando mensaje para el worker correspondiente: {task_name} ({task_definition['type']})")
+        msg_id = fc._publish_task_message(task_name, task_definition, execution_status, run_id).result()
+        logger.info(f"Mensaje publicado para tarea {task_name}: {msg_id}")
         return msg_id
-        
+
     except Exception as e:
-        # Si falla, marca la tarea como "failed" y guarda el error
-        logger.info(f"Marcando la tarea como failed: {task_name}")
-        fc._load_execution_status_running(run_id)  # Recarga por si hubo cambios
-        execution_status = fc._load_execution_status_running(run_id)
-        execution_status["tasks"][task_name]["status"] = "failed"
-        execution_status["tasks"][task_name]["end"] = datetime.now(timezone.utc)
-        execution_status["tasks"][task_name]["messages"] = [str(e)]
-        fc._save_execution_status_running(run_id, execution_status)
-        logger.info(f"Guardando estado de ejecución actualizado para run_id: {run_id}")
-        logger.error(f"Error ejecutando tarea: {str(e)}")
-        raise
\ No newline at end of file
+        logger.error(f"Error ejecutando tarea {task_name}: {str(e)}")
+        try:
+            fc._update_task_status(run_id, task_name, {
+                "status": TaskStatus.FAILED,
+                "end": datetime.now(timezone.utc),
+                "messages": [str(e)]
+            })
+        except Exception as update_error:
+            logger.error(f"No se pudo marcar la tarea {task_name} como failed: {str(update_error)}")
+        raise
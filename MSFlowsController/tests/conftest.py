@@ -1,11 +1,19 @@
 import pytest
 from unittest.mock import MagicMock
+
+from benchmarks.fake_gcs import FakeStorageClient
+from benchmarks.fake_pubsub import InMemoryPublisher
+from core.handlers.callback_handler import CallbackHandler
+from core.handlers.timeout_sweeper import TimeoutSweeper
 from core.interfaces import (
     FlowDefinitionRepositoryInterface,
     FlowRunStateRepositoryInterface,
+    NotificationServiceInterface,
     PublisherInterface,
-    NotificationServiceInterface
 )
+from core.services.step_dispatcher import StepDispatcher
+from storage.repositories import FlowRunStateRepository
+from storage.running_index import RunningStepIndex
 
 @pytest.fixture
 def mock_flow_repo():
@@ -22,3 +30,58 @@ def mock_publisher():
 @pytest.fixture
 def mock_notification_service():
     return MagicMock(spec=NotificationServiceInterface)
+
+# In-memory GCS and Pub/Sub shared by the components of a test
+
+@pytest.fixture
+def client():
+    return FakeStorageClient()
+
+@pytest.fixture
+def state_repo(client):
+    return FlowRunStateRepository(storage_client=client)
+
+@pytest.fixture
+def publisher():
+    return InMemoryPublisher()
+
+@pytest.fixture
+def running_index(client):
+    return RunningStepIndex(storage_client=client)
+
+@pytest.fixture
+def dispatcher(state_repo, publisher, running_index):
+    return StepDispatcher(state_repo, publisher, running_index)
+
+@pytest.fixture
+def handler(state_repo, publisher, dispatcher, mock_notification_service):
+    return CallbackHandler(state_repo, mock_notification_service, publisher, dispatcher=dispatcher)
+
+@pytest.fixture
+def sweeper(state_repo, running_index, dispatcher, mock_notification_service):
+    return TimeoutSweeper(state_repo, running_index, mock_notification_service, dispatcher=dispatcher)
+
+@pytest.fixture
+def save_run(state_repo):
+    """Saves a running run of account 'acme' with the given steps and returns its state."""
+    def save(steps, flow_id="flow", run_id="run-1", **fields):
+        state = {"flow_id": flow_id, "run_id": run_id, "account": "acme", "status": "running",
+                 "flow_config": {"steps": steps}, **fields}
+        state_repo.save_flow_run_state(flow_id, run_id, state)
+        return state
+    return save
+
+@pytest.fixture
+def run_steps(state_repo):
+    """Saved steps of a run, by id."""
+    def steps(flow_id="flow", run_id="run-1"):
+        return {step["id"]: step for step in state_repo.get_flow_run_state(flow_id, run_id)["flow_config"]["steps"]}
+    return steps
+
+@pytest.fixture
+def callback():
+    """Builds a task callback message of account 'acme'."""
+    def build(task_id, status="completed", result=None, flow_id="flow", run_id="run-1", **fields):
+        return {"flow_id": flow_id, "run_id": run_id, "account": "acme", "task_id": task_id,
+                "status": status, "result": result or {}, **fields}
+    return build
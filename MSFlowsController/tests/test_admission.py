@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.fake_gcs import FakeStorageClient
+from core.config import config
+from core.exceptions import StateConflictError
+from core.services.admission import AdmissionController
+from core.services.step_dispatcher import StepDispatcher
+from core.utils import metrics
+from storage.admission_ledger import AdmissionLedger
+
+
+def _entry(run_id, step_id, account="acme", topic="extract"):
+    return {"flow_id": "flow", "run_id": run_id, "step_id": step_id, "account": account, "topic": topic}
+
+class TestAdmissionController:
+
+    @pytest.fixture
+    def ledger(self):
+        return AdmissionLedger(storage_client=FakeStorageClient())
+
+    def test_disabled_without_limits(self, ledger):
+        assert not AdmissionController(ledger, 0, 0, 0, {}, {}).enabled
+
+    def test_account_limit_skips_saturated_account(self, ledger):
+        admission = AdmissionController(ledger, 0, 1, 0, {}, {})
+
+        admitted = admission.enqueue([_entry("r1", "a"), _entry("r1", "b"), _entry("r2", "c", account="other")])
+
+        assert [e["step_id"] for e in admitted] == ["a", "c"]
+        assert [e["step_id"] for e in ledger.read("account/acme")["queue"]] == ["b"]
+
+    def test_topic_and_global_limits(self, ledger):
+        admission = AdmissionController(ledger, 2, 0, 0, {}, {"extract": 1})
+
+        admitted = admission.enqueue([
+            _entry("r1", "a"), _entry("r1", "b"), _entry("r1", "c", topic="load"), _entry("r1", "d", topic="load")
+        ])
+
+        assert [e["step_id"] for e in admitted] == ["a", "c"]
+
+    def test_release_admits_next_in_fifo_order(self, ledger):
+        metrics.reset()
+        admission = AdmissionController(ledger, 1, 0, 0, {}, {})
+        admission.enqueue([_entry("r1", "a"), _entry("r1", "b"), _entry("r2", "c")])
+
+        admitted = admission.release([_entry("r1", "a")])
+
+        assert [e["step_id"] for e in admitted] == ["b"]
+        assert metrics.get_counter("admission.admitted") == 2
+        assert metrics.get_observation("admission.queue_wait_seconds")["count"] == 2
+
+    def test_cancel_run_drops_its_entries(self, ledger):
+        admission = AdmissionController(ledger, 1, 0, 0, {}, {})
+        admission.enqueue([_entry("r1", "a"), _entry("r1", "b"), _entry("r2", "c")])
+
+        admitted = admission.cancel_run("flow", "r1", [_entry("r1", "a"), _entry("r1", "b")])
+
+        assert [e["step_id"] for e in admitted] == ["c"]
+        assert ledger.read("global")["queue"] == []
+
+    def test_each_limit_has_its_own_document(self, ledger):
+        admission = AdmissionController(ledger, 0, 0, 0, {"acme": 1}, {"extract": 2})
+
+        admitted = admission.enqueue([_entry("r1", "a"), _entry("r2", "b", account="other"), _entry("r3", "c", account="other", topic="load")])
+
+        assert [e["step_id"] for e in admitted] == ["a", "b", "c"]
+        assert sorted(ledger.scopes()) == ["account/acme", "topic/extract"]
+        assert sorted(ledger.read("topic/extract")["running"]) == ["flow/r1/a", "flow/r2/b"]
+        assert list(ledger.read("account/acme")["running"]) == ["flow/r1/a"]
+
+    def test_step_blocked_on_one_limit_gives_back_the_other(self, ledger):
+        admission = AdmissionController(ledger, 0, 0, 0, {"acme": 1}, {"extract": 2})
+        admission.enqueue([_entry("r1", "a")])
+
+        assert admission.enqueue([_entry("r1", "b")]) == []
+        assert list(ledger.read("topic/extract")["running"]) == ["flow/r1/a"]
+        assert [e["step_id"] for e in ledger.read("account/acme")["queue"]] == ["b"]
+
+        admitted = admission.release([_entry("r1", "a")])
+
+        assert [e["step_id"] for e in admitted] == ["b"]
+        assert list(ledger.read("topic/extract")["running"]) == ["flow/r1/b"]
+        assert list(ledger.read("account/acme")["running"]) == ["flow/r1/b"]
+
+class TestAdmissionDispatch:
+
+    @pytest.fixture
+    def ledger(self, client):
+        return AdmissionLedger(storage_client=client)
+
+    @pytest.fixture
+    def dispatcher(self, state_repo, publisher, running_index, ledger):
+        admission = AdmissionController(ledger, 0, 0, 0, {}, {"extract": 1})
+        return StepDispatcher(state_repo, publisher, running_index, admission=admission)
+
+    @pytest.fixture
+    def save_fan_out(self, save_run):
+        """Saves a run whose root fans out to two steps sharing the 'extract' topic (limit 1)."""
+        return lambda: save_run([
+            {"id": "root", "type": "start", "status": "running"},
+            {"id": "a", "type": "extract", "depends_on": ["root"]},
+            {"id": "b", "type": "extract", "depends_on": ["root"]}
+        ])
+
+    def _conflict(self, scope, mutator):
+        raise StateConflictError(f"Admission ledger {scope} was modified concurrently too many times")
+
+    def test_queued_steps_start_as_slots_free_up(self, handler, save_fan_out, run_steps, callback, publisher):
+        save_fan_out()
+
+        handler.handle_task_callback(callback("root"))
+
+        steps = run_steps()
+        assert [m["task_id"] for _, m in publisher.drain()] == ["a"]
+        assert steps["a"]["status"] == "running"
+        assert steps["b"]["status"] == "queued"
+
+        handler.handle_task_callback(callback("a"))
+
+        steps = run_steps()
+        assert [m["task_id"] for _, m in publisher.drain()] == ["b"]
+        assert steps["b"]["status"] == "running"
+        assert "admitted_at" in steps["b"]
+
+    def test_ledger_conflict_after_save_is_left_for_the_sweep(self, handler, sweeper, save_fan_out, run_steps, callback, publisher, ledger, monkeypatch):
+        save_fan_out()
+        handler.handle_task_callback(callback("root"))
+        publisher.drain()
+
+        with monkeypatch.context() as patch:
+            patch.setattr(ledger, "update", self._conflict)
+            result = handler.handle_task_callback(callback("a"))
+
+        # The completion is saved once and reported normally; the slot stays taken
+        assert result["status"] == "success"
+        assert run_steps()["a"]["status"] == "completed"
+        assert run_steps()["b"]["status"] == "queued"
+        assert list(ledger.read("topic/extract")["running"]) == ["flow/run-1/a"]
+        assert publisher.drain() == []
+
+        monkeypatch.setattr(config, "ADMISSION_RECONCILE_SECONDS", 0)
+        assert sweeper.sweep()["reconciled_slots"] == ["flow/run-1/a"]
+        assert [m["task_id"] for _, m in publisher.drain()] == ["b"]
+        assert run_steps()["b"]["status"] == "running"
+
+    def test_failed_enqueue_is_queued_again_by_the_sweep(self, handler, sweeper, save_fan_out, run_steps, callback, publisher, ledger, monkeypatch):
+        save_fan_out()
+        with monkeypatch.context() as patch:
+            patch.setattr(ledger, "update", self._conflict)
+            result = handler.handle_task_callback(callback("root"))
+
+        assert result["status"] == "success"
+        assert [run_steps()[s]["status"] for s in ("a", "b")] == ["queued", "queued"]
+        assert publisher.drain() == []
+
+        sweeper.sweep(now=datetime.now(timezone.utc) + timedelta(seconds=5))
+        assert [m["task_id"] for _, m in publisher.drain()] == ["a"]
+        assert [run_steps()[s]["status"] for s in ("a", "b")] == ["running", "queued"]
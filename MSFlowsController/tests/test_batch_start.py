@@ -0,0 +1,82 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from benchmarks.fake_pubsub import InMemoryPublisher
+from core.handlers.flow_handlers import FlowStartHandler
+from core.services.dynamic_flow_service import DynamicFlowService
+
+
+def _entry(flow_id, account="acme"):
+    return {"flow_id": flow_id, "account": account, "flow_config": {"steps": [
+        {"id": "extract", "type": "extractor", "config": {"source": flow_id}},
+        {"id": "load", "type": "loader", "depends_on": ["extract"], "config": {"table": flow_id}},
+    ]}}
+
+class CountingPublisher(InMemoryPublisher):
+
+    def __init__(self, failing_topics=()):
+        super().__init__()
+        self.batches = 0
+        self.failing_topics = failing_topics
+
+    def publish_batch(self, messages):
+        self.batches += 1
+        results = super().publish_batch(messages)
+        for result in results:
+            if result["topic"] in self.failing_topics:
+                result.update(message_id=None, error="unavailable")
+        return results
+
+class TestBatchStart:
+
+    @pytest.fixture
+    def publisher(self):
+        return CountingPublisher()
+
+    @pytest.fixture
+    def service(self, mock_flow_repo, state_repo, publisher):
+        mock_flow_repo.get_flow_definition.return_value = None
+        return DynamicFlowService(mock_flow_repo, state_repo, publisher)
+
+    def test_initial_steps_of_all_flows_go_out_in_one_publish(self, service, state_repo, publisher):
+        results = service.execute_flows_batch([_entry(f"flow-{i}") for i in range(5)])
+
+        assert [r["status"] for r in results] == ["started"] * 5
+        assert publisher.batches == 1
+        messages = publisher.drain()
+        assert sorted(m["config"]["source"] for _, m in messages) == [f"flow-{i}" for i in range(5)]
+        for result in results:
+            state = state_repo.get_flow_run_state(result["flow_id"], result["run_id"])
+            assert state["flow_config"]["steps"][0]["status"] == "running"
+
+    def test_per_flow_errors_do_not_stop_the_batch(self, service, publisher):
+        results = service.execute_flows_batch([_entry("flow-a"), {"flow_id": "missing", "account": "acme"}, _entry("flow-b")])
+
+        assert [r["status"] for r in results] == ["started", "error", "started"]
+        assert "not found" in results[1]["error"]
+        assert len(publisher.drain()) == 2
+
+    def test_undelivered_initial_steps_are_marked_failed(self, mock_flow_repo, state_repo):
+        mock_flow_repo.get_flow_definition.return_value = None
+        service = DynamicFlowService(mock_flow_repo, state_repo, CountingPublisher(failing_topics=("extractor",)))
+
+        [result] = service.execute_flows_batch([_entry("flow-a")])
+
+        assert result["undelivered_steps"] == ["extract"]
+        step = state_repo.get_flow_run_state("flow-a", result["run_id"])["flow_config"]["steps"][0]
+        assert step["status"] == "failed" and step["error"] == "unavailable"
+
+    def test_handler_routes_entries_like_single_starts(self, service, publisher):
+        classic = MagicMock()
+        classic.start_flow.return_value = {"status": "started", "run_id": "classic-run"}
+        handler = FlowStartHandler(dynamic_flow_service=service, classic_flow_controller=classic)
+
+        response = handler.handle_batch_start({"action": "batch_start", "account": "acme", "flows": [
+            {"flow_id": "legacy"}, _entry("flow-a")
+        ]})
+
+        assert response["status"] == "success" and response["started"] == 2
+        assert response["results"][0]["run_id"] == "classic-run"
+        classic.start_flow.assert_called_once_with({"account": "acme", "flow_id": "legacy"})
+        assert response["results"][1]["flow_id"] == "flow-a"
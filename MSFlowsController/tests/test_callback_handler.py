@@ -1,6 +1,10 @@
+import copy
 import pytest
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock, ANY
 from core.handlers.callback_handler import CallbackHandler
+from core.interfaces import RunningStepIndexInterface
+from core.utils import metrics
 
 class TestCallbackHandler:
     
@@ -37,7 +41,7 @@ class TestCallbackHandler:
             }
         }
         
-        mock_publisher.publish.return_value = "msg-id-next"
+        mock_publisher.publish_batch.return_value = [{"topic": "topic2", "message_id": "msg-id-next", "error": None}]
 
         # Act
         result = handler.handle_task_callback(message_json)
@@ -49,7 +53,7 @@ class TestCallbackHandler:
 
         # Verify step1 updated to completed
         # Verify step2 dispatched
-        mock_publisher.publish.assert_called_with("topic2", ANY)
+        mock_publisher.publish_batch.assert_called_once_with([("topic2", ANY)])
         
         # Verify state saved
         mock_state_repo.save_flow_run_state.assert_called()
@@ -126,3 +130,149 @@ class TestCallbackHandler:
         # Verify state saved as completed
         saved_state = mock_state_repo.save_flow_run_state.call_args[0][2]
         assert saved_state["status"] == "completed"
+
+    def test_fan_out_is_dispatched_in_one_batch(self, handler, mock_state_repo, mock_publisher):
+        # Arrange
+        message_json = {
+            "flow_id": "test-flow",
+            "run_id": "run-123",
+            "task_id": "root",
+            "account": "test-account",
+            "status": "success"
+        }
+        state = {
+            "flow_id": "test-flow",
+            "run_id": "run-123",
+            "status": "running",
+            "flow_config": {
+                "steps": [{"id": "root", "type": "action", "status": "running"}] + [
+                    {"id": f"b{i}", "type": "branch", "status": "pending", "depends_on": ["root"], "config": {}}
+                    for i in range(3)
+                ]
+            }
+        }
+        stored = {"state": state}
+        mock_state_repo.get_flow_run_state.side_effect = lambda *_: copy.deepcopy(stored["state"])
+        mock_state_repo.save_flow_run_state.side_effect = lambda _f, _r, s: stored.update(state=copy.deepcopy(s))
+        mock_publisher.publish_batch.return_value = [
+            {"topic": "branch", "message_id": "m0", "error": None},
+            {"topic": "branch", "message_id": None, "error": "deadline exceeded"},
+            {"topic": "branch", "message_id": "m2", "error": None},
+        ]
+
+        # Act
+        result = handler.handle_task_callback(message_json)
+
+        # Assert
+        assert result["next_steps"] == ["b0", "b1", "b2"]
+        mock_publisher.publish_batch.assert_called_once()
+        assert len(mock_publisher.publish_batch.call_args[0][0]) == 3
+        mock_publisher.publish.assert_not_called()
+
+        # Only the step whose message failed is marked as failed
+        statuses = {s["id"]: s["status"] for s in stored["state"]["flow_config"]["steps"]}
+        assert statuses == {"root": "completed", "b0": "running", "b1": "failed", "b2": "running"}
+
+    def test_redelivered_callback_is_suppressed_without_state_write(self, handler, mock_state_repo, mock_publisher):
+        # Arrange
+        message_json = {
+            "flow_id": "test-flow",
+            "run_id": "run-123",
+            "task_id": "step1",
+            "account": "test-account",
+            "status": "success"
+        }
+        stored = {"state": {
+            "flow_id": "test-flow",
+            "run_id": "run-123",
+            "status": "running",
+            "flow_config": {
+                "steps": [
+                    {"id": "step1", "type": "action", "status": "running"},
+                    {"id": "step2", "type": "action", "status": "pending", "depends_on": ["step1"], "config": {}}
+                ]
+            }
+        }}
+        mock_state_repo.get_flow_run_state.side_effect = lambda *_: copy.deepcopy(stored["state"])
+        mock_state_repo.save_flow_run_state.side_effect = lambda _f, _r, s: stored.update(state=copy.deepcopy(s))
+        mock_publisher.publish_batch.return_value = [{"topic": "action", "message_id": "m1", "error": None}]
+        metrics.reset()
+
+        # Act
+        first = handler.handle_task_callback(dict(message_json), message_id="pubsub-1")
+        saves = mock_state_repo.save_flow_run_state.call_count
+        same_message = handler.handle_task_callback(dict(message_json), message_id="pubsub-1")
+        same_transition = handler.handle_task_callback(dict(message_json), message_id="pubsub-2")
+
+        # Assert
+        assert first["status"] == "success"
+        assert same_message["status"] == "duplicate"
+        assert same_transition["status"] == "duplicate"
+        assert mock_state_repo.save_flow_run_state.call_count == saves
+        mock_publisher.publish_batch.assert_called_once()
+        assert metrics.get_counter("callbacks.duplicates_suppressed") == 2
+
+    def test_callback_without_task_id_is_routed_by_index(self, handler, mock_state_repo, mock_publisher):
+        # Arrange
+        message_json = {
+            "flow_id": "test-flow",
+            "run_id": "run-123",
+            "account": "test-account",
+            "step": "extractor",
+            "status": "success",
+            "result": {"source": "facebook"}
+        }
+        mock_state_repo.get_flow_run_state.return_value = {
+            "flow_id": "test-flow",
+            "run_id": "run-123",
+            "status": "running",
+            "flow_config": {
+                "steps": [
+                    {"id": "ga", "type": "extractor", "status": "running", "config": {"source": "google_ads"}},
+                    {"id": "fb", "type": "extractor", "status": "running", "config": {"source": "facebook"}}
+                ]
+            }
+        }
+
+        # Act
+        result = handler.handle_task_callback(message_json)
+
+        # Assert
+        assert result["completed_task"] == "fb"
+        saved_state = mock_state_repo.save_flow_run_state.call_args[0][2]
+        assert [s["status"] for s in saved_state["flow_config"]["steps"]] == ["running", "completed"]
+
+    def test_running_steps_are_indexed_with_their_own_timeout(self, mock_state_repo, mock_notification_service, mock_publisher):
+        # Arrange
+        running_index = MagicMock(spec=RunningStepIndexInterface)
+        handler = CallbackHandler(mock_state_repo, mock_notification_service, mock_publisher, running_index=running_index)
+        message_json = {
+            "flow_id": "test-flow",
+            "run_id": "run-123",
+            "task_id": "step1",
+            "account": "test-account",
+            "status": "success"
+        }
+        mock_state_repo.get_flow_run_state.return_value = {
+            "flow_id": "test-flow",
+            "run_id": "run-123",
+            "status": "running",
+            "flow_config": {
+                "steps": [
+                    {"id": "step1", "type": "action", "status": "running", "timeout_deadline": 1000},
+                    {"id": "step2", "type": "action", "status": "pending", "depends_on": ["step1"],
+                     "timeout_minutes": 5, "config": {}}
+                ]
+            }
+        }
+        mock_publisher.publish_batch.return_value = [{"topic": "action", "message_id": "m1", "error": None}]
+
+        # Act
+        handler.handle_task_callback(message_json)
+
+        # Assert
+        step2 = mock_state_repo.save_flow_run_state.call_args[0][2]["flow_config"]["steps"][1]
+        started_at = datetime.fromisoformat(step2["started_at"])
+        assert step2["timeout_deadline"] == int((started_at + timedelta(minutes=5)).timestamp())
+        running_index.add.assert_called_once_with([("test-flow", "run-123", "step2", step2["timeout_deadline"])])
+        running_index.remove.assert_called_once_with([("test-flow", "run-123", "step1", 1000)])
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import tasks
+from benchmarks.fake_gcs import FakeStorageClient
+from benchmarks.fake_pubsub import FakePublisherClient
+from worker.flowscontroller import FlowController
+
+
+def _execution_status():
+    return {"flow_id": "legacy", "account": "acme", "run_id": "run-1", "status": "running", "tasks": {
+        "extract": {"status": "pending", "start": None, "end": None, "messages": []},
+        "load": {"status": "pending", "start": None, "end": None, "messages": []},
+    }}
+
+class TestExecuteSingleTask:
+
+    @pytest.fixture
+    def controller(self, monkeypatch):
+        monkeypatch.setenv("RUNS_BUCKET", "runs")
+        fc = FlowController(publisher_client=FakePublisherClient(), storage_client=FakeStorageClient())
+        fc._save_execution_status_running("run-1", _execution_status())
+        monkeypatch.setattr(tasks, "_flow_controller", fc)
+        return fc
+
+    def test_publishes_inline_with_one_state_write(self, controller, monkeypatch):
+        monkeypatch.setattr(tasks.publish_to_pubsub, "delay", lambda *a: pytest.fail("nested Celery task"))
+        bucket = controller.storage_client.bucket("runs")
+        writes = bucket.stats["writes"]
+
+        assert tasks.execute_single_task.run("extract", {"type": "extractor", "config": {"source": "pms"}}, "run-1") == "msg-1"
+
+        assert bucket.stats["writes"] == writes + 1
+        [(topic, data)] = controller.publisher.messages
+        assert topic.endswith("/topics/extractor")
+        assert json.loads(data) == {"flow_id": "legacy", "account": "acme", "run_id": "run-1", "task_id": "extract", "config": {"source": "pms"}}
+        assert controller._load_execution_status_running("run-1")["tasks"]["extract"]["status"] == "executing"
+
+    def test_delta_keeps_concurrent_updates_and_failure_is_recorded(self, controller, monkeypatch):
+        controller._update_task_status("run-1", "load", {"status": "executing"})
+        monkeypatch.setattr(controller, "_publish_task_message", lambda *a: (_ for _ in ()).throw(RuntimeError("topic not found")))
+
+        with pytest.raises(RuntimeError):
+            tasks.execute_single_task.run("extract", {"type": "extractor"}, "run-1")
+
+        state = controller._load_execution_status_running("run-1")["tasks"]
+        assert state["load"]["status"] == "executing"
+        assert state["extract"]["status"] == "failed" and state["extract"]["messages"] == ["topic not found"]
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from benchmarks.fake_gcs import FakeStorageClient
+from benchmarks.fake_pubsub import FakePublisherClient
+from core.config import config
+from flows.classic import CLASSIC_SOURCE_KEY, STATE_LOCATION_KEY, convert_classic_state
+from flows.timeouts import TIMEOUT_DEADLINE_KEY
+from storage.repositories import FlowRunStateRepository
+from storage.running_index import RunningStepIndex
+from worker.flowscontroller import FlowController
+
+DEFINITION = {"flow_id": "legacy", "account": "acme", "tasks": {
+    "extract": {"type": "extractor", "config": {"source": "pms"}},
+    "load": {"type": "loader", "config": {"dataset": "raw"}, "depends_on": ["extract"]},
+}}
+
+class TestClassicConversion:
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setenv("FLOWS_BUCKET", config.FLOWS_BUCKET)
+        monkeypatch.setenv("RUNS_BUCKET", config.RUNS_BUCKET)
+        client = FakeStorageClient()
+        client.bucket(config.FLOWS_BUCKET).blob("graphs/acme/legacy.json").upload_from_string(json.dumps(DEFINITION))
+        return client
+
+    @pytest.fixture
+    def repo(self, client):
+        return FlowRunStateRepository(storage_client=client)
+
+    def test_start_converts_once_and_callbacks_read_directly(self, client, repo):
+        controller = FlowController(publisher_client=FakePublisherClient(), storage_client=client, state_repo=repo)
+        run_id = controller.start_flow({"flow_id": "legacy", "account": "acme"})["run_id"]
+
+        classic = json.loads(client.bucket(config.RUNS_BUCKET).blob(f"running/{run_id}.json").download_as_text())
+        assert classic[STATE_LOCATION_KEY] == f"flow-runs/legacy/{run_id}"
+
+        runs, flows = client.bucket(config.RUNS_BUCKET), client.bucket(config.FLOWS_BUCKET)
+        runs_reads, flows_reads = runs.stats["reads"], flows.stats["reads"]
+        state = repo.get_flow_run_state("legacy", run_id)
+        assert (runs.stats["reads"], flows.stats["reads"]) == (runs_reads + 1, flows_reads)
+
+        assert state["status"] == "running"
+        assert state[CLASSIC_SOURCE_KEY] == f"running/{run_id}.json"
+        steps = {step["id"]: step for step in state["flow_config"]["steps"]}
+        assert (steps["extract"]["status"], steps["extract"]["type"]) == ("running", "extractor")
+        assert (steps["load"]["status"], steps["load"]["depends_on"]) == ("pending", ["extract"])
+
+    def test_converted_running_steps_get_a_deadline_and_a_marker(self, client, repo):
+        controller = FlowController(publisher_client=FakePublisherClient(), storage_client=client, state_repo=repo)
+        run_id = controller.start_flow({"flow_id": "legacy", "account": "acme"})["run_id"]
+
+        extract = repo.get_flow_run_state("legacy", run_id)["flow_config"]["steps"][0]
+        overdue = RunningStepIndex(storage_client=client).list_overdue(extract[TIMEOUT_DEADLINE_KEY])
+        assert [(entry["run_id"], entry["step_id"]) for entry in overdue] == [(run_id, "extract")]
+
+    def test_failed_initial_publish_fails_the_converted_step(self, client, repo):
+        publisher = FakePublisherClient()
+        def fail(*args, **kwargs):
+            raise RuntimeError("publish rejected")
+        publisher.publish = fail
+        controller = FlowController(publisher_client=publisher, storage_client=client, state_repo=repo)
+
+        with pytest.raises(RuntimeError):
+            controller.start_flow({"flow_id": "legacy", "account": "acme"})
+
+        run_id = client.bucket(config.RUNS_BUCKET).list_blobs(prefix="running/")[0].name[len("running/"):-len(".json")]
+        extract = repo.get_flow_run_state("legacy", run_id)["flow_config"]["steps"][0]
+        assert (extract["status"], extract["error"]) == ("failed", "publish rejected")
+        assert RunningStepIndex(storage_client=client).list_overdue(extract[TIMEOUT_DEADLINE_KEY]) == []
+
+    def test_unconverted_run_is_converted_on_first_callback(self, client, repo):
+        classic = {"flow_id": "legacy", "account": "acme", "run_id": "old-run", "status": "executing",
+                   "created_at": "2026-10-01T03:00:00+00:00", "tasks": {"extract": {"status": "executing"}}}
+        client.bucket(config.RUNS_BUCKET).blob("running/old-run.json").upload_from_string(json.dumps(classic))
+
+        state = repo.get_flow_run_state("legacy", "old-run")
+        assert state["flow_config"]["steps"][0]["config"] == {"source": "pms"}
+        repo.save_flow_run_state("legacy", "old-run", state)
+
+        flows = client.bucket(config.FLOWS_BUCKET)
+        flows_reads = flows.stats["reads"]
+        assert repo.get_flow_run_state("legacy", "old-run")["flow_config"]["steps"][0]["status"] == "running"
+        assert flows.stats["reads"] == flows_reads
+
+    def test_missing_definition_keeps_placeholder_steps(self):
+        state = convert_classic_state({"run_id": "r", "tasks": {"a": {}}}, None)
+        assert state["flow_config"]["steps"][0]["type"] == "unknown"
+        assert state["flow_config"]["steps"][0]["status"] == "pending"
@@ -0,0 +1,61 @@
+import base64
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_gcs import FakeStorageClient
+from core.config import config
+from core.utils.codecs import codec_names, get_codec, missing_requirements
+from core.utils.message_utils import decode_message_data
+from storage.repositories import FlowRunStateRepository
+
+STATE = {"flow_id": "f", "run_id": "r", "account": "acme", "status": "running",
+         "flow_config": {"steps": [{"id": "dbt", "type": "dbt", "result": {"transformation_result": {"results": [{"n": 1}] * 50}}}]}}
+
+AVAILABLE = [name for name in codec_names() if not missing_requirements(name)]
+
+class TestCodecs:
+
+    @pytest.mark.parametrize("name", AVAILABLE)
+    def test_round_trip(self, name):
+        codec = get_codec(name)
+        assert codec.decode(codec.encode(STATE)) == STATE
+
+    def test_unknown_or_unavailable_codec_is_rejected(self):
+        with pytest.raises(ValueError):
+            get_codec("xml")
+        for name in set(codec_names()) - set(AVAILABLE):
+            with pytest.raises(ValueError, match="requires"):
+                get_codec(name)
+
+    def test_state_is_read_back_whatever_codec_wrote_it(self):
+        client = FakeStorageClient()
+        bucket = client.bucket(config.RUNS_BUCKET)
+        bucket.blob("flow-runs/f/legacy.json").upload_from_string(json.dumps({**STATE, "run_id": "legacy"}, indent=2))
+        FlowRunStateRepository(client, codec=get_codec("json+gzip")).save_flow_run_state("f", "r", dict(STATE))
+
+        reader = FlowRunStateRepository(client, codec=get_codec("json"))
+
+        blob = bucket.get_blob("flow-runs/f/r.json")
+        assert blob.content_type == "application/json+gzip"
+        assert reader.get_flow_run_state("f", "r")["flow_config"] == STATE["flow_config"]
+        assert reader.get_flow_run_state("f", "legacy")["run_id"] == "legacy"
+
+    def test_default_state_document_is_compact_json(self):
+        client = FakeStorageClient()
+        FlowRunStateRepository(client).save_flow_run_state("f", "r", dict(STATE))
+
+        blob = client.bucket(config.RUNS_BUCKET).get_blob("flow-runs/f/r.json")
+        assert blob.content_type == "application/json"
+        assert b"\n" not in blob.download_as_bytes()
+
+    def test_messages_are_decoded_by_content_type_attribute(self):
+        codec = get_codec("json+gzip")
+        event = SimpleNamespace(data={"message": {
+            "data": base64.b64encode(codec.encode({"flow_id": "f", "task_id": "t"})).decode(),
+            "attributes": {"content_type": codec.content_type}}})
+        plain = SimpleNamespace(data={"message": {"data": base64.b64encode(b'{"flow_id": "f"}').decode()}})
+
+        assert decode_message_data(event) == {"flow_id": "f", "task_id": "t"}
+        assert decode_message_data(plain) == {"flow_id": "f"}
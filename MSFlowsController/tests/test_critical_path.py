@@ -0,0 +1,67 @@
+import pytest
+
+from benchmarks.fake_gcs import FakeStorageClient
+from core.handlers.callback_handler import CallbackHandler
+from core.services.admission import AdmissionController
+from flows.critical_path import compute_critical_path
+from storage.admission_ledger import AdmissionLedger
+from storage.step_history import StepHistoryRepository
+
+
+def _steps():
+    # leaf: short single task; chain: long extractor followed by two more steps
+    return [
+        {"id": "root", "type": "start"},
+        {"id": "leaf", "type": "kpi", "depends_on": ["root"]},
+        {"id": "extract", "type": "extract", "depends_on": ["root"]},
+        {"id": "transform", "type": "dbt", "depends_on": ["extract"]},
+        {"id": "load", "type": "qlik", "depends_on": ["transform"]},
+    ]
+
+class TestCriticalPath:
+
+    def test_lengths_use_history_and_default(self):
+        lengths = compute_critical_path(_steps(), {"extract": 600, "leaf": 30}, default_seconds=10)
+
+        assert lengths == {"root": 630.0, "leaf": 30.0, "extract": 620.0, "transform": 20.0, "load": 10.0}
+
+    def test_history_is_smoothed_per_step(self):
+        history = StepHistoryRepository(storage_client=FakeStorageClient())
+
+        history.record_run("acme", "daily", {"extract": 100.0})
+        history.record_run("acme", "daily", {"extract": 200.0})
+
+        assert history.get_durations("acme", "daily") == {"extract": pytest.approx(130.0)}
+        assert history.get_durations("acme", "other") == {}
+
+    def test_ready_steps_are_dispatched_longest_path_first(self, mock_state_repo, mock_notification_service, mock_publisher):
+        steps = _steps()
+        steps[0]["status"] = "running"
+        mock_state_repo.get_flow_run_state.return_value = {
+            "flow_id": "flow", "run_id": "run", "account": "acme", "status": "running",
+            "flow_config": {"steps": steps},
+            "critical_path": compute_critical_path(steps, {"extract": 600, "leaf": 30})
+        }
+        mock_publisher.publish_batch.side_effect = lambda messages: [
+            {"topic": topic, "message_id": "m", "error": None} for topic, _ in messages
+        ]
+        handler = CallbackHandler(mock_state_repo, mock_notification_service, mock_publisher)
+
+        result = handler.handle_task_callback({"flow_id": "flow", "run_id": "run", "account": "acme", "task_id": "root", "status": "completed"})
+
+        assert result["next_steps"] == ["extract", "leaf"]
+        published = mock_publisher.publish_batch.call_args[0][0]
+        assert [message["task_id"] for _, message in published] == ["extract", "leaf"]
+
+    def test_admission_prefers_higher_priority(self):
+        admission = AdmissionController(AdmissionLedger(storage_client=FakeStorageClient()), 1, 0, 0, {}, {})
+        entry = {"flow_id": "flow", "account": "acme", "topic": "t"}
+        admission.enqueue([{**entry, "run_id": "r0", "step_id": "busy", "priority": 1.0}])
+
+        admission.enqueue([
+            {**entry, "run_id": "r1", "step_id": "leaf", "priority": 30.0},
+            {**entry, "run_id": "r1", "step_id": "extract", "priority": 620.0},
+        ])
+        admitted = admission.release([{**entry, "run_id": "r0", "step_id": "busy"}])
+
+        assert [e["step_id"] for e in admitted] == ["extract"]
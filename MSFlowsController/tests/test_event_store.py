@@ -0,0 +1,88 @@
+import pytest
+
+from benchmarks.fake_gcs import FakeStorageClient
+from core.config import config
+from core.exceptions import StateConflictError
+from storage.event_store import FlowRunEventStore, apply_ops, diff_state
+from storage.repositories import FlowRunStateRepository
+
+
+class TestFlowRunEventStore:
+
+    @pytest.fixture
+    def client(self):
+        return FakeStorageClient()
+
+    @pytest.fixture
+    def initial_state(self):
+        return {
+            "flow_id": "flow",
+            "run_id": "run",
+            "status": "running",
+            "flow_config": {
+                "steps": [
+                    {"id": "a", "status": "running", "config": {"datasets": ["x"] * 50}},
+                    {"id": "b", "status": "pending", "depends_on": ["a"], "config": {"datasets": ["y"] * 50}}
+                ]
+            }
+        }
+
+    def test_diff_only_contains_changed_step(self, initial_state):
+        new = {**initial_state, "flow_config": {"steps": [dict(s) for s in initial_state["flow_config"]["steps"]]}}
+        new["flow_config"]["steps"][0]["status"] = "completed"
+
+        ops = diff_state(initial_state, new)
+
+        assert ops == [["set", ["flow_config", "steps", 0, "status"], "completed"]]
+        assert apply_ops(initial_state, ops)["flow_config"]["steps"][0]["status"] == "completed"
+
+    def test_state_is_rebuilt_from_snapshot_and_events(self, client, initial_state):
+        writer = FlowRunEventStore(storage_client=client)
+        writer.save_flow_run_state("flow", "run", initial_state)
+
+        state = writer.get_flow_run_state("flow", "run")
+        state["flow_config"]["steps"][0]["status"] = "completed"
+        writer.save_flow_run_state("flow", "run", state)
+
+        reader = FlowRunEventStore(storage_client=client)
+        rebuilt = reader.get_flow_run_state("flow", "run")
+
+        assert rebuilt["flow_config"]["steps"][0]["status"] == "completed"
+        events = client.bucket(config.RUNS_BUCKET).list_blobs(prefix="flow-runs/flow/run/events/")
+        assert len(events) == 1
+        assert events[0].size < 200
+
+    def test_stale_writer_gets_conflict(self, client, initial_state):
+        FlowRunEventStore(storage_client=client).save_flow_run_state("flow", "run", initial_state)
+        first, second = FlowRunEventStore(storage_client=client), FlowRunEventStore(storage_client=client)
+        first_state = first.get_flow_run_state("flow", "run")
+        second_state = second.get_flow_run_state("flow", "run")
+
+        first_state["status"] = "completed"
+        first.save_flow_run_state("flow", "run", first_state)
+
+        second_state["status"] = "error"
+        with pytest.raises(StateConflictError):
+            second.save_flow_run_state("flow", "run", second_state)
+
+    def test_writers_racing_to_create_the_snapshot(self, client, initial_state):
+        # Run stored as a single document: both writers read it without a snapshot
+        FlowRunStateRepository(storage_client=client).save_flow_run_state("flow", "run", initial_state)
+        first, second = FlowRunEventStore(storage_client=client), FlowRunEventStore(storage_client=client)
+        first_state = first.get_flow_run_state("flow", "run")
+        second_state = second.get_flow_run_state("flow", "run")
+
+        first_state["flow_config"]["steps"][0]["status"] = "completed"
+        first.save_flow_run_state("flow", "run", first_state)
+
+        second_state["flow_config"]["steps"][1]["status"] = "completed"
+        with pytest.raises(StateConflictError):
+            second.save_flow_run_state("flow", "run", second_state)
+
+        # The loser re-reads and re-applies its change on top of the winner's
+        second_state = second.get_flow_run_state("flow", "run")
+        second_state["flow_config"]["steps"][1]["status"] = "completed"
+        second.save_flow_run_state("flow", "run", second_state)
+
+        rebuilt = FlowRunEventStore(storage_client=client).get_flow_run_state("flow", "run")
+        assert [step["status"] for step in rebuilt["flow_config"]["steps"]] == ["completed", "completed"]
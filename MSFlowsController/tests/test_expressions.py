@@ -0,0 +1,63 @@
+import pytest
+
+from benchmarks.fake_gcs import FakeStorageClient
+from benchmarks.fake_pubsub import InMemoryPublisher
+from core.handlers.callback_handler import CallbackHandler
+from core.services.dynamic_flow_service import DynamicFlowService
+from flows.expressions import TEMPLATE_PATHS_KEY, compile_template, render_value
+from flows.normalization import normalize_steps
+from storage.repositories import FlowRunStateRepository
+
+SCOPE = {"account": "acme", "context": {"dataset": "raw"}, "steps": {"extract": {"result": {"rows": 2500, "files": ["a.csv", "b.csv"]}}}}
+
+class TestExpressions:
+
+    @pytest.mark.parametrize("template, expected", [
+        ("{{ steps.extract.result.rows }}", 2500),
+        ("{{ steps['extract'].result.files[-1] }}", "b.csv"),
+        ("{{ context.dataset }}.kpis_{{ account }}", "raw.kpis_acme"),
+        ("{{ steps.extract.result.rows // 1000 + 1 }}", 3),
+        ("{{ 'full' if steps.extract.result.rows > 1000 else 'incremental' }}", "full"),
+        ("{{ context.missing or 'default' }}", "default"),
+        ("{{ context.missing }}", "{{ context.missing }}"),
+        ("{{ ref('orders') }} {{ account }}", "{{ ref('orders') }} acme"),
+        ("no templates", "no templates"),
+    ])
+    def test_render_value(self, template, expected):
+        assert render_value(template, SCOPE) == expected
+
+    def test_templates_are_compiled_once(self):
+        assert compile_template("{{ account }}-x") is compile_template("{{ account }}-x")
+        assert compile_template("{{ import os }}") is None
+
+    def test_normalization_records_template_paths(self):
+        steps = normalize_steps({"steps": [
+            {"id": "load", "type": "loader", "config": {"table": "t", "options": {"since": "{{ steps.extract.result.max }}"}, "files": ["{{ account }}"]}},
+            {"id": "plain", "type": "loader", "config": {"table": "t"}},
+        ]})
+
+        assert steps[0][TEMPLATE_PATHS_KEY] == [["options", "since"], ["files", 0]]
+        assert TEMPLATE_PATHS_KEY not in steps[1]
+
+    def test_dispatched_steps_see_context_and_previous_results(self, mock_flow_repo, mock_notification_service):
+        state_repo = FlowRunStateRepository(storage_client=FakeStorageClient())
+        publisher = InMemoryPublisher()
+        mock_flow_repo.get_flow_definition.return_value = None
+        service = DynamicFlowService(mock_flow_repo, state_repo, publisher)
+        service.execute_flow({"flow_id": "kpis", "account": "acme", "context": {"dataset": "raw"}, "flow_config": {"steps": [
+            {"id": "extract", "type": "extractor", "config": {"target": "{{ context.dataset }}.{{ account }}"}},
+            {"id": "load", "type": "loader", "depends_on": ["extract"], "config": {
+                "since": "{{ steps.extract.result.max_extracted_at }}",
+                "mode": "{{ 'full' if steps.extract.result.rows > 1000 else 'incremental' }}"}},
+        ]}})
+        [(_, start)] = publisher.drain()
+        assert start["config"]["target"] == "raw.acme"
+
+        CallbackHandler(state_repo, mock_notification_service, publisher).handle_task_callback({
+            "flow_id": "kpis", "run_id": start["run_id"], "account": "acme", "task_id": "extract", "status": "completed",
+            "result": {"rows": 10, "max_extracted_at": "2026-10-01"}})
+
+        [(_, message)] = publisher.drain()
+        assert (message["since"], message["mode"]) == ("2026-10-01", "incremental")
+        stored = state_repo.get_flow_run_state("kpis", start["run_id"])["flow_config"]["steps"][1]
+        assert stored["config"]["since"] == "{{ steps.extract.result.max_extracted_at }}"
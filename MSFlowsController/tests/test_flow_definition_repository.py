@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from benchmarks.fake_gcs import FakeStorageClient
+from core.config import config
+from storage import repositories
+from storage.repositories import FlowDefinitionRepository
+
+
+class TestFlowDefinitionRepository:
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        repositories._definition_cache.clear()
+        yield
+        repositories._definition_cache.clear()
+
+    @pytest.fixture
+    def client(self):
+        client = FakeStorageClient()
+        client.bucket(config.FLOWS_BUCKET).blob("graphs/acme/daily.json").upload_from_string(
+            json.dumps({"flow_id": "daily", "steps": [{"id": "extract"}]})
+        )
+        return client
+
+    def test_fresh_entry_is_served_without_requests(self, client):
+        repo = FlowDefinitionRepository(storage_client=client)
+        bucket = client.bucket(config.FLOWS_BUCKET)
+
+        repo.get_flow_definition("acme", "daily")
+        reads = bucket.stats["reads"]
+        definition = repo.get_flow_definition("acme", "daily")
+
+        assert definition["flow_id"] == "daily"
+        assert bucket.stats["reads"] == reads
+
+    def test_callers_cannot_mutate_cached_definition(self, client):
+        repo = FlowDefinitionRepository(storage_client=client)
+
+        repo.get_flow_definition("acme", "daily")["steps"] = []
+
+        assert repo.get_flow_definition("acme", "daily")["steps"] == [{"id": "extract"}]
+
+    def test_stale_entry_is_revalidated_by_generation(self, client, monkeypatch):
+        monkeypatch.setattr(repositories._definition_cache, "ttl_seconds", 0)
+        repo = FlowDefinitionRepository(storage_client=client)
+        bucket = client.bucket(config.FLOWS_BUCKET)
+
+        repo.get_flow_definition("acme", "daily")
+        reads = bucket.stats["reads"]
+        repo.get_flow_definition("acme", "daily")
+        assert bucket.stats["reads"] == reads
+
+        bucket.blob("graphs/acme/daily.json").upload_from_string(json.dumps({"flow_id": "daily", "steps": []}))
+        assert repo.get_flow_definition("acme", "daily")["steps"] == []
+
+    def test_missing_definition_is_not_cached(self, client):
+        repo = FlowDefinitionRepository(storage_client=client)
+
+        assert repo.get_flow_definition("acme", "weekly") is None
+
+        client.bucket(config.FLOWS_BUCKET).blob("graphs/acme/weekly.json").upload_from_string(json.dumps({"flow_id": "weekly"}))
+        assert repo.get_flow_definition("acme", "weekly") == {"flow_id": "weekly"}
@@ -0,0 +1,63 @@
+import pytest
+from google.api_core.exceptions import InternalServerError, ServiceUnavailable, TooManyRequests
+
+from benchmarks.fake_gcs import FakeBlob, FakeStorageClient
+from core.config import config
+from core.exceptions import StateConflictError
+from storage.repositories import STATE_GENERATION_KEY, FlowRunStateRepository
+
+
+class TestFlowRunStateRepository:
+
+    @pytest.fixture
+    def repo(self):
+        return FlowRunStateRepository(storage_client=FakeStorageClient())
+
+    def test_read_attaches_generation(self, repo):
+        repo.save_flow_run_state("flow", "run", {"status": "running"})
+
+        state = repo.get_flow_run_state("flow", "run")
+
+        assert state["status"] == "running"
+        assert state[STATE_GENERATION_KEY] == 1
+
+    def test_stale_write_raises_conflict(self, repo):
+        repo.save_flow_run_state("flow", "run", {"status": "running"})
+        first = repo.get_flow_run_state("flow", "run")
+        second = repo.get_flow_run_state("flow", "run")
+
+        first["status"] = "completed"
+        repo.save_flow_run_state("flow", "run", first)
+
+        second["status"] = "error"
+        with pytest.raises(StateConflictError):
+            repo.save_flow_run_state("flow", "run", second)
+
+        assert repo.get_flow_run_state("flow", "run")["status"] == "completed"
+
+    def test_generation_is_not_persisted(self, repo):
+        repo.save_flow_run_state("flow", "run", {"status": "running"})
+        state = repo.get_flow_run_state("flow", "run")
+        repo.save_flow_run_state("flow", "run", state)
+
+        raw = repo._get_bucket(config.RUNS_BUCKET).blob("flow-runs/flow/run.json").download_as_text()
+
+        assert STATE_GENERATION_KEY not in raw
+
+    @pytest.mark.parametrize("error, expected", [
+        (TooManyRequests, StateConflictError),
+        (ServiceUnavailable, StateConflictError),
+        (InternalServerError, InternalServerError),
+    ])
+    def test_failed_write_is_raised_and_keeps_generation(self, repo, monkeypatch, error, expected):
+        repo.save_flow_run_state("flow", "run", {"status": "running"})
+        state = repo.get_flow_run_state("flow", "run")
+
+        def fail(*args, **kwargs):
+            raise error("write rejected")
+        monkeypatch.setattr(FakeBlob, "upload_from_string", fail)
+        state["status"] = "completed"
+        with pytest.raises(expected):
+            repo.save_flow_run_state("flow", "run", state)
+
+        assert state[STATE_GENERATION_KEY] == 1
@@ -0,0 +1,91 @@
+import pytest
+
+from core.exceptions import FlowConfigurationError
+from core.services.dynamic_flow_service import DynamicFlowService
+from flows.normalization import normalize_steps
+
+
+def _kpis(**config):
+    return {"id": "kpis", "type": "map", "config": {"item_key": "hotel_id", "step": {"type": "kpi", "config": {"metric": "adr"}}, **config}}
+
+class TestMapStep:
+
+    @pytest.fixture
+    def service(self, mock_flow_repo, state_repo, publisher):
+        mock_flow_repo.get_flow_definition.return_value = None
+        return DynamicFlowService(mock_flow_repo, state_repo, publisher)
+
+    @pytest.fixture
+    def hotels_run(self, save_run):
+        return lambda steps: save_run(normalize_steps({"steps": steps}), flow_id="hotels")
+
+    @pytest.fixture
+    def hotels_callback(self, callback):
+        return lambda task_id, result=None, run_id="run-1": callback(task_id, result=result, flow_id="hotels", run_id=run_id)
+
+    def test_static_items_fan_out_within_parallelism_and_join(self, service, handler, hotels_callback, state_repo, publisher):
+        service.execute_flow({"flow_id": "hotels", "account": "acme", "flow_config": {"steps": [
+            _kpis(items=["H1", "H2", "H3"], parallelism=2),
+            {"id": "report", "type": "report", "depends_on": ["kpis"]},
+        ]}})
+        published = publisher.drain()
+        run_id = published[0][1]["run_id"]
+
+        assert [m["task_id"] for _, m in published] == ["kpis[0]", "kpis[1]"]
+        assert [m["hotel_id"] for _, m in published] == ["H1", "H2"]
+
+        handler.handle_task_callback(hotels_callback("kpis[0]", {"adr": 100}, run_id=run_id))
+        assert [m["task_id"] for _, m in publisher.drain()] == ["kpis[2]"]
+        handler.handle_task_callback(hotels_callback("kpis[2]", {"adr": 300}, run_id=run_id))
+        assert publisher.drain() == []
+
+        response = handler.handle_task_callback(hotels_callback("kpis[1]", {"adr": 200}, run_id=run_id))
+        assert response["next_steps"] == ["report"]
+        steps = {s["id"]: s for s in state_repo.get_flow_run_state("hotels", run_id)["flow_config"]["steps"]}
+        assert steps["kpis"]["status"] == "completed"
+        assert steps["kpis"]["result"] == {"items": 3, "results": [{"adr": 100}, {"adr": 200}, {"adr": 300}]}
+
+        publisher.drain()
+        assert handler.handle_task_callback(hotels_callback("report", run_id=run_id))["status"] == "flow_completed"
+
+    def test_items_from_previous_step_result(self, handler, hotels_run, hotels_callback, state_repo):
+        hotels_run([
+            {"id": "list", "type": "lister", "status": "running"},
+            {**_kpis(items_from={"step": "list", "path": "data.hotels"}), "depends_on": ["list"]},
+        ])
+
+        response = handler.handle_task_callback(hotels_callback("list", {"data": {"hotels": ["H7", "H8"]}}))
+
+        assert response["next_steps"] == ["kpis[0]", "kpis[1]"]
+        children = [s for s in state_repo.get_flow_run_state("hotels", "run-1")["flow_config"]["steps"] if s.get("map_parent")]
+        assert [c["config"] for c in children] == [{"metric": "adr", "hotel_id": "H7"}, {"metric": "adr", "hotel_id": "H8"}]
+
+    def test_empty_list_completes_map_and_releases_dependents(self, handler, hotels_run, hotels_callback):
+        hotels_run([
+            {"id": "list", "type": "lister", "status": "running"},
+            {**_kpis(items_from="list.hotels"), "depends_on": ["list"]},
+            {"id": "report", "type": "report", "depends_on": ["kpis"]},
+        ])
+
+        response = handler.handle_task_callback(hotels_callback("list", {"hotels": []}))
+
+        assert response["next_steps"] == ["report"]
+
+    def test_unresolvable_items_fail_the_flow(self, handler, hotels_run, hotels_callback, state_repo, mock_notification_service):
+        hotels_run([
+            {"id": "list", "type": "lister", "status": "running"},
+            {**_kpis(items_from="list.hotels"), "depends_on": ["list"]},
+        ])
+
+        response = handler.handle_task_callback(hotels_callback("list", {"rows": 3}))
+
+        assert response["status"] == "error" and response["failed_task"] == "kpis"
+        assert state_repo.get_flow_run_state("hotels", "run-1")["status"] == "error"
+        mock_notification_service.send_flow_notification.assert_called_once()
+
+    def test_normalization_rejects_incomplete_map_steps(self):
+        with pytest.raises(FlowConfigurationError):
+            normalize_steps({"steps": [{"id": "kpis", "type": "map", "config": {"items": []}}]})
+        with pytest.raises(FlowConfigurationError):
+            normalize_steps({"steps": [_kpis(items_from="list.hotels")]})
+        assert normalize_steps({"steps": [_kpis(items=[])]})[0]["config"]["parallelism"] == 10
@@ -0,0 +1,71 @@
+import copy
+
+import pytest
+
+from core.handlers.callback_handler import CallbackHandler
+from core.services.memoization import ResultMemoizer
+from flows.memoization import compute_cache_key
+from storage.result_cache import StepResultCache
+
+STEPS = [
+    {"id": "extract", "type": "extractor", "status": "running"},
+    {"id": "dbt", "type": "dbt", "depends_on": ["extract"], "config": {"models": "kpis"},
+     "cache_key": {"fields": ["file_count", "max_extracted_at"]}},
+    {"id": "reload", "type": "qlik", "depends_on": ["dbt"], "cache_key": True},
+]
+
+class TestMemoization:
+
+    @pytest.fixture
+    def handler(self, client, state_repo, publisher, dispatcher, mock_notification_service):
+        memoizer = ResultMemoizer(StepResultCache(storage_client=client))
+        return CallbackHandler(state_repo, mock_notification_service, publisher, dispatcher=dispatcher, memoizer=memoizer)
+
+    @pytest.fixture
+    def start_run(self, save_run, handler, callback):
+        """Saves a 'daily' run and reports its extract step as completed."""
+        def start(run_id, extract_result):
+            save_run(copy.deepcopy(STEPS), flow_id="daily", run_id=run_id)
+            return handler.handle_task_callback(callback("extract", result=extract_result, flow_id="daily", run_id=run_id))
+        return start
+
+    @pytest.fixture
+    def complete_run(self, start_run, handler, callback, publisher):
+        """Runs a 'daily' run to the end, every dispatched step returning {"rows": 10}."""
+        def complete(run_id, extract_result):
+            response = start_run(run_id, extract_result)
+            published = publisher.drain()
+            while published:
+                for _, message in published:
+                    response = handler.handle_task_callback(callback(message["task_id"], result={"rows": 10}, flow_id="daily", run_id=run_id))
+                published = publisher.drain()
+            return response
+        return complete
+
+    def test_key_only_depends_on_policy_fields(self):
+        step = {"id": "dbt", "type": "dbt", "config": {}, "cache_key": {"fields": ["file_count"]}}
+
+        assert compute_cache_key(step, {"extract": {"file_count": 3, "elapsed": 1}}) == \
+            compute_cache_key(step, {"extract": {"file_count": 3, "elapsed": 9}})
+        assert compute_cache_key(step, {"extract": {"file_count": 3}}) != \
+            compute_cache_key(step, {"extract": {"file_count": 4}})
+
+    def test_unchanged_inputs_skip_downstream_steps(self, complete_run, start_run, run_steps, publisher):
+        complete_run("run-1", {"file_count": 3, "max_extracted_at": "2025-01-01"})
+
+        response = start_run("run-2", {"file_count": 3, "max_extracted_at": "2025-01-01"})
+
+        assert response["status"] == "flow_completed"
+        assert response["cached_steps"] == ["dbt", "reload"]
+        assert publisher.drain() == []
+        steps = run_steps("daily", "run-2")
+        assert steps["dbt"]["cached"] is True
+        assert steps["dbt"]["result"] == {"rows": 10}
+
+    def test_new_upstream_data_dispatches_step(self, complete_run, start_run, publisher):
+        complete_run("run-1", {"file_count": 3, "max_extracted_at": "2025-01-01"})
+
+        response = start_run("run-2", {"file_count": 5, "max_extracted_at": "2025-01-02"})
+
+        assert response["cached_steps"] == []
+        assert [m["task_id"] for _, m in publisher.drain()] == ["dbt"]
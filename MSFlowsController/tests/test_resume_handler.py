@@ -0,0 +1,53 @@
+import pytest
+
+from core.handlers.resume_handler import RunResumeHandler
+
+
+class TestRunResumeHandler:
+
+    @pytest.fixture
+    def resume_handler(self, state_repo, dispatcher):
+        return RunResumeHandler(state_repo, dispatcher)
+
+    @pytest.fixture
+    def failed_run(self, save_run):
+        return lambda: save_run([
+            {"id": "extract", "type": "extractor", "status": "completed", "result": {"files": 12}},
+            {"id": "load", "type": "loader", "depends_on": ["extract"], "status": "failed", "error": "boom"},
+            {"id": "kpi", "type": "kpi", "depends_on": ["load"], "status": "pending"},
+        ], status="error", error="Task load failed", failed_task="load")
+
+    def test_resets_failed_and_downstream_and_dispatches_frontier(self, resume_handler, failed_run, state_repo, publisher):
+        failed_run()
+
+        result = resume_handler.handle_resume("flow", "run-1")
+
+        assert result["status"] == "resumed"
+        assert result["reset_steps"] == ["load", "kpi"]
+        assert [m["task_id"] for _, m in publisher.drain()] == ["load"]
+        state = state_repo.get_flow_run_state("flow", "run-1")
+        steps = {s["id"]: s for s in state["flow_config"]["steps"]}
+        assert state["status"] == "running" and "error" not in state
+        assert steps["extract"]["result"] == {"files": 12}
+        assert steps["load"]["status"] == "running" and steps["load"]["attempt"] == 2
+        assert "error" not in steps["load"]
+        assert steps["kpi"]["status"] == "pending"
+
+    def test_resumed_run_runs_to_completion(self, resume_handler, failed_run, handler, callback, publisher):
+        failed_run()
+        resume_handler.handle_resume("flow", "run-1")
+
+        response = None
+        published = publisher.drain()
+        while published:
+            for _, message in published:
+                response = handler.handle_task_callback(callback(message["task_id"]))
+            published = publisher.drain()
+
+        assert response["status"] == "flow_completed"
+
+    def test_only_failed_runs_can_be_resumed(self, resume_handler, save_run):
+        save_run([], run_id="run-2")
+
+        assert resume_handler.handle_resume("flow", "run-2")["status"] == "error"
+        assert resume_handler.handle_resume("flow", "missing")["status"] == "error"
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from flows.retries import retry_delay_seconds, should_retry
+
+
+class TestRetries:
+
+    @pytest.fixture
+    def extract_run(self, save_run):
+        """Saves a run whose only step (extract) is running with the given retry policy."""
+        return lambda retry: save_run([{"id": "extract", "type": "extractor", "status": "running", "retry": retry}])
+
+    @pytest.fixture
+    def failure(self, callback):
+        return lambda result: callback("extract", status="failed", result=result)
+
+    def test_policy_limits_attempts_and_error_classes(self):
+        step = {"retry": {"max_attempts": 2, "retryable_errors": ["Timeout"]}}
+
+        assert should_retry(step, {"error_class": "Timeout"})
+        assert not should_retry(step, {"error_class": "InvalidCredentials"})
+        assert not should_retry({**step, "attempt": 2}, {"error_class": "Timeout"})
+        assert not should_retry({}, {"error_class": "Timeout"})
+
+    def test_delay_grows_exponentially_with_cap_and_jitter(self):
+        policy = {"base_delay_seconds": 10, "max_delay_seconds": 60, "jitter": 0.5}
+
+        assert retry_delay_seconds({**policy, "jitter": 0}, 1) == 10
+        assert retry_delay_seconds({**policy, "jitter": 0}, 3) == 40
+        assert retry_delay_seconds({**policy, "jitter": 0}, 5) == 60
+        assert 5 <= retry_delay_seconds(policy, 1) <= 10
+
+    def test_transient_failure_is_redispatched_by_sweep(self, handler, sweeper, extract_run, failure, state_repo, publisher, mock_notification_service):
+        extract_run({"max_attempts": 3, "base_delay_seconds": 30, "jitter": 0})
+
+        response = handler.handle_task_callback(failure({"error_class": "Timeout", "message": "read timed out"}))
+
+        assert response["status"] == "retry_scheduled" and response["attempt"] == 2
+        step = state_repo.get_flow_run_state("flow", "run-1")["flow_config"]["steps"][0]
+        assert step["status"] == "retry_wait"
+        assert step["attempts_history"][0]["error_class"] == "Timeout"
+        mock_notification_service.send_flow_notification.assert_not_called()
+
+        assert sweeper.sweep()["retried_steps"] == []
+        result = sweeper.sweep(datetime.now(timezone.utc) + timedelta(seconds=31))
+
+        assert result["retried_steps"] == ["flow/run-1/extract"]
+        assert [m["task_id"] for _, m in publisher.drain()] == ["extract"]
+        state = state_repo.get_flow_run_state("flow", "run-1")
+        assert state["status"] == "running"
+        assert state["flow_config"]["steps"][0]["status"] == "running"
+
+        # The new attempt's callback is not suppressed as a duplicate of the first failure
+        assert handler.handle_task_callback(failure({"error_class": "Timeout"}))["status"] == "retry_scheduled"
+
+    def test_exhausted_retries_fail_the_flow(self, handler, extract_run, failure, state_repo):
+        extract_run({"max_attempts": 1})
+
+        assert handler.handle_task_callback(failure({"error_class": "Timeout"}))["status"] == "error"
+        assert state_repo.get_flow_run_state("flow", "run-1")["status"] == "error"
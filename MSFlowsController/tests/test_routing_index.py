@@ -0,0 +1,38 @@
+from flows.routing import ROUTING_INDEX_KEY, build_routing_index, get_routing_index, resolve_route
+
+
+class TestRoutingIndex:
+
+    def test_steps_of_same_type_are_routed_by_distinguishing_config(self):
+        steps = [
+            {"id": "ga", "type": "extractor", "config": {"source": "google_ads", "account": "acme"}},
+            {"id": "fb", "type": "extractor", "config": {"source": "facebook", "account": "acme"}},
+            {"id": "notify", "type": "notifications", "config": {"channel": "email"}}
+        ]
+
+        index, ambiguities = build_routing_index(steps)
+
+        assert ambiguities == []
+        assert index["extractor"]["keys"] == ["source"]
+        assert resolve_route(index, "extractor", {"source": "facebook", "account": "acme"}) == ["fb"]
+        assert resolve_route(index, "notifications", {}) == ["notify"]
+        assert resolve_route(index, "unknown", {}) is None
+
+    def test_indistinguishable_steps_are_reported(self):
+        steps = [
+            {"id": "a", "type": "loader", "config": {"table": "t"}},
+            {"id": "b", "type": "loader", "config": {"table": "t"}}
+        ]
+
+        index, ambiguities = build_routing_index(steps)
+
+        assert ambiguities == [{"type": "loader", "steps": ["a", "b"], "keys": []}]
+        assert resolve_route(index, "loader", {"table": "t"}) == ["a", "b"]
+
+    def test_index_is_built_lazily_for_old_states(self):
+        state = {"flow_config": {"steps": [{"id": "a", "type": "loader", "config": {}}]}}
+
+        index = get_routing_index(state)
+
+        assert state[ROUTING_INDEX_KEY] is index
+        assert resolve_route(index, "loader", {}) == ["a"]
@@ -0,0 +1,48 @@
+import pytest
+
+from flows.graph import RUN_GRAPH_KEY, compile_run_graph, get_ready_steps, get_run_graph, record_transition
+
+
+class TestRunGraph:
+
+    @pytest.fixture
+    def diamond_state(self):
+        return {
+            "flow_config": {
+                "steps": [
+                    {"id": "a", "status": "running"},
+                    {"id": "b", "status": "pending", "depends_on": ["a"]},
+                    {"id": "c", "status": "pending", "depends_on": ["a"]},
+                    {"id": "d", "status": "pending", "depends_on": ["b", "c"]}
+                ]
+            }
+        }
+
+    def test_compile_builds_index_and_counters(self, diamond_state):
+        graph = compile_run_graph(diamond_state["flow_config"]["steps"])
+
+        assert graph["index"] == {"a": 0, "b": 1, "c": 2, "d": 3}
+        assert graph["dependents"]["a"] == ["b", "c"]
+        assert graph["remaining"] == {"a": 0, "b": 1, "c": 1, "d": 2}
+        assert graph["running"] == ["a"]
+        assert graph["ready"] == []
+
+    def test_fan_in_releases_join_only_once_all_dependencies_complete(self, diamond_state):
+        graph = get_run_graph(diamond_state)
+        steps = diamond_state["flow_config"]["steps"]
+
+        assert record_transition(graph, "a", "running", "completed") == ["b", "c"]
+        steps[0]["status"] = "completed"
+        assert [s["id"] for s in get_ready_steps(diamond_state, graph)] == ["b", "c"]
+
+        assert record_transition(graph, "b", "pending", "completed") == []
+        assert record_transition(graph, "c", "pending", "completed") == ["d"]
+        assert graph["counts"]["completed"] == 3
+
+    def test_repeated_transition_does_not_release_twice(self, diamond_state):
+        graph = get_run_graph(diamond_state)
+
+        record_transition(graph, "a", "running", "completed")
+        assert record_transition(graph, "a", "completed", "completed") == []
+        assert graph["remaining"]["b"] == 0
+        assert diamond_state[RUN_GRAPH_KEY] is graph
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.fake_gcs import FakeStorageClient
+from core.config import config
+from storage.event_store import FlowRunEventStore
+from storage.repositories import FlowRunStateRepository
+from storage.run_index import ACTIVE_PREFIX, FINISHED_PREFIX, RUN_INDEX_KEY, RunIndex
+from storage.sharded_store import FlowRunShardedStore
+
+
+def _state(run_id, account="acme", status="running"):
+    return {"flow_id": "f", "run_id": run_id, "account": account, "status": status,
+            "started_at": "2026-10-01T03:00:00+00:00", "flow_config": {"steps": []}}
+
+class TestRunIndex:
+
+    @pytest.fixture
+    def client(self):
+        return FakeStorageClient()
+
+    @pytest.fixture
+    def index(self, client):
+        return RunIndex(storage_client=client)
+
+    @pytest.fixture
+    def repo(self, client, index):
+        return FlowRunStateRepository(storage_client=client, run_index=index)
+
+    def _names(self, client):
+        return sorted(blob.name for blob in client.bucket(config.RUNS_BUCKET).list_blobs(prefix="run-index/"))
+
+    def test_run_moves_from_active_to_finished(self, repo, client, index):
+        repo.save_flow_run_state("f", "r1", _state("r1"))
+        assert self._names(client) == [f"{ACTIVE_PREFIX}acme/f/r1"]
+
+        state = repo.get_flow_run_state("f", "r1")
+        state["status"] = "completed"
+        repo.save_flow_run_state("f", "r1", state)
+        day = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        assert self._names(client) == [f"{FINISHED_PREFIX}{day}/acme/f/r1"]
+
+        runs = index.list_runs(account="acme")
+        assert [(run["run_id"], run["status"], run["started"]) for run in runs] == [("r1", "completed", "2026-10-01T03:00:00+00:00")]
+
+    def test_unchanged_status_is_not_rewritten_within_refresh(self, repo, client):
+        repo.save_flow_run_state("f", "r1", _state("r1"))
+        bucket = client.bucket(config.RUNS_BUCKET)
+        writes = bucket.stats["writes"]
+        state = repo.get_flow_run_state("f", "r1")
+        state["flow_config"]["steps"].append({"id": "a", "status": "running"})
+        repo.save_flow_run_state("f", "r1", state)
+        assert bucket.stats["writes"] == writes + 1
+
+        # Once the refresh interval has passed, last_updated is written again
+        state = repo.get_flow_run_state("f", "r1")
+        state[RUN_INDEX_KEY]["indexed_at"] = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+        repo.save_flow_run_state("f", "r1", state)
+        assert bucket.stats["writes"] == writes + 3
+
+    def test_resumed_run_drops_its_finished_entry(self, repo, client, index):
+        repo.save_flow_run_state("f", "r1", _state("r1", status="error"))
+        state = repo.get_flow_run_state("f", "r1")
+        state["status"] = "running"
+        repo.save_flow_run_state("f", "r1", state)
+        assert self._names(client) == [f"{ACTIVE_PREFIX}acme/f/r1"]
+        assert [run["status"] for run in index.list_runs()] == ["running"]
+
+    def test_queries_filter_without_reading_state(self, repo, client, index):
+        repo.save_flow_run_state("f", "r1", _state("r1"))
+        repo.save_flow_run_state("f", "r2", _state("r2", status="completed"))
+        repo.save_flow_run_state("f", "r3", _state("r3", account="other"))
+        bucket = client.bucket(config.RUNS_BUCKET)
+        reads = bucket.stats["reads"]
+
+        assert {run["run_id"] for run in index.list_runs(account="acme")} == {"r1", "r2"}
+        assert [run["run_id"] for run in index.list_runs(statuses=["running"])] in (["r1", "r3"], ["r3", "r1"])
+        assert [run["run_id"] for run in index.list_runs(account="acme", statuses=["completed"])] == ["r2"]
+        assert index.list_runs(until=datetime.now(timezone.utc) - timedelta(hours=1)) == []
+        assert len(index.list_runs(limit=2)) == 2
+        assert bucket.stats["reads"] == reads
+
+    @pytest.mark.parametrize("store_class", [FlowRunEventStore, FlowRunShardedStore])
+    def test_other_backends_update_the_index(self, client, index, store_class):
+        store = store_class(storage_client=client, run_index=index)
+        store.save_flow_run_state("f", "r1", _state("r1"))
+        state = store.get_flow_run_state("f", "r1")
+        state["status"] = "error"
+        store.save_flow_run_state("f", "r1", state)
+        assert [(run["run_id"], run["status"]) for run in index.list_runs(account="acme")] == [("r1", "error")]
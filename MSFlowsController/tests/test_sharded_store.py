@@ -0,0 +1,126 @@
+import json
+
+import pytest
+
+from benchmarks.fake_gcs import FakeBlob, FakeStorageClient
+from benchmarks.fake_pubsub import InMemoryPublisher
+from core.config import config
+from core.exceptions import StateConflictError
+from core.handlers.callback_handler import CallbackHandler
+from flows.graph import RUN_GRAPH_KEY, compile_run_graph
+from storage.repositories import FlowRunStateRepository
+from storage.sharded_store import SHARD_KEY, FlowRunShardedStore
+
+DBT_RESULT = {"transformation_result": {"results": [{"unique_id": f"model.{i}", "status": "success"} for i in range(200)]}}
+
+def _state():
+    steps = [
+        {"id": "dbt", "type": "dbt", "status": "completed", "result": DBT_RESULT, "config": {"models": "kpis"}},
+        {"id": "qlik", "type": "qlik", "status": "running", "depends_on": ["dbt"], "config": {"app": "sales"}},
+        {"id": "report", "type": "report", "status": "running", "depends_on": ["dbt"], "config": {}},
+    ]
+    return {"flow_id": "f", "run_id": "r", "account": "acme", "status": "running",
+            "flow_config": {"steps": steps}, RUN_GRAPH_KEY: compile_run_graph(steps)}
+
+class TestShardedStore:
+
+    @pytest.fixture
+    def client(self):
+        return FakeStorageClient()
+
+    @pytest.fixture
+    def store(self, client):
+        return FlowRunShardedStore(storage_client=client)
+
+    @pytest.fixture
+    def reads(self, monkeypatch):
+        names = []
+        original = FakeBlob.download_as_bytes
+        def tracking(blob, *args, **kwargs):
+            names.append(blob.name)
+            return original(blob, *args, **kwargs)
+        monkeypatch.setattr(FakeBlob, "download_as_bytes", tracking)
+        return names
+
+    def test_large_payloads_are_stored_apart_and_loaded_on_access(self, store, client, reads):
+        store.save_flow_run_state("f", "r", _state())
+        header = client.bucket(config.RUNS_BUCKET).get_blob("flow-runs/f/r/header.json")
+        assert header.size < 2000
+
+        state = store.get_flow_run_state("f", "r")
+        dbt, qlik = state["flow_config"]["steps"][:2]
+        assert reads == ["flow-runs/f/r/header.json"]
+        assert dbt[SHARD_KEY]["keys"] == ["result"] and SHARD_KEY not in qlik
+
+        assert dbt["result"] == DBT_RESULT and dbt.get("config") == {"models": "kpis"}
+        assert reads[1].startswith("flow-runs/f/r/steps/dbt/")
+
+    def test_callback_touches_only_header_and_own_step(self, store, client, reads, mock_notification_service):
+        store.save_flow_run_state("f", "r", _state())
+        writes = client.bucket(config.RUNS_BUCKET).stats["writes"]
+        reads.clear()
+
+        handler = CallbackHandler(store, mock_notification_service, InMemoryPublisher())
+        handler.handle_task_callback({"flow_id": "f", "run_id": "r", "account": "acme", "task_id": "qlik", "status": "completed",
+                                      "result": {"reloaded": True}})
+
+        assert not any("/steps/" in name for name in reads)
+        assert client.bucket(config.RUNS_BUCKET).stats["writes"] == writes + 1
+        steps = {s["id"]: s for s in store.get_flow_run_state("f", "r")["flow_config"]["steps"]}
+        assert steps["qlik"]["status"] == "completed" and steps["qlik"]["result"] == {"reloaded": True}
+        assert steps["dbt"]["result"] == DBT_RESULT
+
+    def test_read_payloads_stay_out_of_the_header(self, store, client):
+        store.save_flow_run_state("f", "r", _state())
+        size = client.bucket(config.RUNS_BUCKET).get_blob("flow-runs/f/r/header.json").size
+
+        state = store.get_flow_run_state("f", "r")
+        assert state["flow_config"]["steps"][0].get("result") == DBT_RESULT
+        state["status"] = "completed"
+        store.save_flow_run_state("f", "r", state)
+
+        header = client.bucket(config.RUNS_BUCKET).get_blob("flow-runs/f/r/header.json")
+        assert header.size <= size + 100
+        dbt = json.loads(header.download_as_bytes())["flow_config"]["steps"][0]
+        assert "result" not in dbt and dbt[SHARD_KEY]["keys"] == ["result"]
+
+    def test_reassigned_payload_gets_a_new_document(self, store):
+        store.save_flow_run_state("f", "r", _state())
+        state = store.get_flow_run_state("f", "r")
+        previous = dict.__getitem__(state["flow_config"]["steps"][0], SHARD_KEY)["doc"]
+
+        state["flow_config"]["steps"][0]["result"] = {**DBT_RESULT, "elapsed": 1}
+        store.save_flow_run_state("f", "r", state)
+
+        dbt = store.get_flow_run_state("f", "r")["flow_config"]["steps"][0]
+        assert dict.__getitem__(dbt, SHARD_KEY)["doc"] != previous and dbt["result"]["elapsed"] == 1
+
+    def test_payload_changed_in_place_gets_a_new_document(self, store):
+        store.save_flow_run_state("f", "r", _state())
+        state = store.get_flow_run_state("f", "r")
+        previous = dict.__getitem__(state["flow_config"]["steps"][0], SHARD_KEY)["doc"]
+
+        state["flow_config"]["steps"][0]["result"]["transformation_result"]["elapsed"] = 1
+        store.save_flow_run_state("f", "r", state)
+
+        dbt = store.get_flow_run_state("f", "r")["flow_config"]["steps"][0]
+        assert dict.__getitem__(dbt, SHARD_KEY)["doc"] != previous
+        assert dbt["result"]["transformation_result"]["elapsed"] == 1
+
+    def test_document_runs_move_to_a_header_on_save(self, store, client):
+        FlowRunStateRepository(storage_client=client).save_flow_run_state("f", "r", _state())
+
+        state = store.get_flow_run_state("f", "r")
+        state["status"] = "completed"
+        store.save_flow_run_state("f", "r", state)
+
+        assert client.bucket(config.RUNS_BUCKET).get_blob("flow-runs/f/r/header.json") is not None
+        assert store.get_flow_run_state("f", "r")["status"] == "completed"
+
+    def test_concurrent_header_write_is_a_conflict(self, store):
+        store.save_flow_run_state("f", "r", _state())
+        first, second = store.get_flow_run_state("f", "r"), store.get_flow_run_state("f", "r")
+        store.save_flow_run_state("f", "r", first)
+
+        with pytest.raises(StateConflictError):
+            store.save_flow_run_state("f", "r", second)
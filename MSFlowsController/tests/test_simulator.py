@@ -0,0 +1,15 @@
+import pytest
+
+from benchmarks.simulator import Simulation
+
+
+class TestSimulator:
+
+    @pytest.mark.parametrize("shape,size", [("fan-out", 8), ("chain", 5), ("diamond", 3)])
+    @pytest.mark.parametrize("backend", ["document", "events", "sharded"])
+    def test_every_run_completes_without_lost_updates(self, shape, size, backend):
+        report = Simulation(backend=backend, concurrency=4, duplicate_rate=0.2, seed=1).run(shape, size, runs=2)
+
+        assert report["run_statuses"] == {"completed": 2}
+        assert report["lost_updates"] == 0
+        assert report["outcomes"].get("error", 0) == 0
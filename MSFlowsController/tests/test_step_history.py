@@ -0,0 +1,77 @@
+import pytest
+
+from benchmarks.fake_gcs import FakeStorageClient
+from core.handlers.callback_handler import CallbackHandler
+from flows.durations import run_step_durations, run_step_queue_times
+from flows.report import build_flow_report
+from storage.repositories import FlowRunStateRepository
+from storage.step_history import StepHistoryRepository
+
+
+class TestStepHistory:
+
+    @pytest.fixture
+    def client(self):
+        return FakeStorageClient()
+
+    @pytest.fixture
+    def history(self, client):
+        return StepHistoryRepository(storage_client=client)
+
+    def test_run_times_skip_unfinished_and_unqueued_steps(self):
+        steps = [
+            {"id": "a", "status": "completed", "queued_at": "2025-01-01T00:00:00+00:00",
+             "started_at": "2025-01-01T00:00:10+00:00", "completed_at": "2025-01-01T00:01:40+00:00"},
+            {"id": "b", "status": "running", "started_at": "2025-01-01T00:00:00+00:00"},
+        ]
+
+        assert run_step_durations(steps) == {"a": 90.0}
+        assert run_step_queue_times(steps) == {"a": 10.0}
+
+    def test_rolling_percentiles_over_window(self, history, monkeypatch):
+        monkeypatch.setattr("core.config.config.STEP_HISTORY_WINDOW", 10)
+        for seconds in range(1, 21):
+            history.record_run("acme", "daily", {"extract": float(seconds)}, {"extract": seconds / 10})
+
+        entry = history.get_history("acme", "daily")["extract"]
+        assert entry["samples"] == 20
+        assert entry["durations"] == [float(s) for s in range(11, 21)]
+        assert (entry["p50_seconds"], entry["p90_seconds"], entry["max_seconds"]) == (16.0, 20.0, 20.0)
+        assert entry["queue_max_seconds"] == 2.0
+
+    def test_completed_run_is_recorded_by_callback_handler(self, client, history, mock_notification_service, mock_publisher):
+        state_repo = FlowRunStateRepository(storage_client=client)
+        state_repo.save_flow_run_state("daily", "run-1", {
+            "flow_id": "daily", "run_id": "run-1", "account": "acme", "status": "running",
+            "flow_config": {"steps": [
+                {"id": "a", "type": "t", "status": "running", "started_at": "2025-01-01T00:00:00+00:00"}
+            ]}
+        })
+        handler = CallbackHandler(state_repo, mock_notification_service, mock_publisher, step_history=history)
+
+        result = handler.handle_task_callback({
+            "flow_id": "daily", "run_id": "run-1", "account": "acme", "task_id": "a",
+            "status": "completed", "timestamp": "2025-01-01T00:00:30+00:00"
+        })
+
+        assert result["status"] == "flow_completed"
+        assert history.get_durations("acme", "daily") == {"a": 30.0}
+
+    def test_report_follows_longest_path_and_ranks_slowest(self):
+        steps = [
+            {"id": "root"},
+            {"id": "extract", "depends_on": ["root"]},
+            {"id": "kpi", "depends_on": ["root"]},
+            {"id": "load", "depends_on": ["extract"]},
+        ]
+        history = {
+            "root": {"samples": 3, "p50_seconds": 5.0, "p90_seconds": 6.0, "max_seconds": 7.0},
+            "extract": {"samples": 3, "p50_seconds": 600.0, "p90_seconds": 900.0, "max_seconds": 950.0},
+            "kpi": {"samples": 3, "p50_seconds": 60.0, "p90_seconds": 80.0, "max_seconds": 90.0},
+        }
+
+        report = build_flow_report(steps, history, top=2)
+
+        assert [s["step_id"] for s in report["critical_path"]] == ["root", "extract", "load"]
+        assert [s["step_id"] for s in report["slowest_steps"]] == ["extract", "kpi"]
+        assert report["steps_without_history"] == ["load"]
@@ -0,0 +1,86 @@
+import pytest
+
+from core.services.dynamic_flow_service import DynamicFlowService
+from core.services.step_dispatcher import CALLBACK_TOPIC
+from flows.normalization import normalize_steps
+
+CHAIN = {"steps": [
+    {"id": "dbt", "type": "dbt", "config": {"models": "kpis"}},
+    {"id": "qlik", "type": "qlik", "depends_on": ["dbt"], "config": {"app": "sales"}},
+]}
+
+class TestSubflowStep:
+
+    @pytest.fixture
+    def service(self, mock_flow_repo, state_repo, publisher):
+        mock_flow_repo.get_flow_definition.return_value = CHAIN
+        return DynamicFlowService(mock_flow_repo, state_repo, publisher)
+
+    @pytest.fixture
+    def start_parent(self, save_run, handler, callback, publisher):
+        """Completes the extract step of a 'daily' run and returns the start_subflow message of its 'chain' step."""
+        def start():
+            save_run(normalize_steps({"steps": [
+                {"id": "extract", "type": "extractor", "status": "running"},
+                {"id": "chain", "type": "subflow", "depends_on": ["extract"], "config": {"flow_id": "chain", "context": {"source": "pms"}}},
+                {"id": "report", "type": "report", "depends_on": ["chain"]},
+            ]}), flow_id="daily")
+            handler.handle_task_callback(callback("extract", flow_id="daily"))
+            [(topic, start)] = publisher.drain()
+            assert topic == CALLBACK_TOPIC
+            return start
+        return start
+
+    def test_child_run_completion_completes_parent_step(self, service, handler, start_parent, callback, state_repo, publisher):
+        start = start_parent()
+
+        assert start["action"] == "start_subflow" and start["subflow_run_id"] == "run-1.chain.1"
+        assert start["context"]["source"] == "pms"
+        parent_step = state_repo.get_flow_run_state("daily", "run-1")["flow_config"]["steps"][1]
+        assert parent_step["status"] == "running" and parent_step["child_run_id"] == "run-1.chain.1"
+
+        service.execute_subflow(start)
+        # Initial steps of the child run are published by the engine
+        assert [m["step_id"] for _, m in publisher.drain()] == ["dbt"]
+        assert state_repo.get_flow_run_state("chain", "run-1.chain.1")["parent_run"]["task_id"] == "chain"
+
+        handler.handle_task_callback(callback("dbt", flow_id="chain", run_id="run-1.chain.1"))
+        publisher.drain()
+        assert handler.handle_task_callback(callback("qlik", flow_id="chain", run_id="run-1.chain.1", result={"reloaded": True}))["status"] == "flow_completed"
+        [(topic, parent_callback)] = publisher.drain()
+        assert topic == CALLBACK_TOPIC
+
+        response = handler.handle_task_callback(parent_callback)
+
+        assert response["next_steps"] == ["report"]
+        chain = state_repo.get_flow_run_state("daily", "run-1")["flow_config"]["steps"][1]
+        assert chain["result"]["subflow_run_id"] == "run-1.chain.1"
+        assert chain["result"]["results"] == {"qlik": {"reloaded": True}}
+
+    def test_child_run_failure_fails_parent_run(self, service, handler, start_parent, callback, state_repo, publisher):
+        service.execute_subflow(start_parent())
+        publisher.drain()
+
+        handler.handle_task_callback(callback("dbt", flow_id="chain", run_id="run-1.chain.1", status="failed", result={"message": "compile error"}))
+        [(_, parent_callback)] = publisher.drain()
+        response = handler.handle_task_callback(parent_callback)
+
+        assert response["status"] == "error" and response["failed_task"] == "chain"
+        assert state_repo.get_flow_run_state("daily", "run-1")["status"] == "error"
+
+    def test_redelivered_start_does_not_create_another_run(self, service, start_parent, publisher):
+        start = start_parent()
+        service.execute_subflow(start)
+        publisher.drain()
+
+        assert service.execute_subflow(start)["status"] == "duplicate"
+        assert publisher.drain() == []
+
+    def test_missing_definition_fails_parent_step(self, service, mock_flow_repo, handler, start_parent, publisher):
+        start = start_parent()
+        mock_flow_repo.get_flow_definition.return_value = None
+
+        assert service.execute_subflow(start)["status"] == "error"
+        [(_, parent_callback)] = publisher.drain()
+        assert parent_callback["status"] == "failed"
+        assert handler.handle_task_callback(parent_callback)["failed_task"] == "chain"
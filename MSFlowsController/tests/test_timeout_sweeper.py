@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import ANY
+
+from core.config import config
+from storage.running_index import RUNNING_INDEX_PREFIX
+
+
+class TestTimeoutSweeper:
+
+    def test_hung_single_step_is_expired_and_flow_failed(self, sweeper, save_run, state_repo, running_index, mock_notification_service):
+        now = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        deadline = int((now - timedelta(minutes=1)).timestamp())
+        save_run([{
+            "id": "extract", "status": "running", "started_at": (now - timedelta(minutes=11)).isoformat(),
+            "timeout_minutes": 10, "timeout_deadline": deadline
+        }])
+        running_index.add([("flow", "run-1", "extract", deadline)])
+
+        result = sweeper.sweep(now)
+
+        assert result["expired_steps"] == ["flow/run-1/extract"]
+        state = state_repo.get_flow_run_state("flow", "run-1")
+        assert state["status"] == "error"
+        assert state["flow_config"]["steps"][0]["status"] == "timeout"
+        mock_notification_service.send_flow_notification.assert_called_once_with(ANY, 'fail')
+        assert running_index.list_overdue(int(now.timestamp())) == []
+
+    def test_failed_steps_count_follows_the_step_statuses(self, sweeper, save_run, state_repo, running_index):
+        now = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        deadline = int(now.timestamp()) - 60
+        save_run([
+            {"id": "a", "status": "failed"},
+            {"id": "b", "status": "running", "timeout_deadline": deadline}
+        ], failed_steps_count=5)
+        running_index.add([("flow", "run-1", "b", deadline)])
+
+        sweeper.sweep(now)
+
+        assert state_repo.get_flow_run_state("flow", "run-1")["failed_steps_count"] == 2
+
+    def test_stale_and_future_markers(self, sweeper, save_run, state_repo, running_index, client):
+        now = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+        past, future = int(now.timestamp()) - 60, int(now.timestamp()) + 60
+        save_run([{"id": "a", "status": "completed", "timeout_deadline": past}], run_id="run-done")
+        save_run([{"id": "b", "status": "running", "timeout_deadline": future}], run_id="run-live")
+        running_index.add([("flow", "run-done", "a", past), ("flow", "run-live", "b", future)])
+
+        result = sweeper.sweep(now)
+
+        assert result["checked"] == 1
+        assert result["expired_steps"] == []
+        markers = [b.name for b in client.bucket(config.RUNS_BUCKET).list_blobs(prefix=RUNNING_INDEX_PREFIX)]
+        assert markers == [f"{RUNNING_INDEX_PREFIX}{future:012d}/flow/run-live/b"]
+        assert state_repo.get_flow_run_state("flow", "run-live")["status"] == "running"
@@ -1,15 +1,23 @@
 import json
+import random
+import time
 import uuid
 import logging
 from datetime import datetime, timezone
 from typing import Dict, Any, List
 from google.cloud import pubsub_v1
 from google.cloud import storage
+from google.api_core.exceptions import NotFound, PreconditionFailed
 import os
-from tasks import execute_single_task
+
+from flows.classic import STATE_LOCATION_KEY, convert_classic_state, dynamic_state_path
 
 logger = logging.getLogger(__name__)
 
+# Intentos y espera máxima (por intento) de una actualización condicionada del estado de una tarea
+TASK_STATUS_UPDATE_MAX_ATTEMPTS = 5
+TASK_STATUS_CONFLICT_BACKOFF_SECONDS = 0.05
+
 
 class TaskStatus:
     PENDING = "pending"
@@ -23,9 +31,14 @@ class FlowController:
     Maneja el ciclo de vida completo de los flujos y sus tareas.
     """
     
-    def __init__(self):
-        self.publisher = pubsub_v1.PublisherClient()
-        self.storage_client = storage.Client()
+    def __init__(self, publisher_client=None, storage_client=None, state_repo=None, dispatcher=None):
+        # Los clientes pueden compartirse con el resto de componentes de la instancia
+        self.publisher = publisher_client or pubsub_v1.PublisherClient()
+        self.storage_client = storage_client or storage.Client()
+        # Repositorio del estado dinámico al que se convierte cada run al arrancar
+        self._state_repo = state_repo
+        # Dispatcher dinámico: índice de pasos en ejecución y fallos de publicación del estado convertido
+        self._dispatcher = dispatcher
         
         # Configuración de buckets
         self.flows_bucket_name = os.getenv('FLOWS_BUCKET')
@@ -34,6 +47,28 @@ class FlowController:
         
         # Configuración de topic de comunicación
         self.flows_topic = f"projects/{self.project_id}/topics/flows-controller"
+        self.max_task_status_attempts = TASK_STATUS_UPDATE_MAX_ATTEMPTS
+    
+    @property
+    def state_repo(self):
+        """Repositorio del estado dinámico (el de documento único si no se inyectó otro)."""
+        if self._state_repo is None:
+            from storage.repositories import FlowRunStateRepository
+            self._state_repo = FlowRunStateRepository(storage_client=self.storage_client)
+        return self._state_repo
+    
+    @property
+    def dispatcher(self):
+        """Dispatcher del estado dinámico (sobre state_repo y el índice de pasos en ejecución si no se inyectó otro)."""
+        if self._dispatcher is None:
+            from core.services.step_dispatcher import StepDispatcher
+            from storage.running_index import RunningStepIndex
+            self._dispatcher = StepDispatcher(
+                state_repo=self.state_repo,
+                publisher=None,
+                running_index=RunningStepIndex(storage_client=self.storage_client)
+            )
+        return self._dispatcher
         
     def start_flow(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -62,6 +97,8 @@ class FlowController:
         
         # Crear estado inicial de ejecución
         execution_status = self._create_initial_execution_status(flow_definition, run_id)
+        # Los callbacks leen el estado convertido al formato dinámico (ver _convert_to_dynamic_state)
+        execution_status[STATE_LOCATION_KEY] = dynamic_state_path(flow_id, run_id)
         logger.info(f"Estado inicial de ejecución creado: {execution_status}")
 
         # Guardar estado inicial
@@ -106,6 +143,45 @@ class FlowController:
             raise
     
 
+    def _update_task_status(self, run_id: str, task_name: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Aplica un delta al estado de una tarea con una lectura y una escritura.
+        
+        La escritura está condicionada a la generación leída; si otro worker ha
+        modificado el estado entretanto, se vuelve a leer y se reaplica el delta.
+        
+        args:
+            run_id: str
+            task_name: str
+            changes: Campos de la tarea a actualizar
+        returns:
+            Dict[str, Any]: Estado de ejecución resultante
+        raises:
+            FileNotFoundError: Si el estado de ejecución no se encuentra en el bucket de running.
+            PreconditionFailed: Si se agotan los intentos por escrituras concurrentes.
+        """
+        bucket = self.storage_client.bucket(self.runs_bucket_name)
+        blob_path = f"running/{run_id}.json"
+        
+        for attempt in range(1, self.max_task_status_attempts + 1):
+            blob = bucket.blob(blob_path)
+            try:
+                execution_status = json.loads(blob.download_as_text())
+            except NotFound:
+                raise FileNotFoundError(f"Execution status not found: {blob_path}")
+            
+            execution_status["tasks"][task_name].update(changes)
+            execution_status["last_updated"] = datetime.now(timezone.utc)
+            content = json.dumps(execution_status, indent=2, default=str)
+            try:
+                blob.upload_from_string(content, content_type='application/json', if_generation_match=blob.generation)
+                return execution_status
+            except PreconditionFailed:
+                logger.warning(f"Conflicto actualizando la tarea {task_name} de {run_id} (intento {attempt})")
+                if attempt == self.max_task_status_attempts:
+                    raise
+                time.sleep(random.uniform(0, TASK_STATUS_CONFLICT_BACKOFF_SECONDS * attempt))
+
     def _load_flow_definition(self, account: str, flow_id: str) -> Dict[str, Any]:
         """
         Carga la definición de un flujo desde Cloud Storage.
@@ -179,19 +255,106 @@ class FlowController:
     
     def _enqueue_initial_tasks(self, flow_definition: Dict[str, Any], execution_status: Dict[str, Any], run_id: str):
         """
-        Enqueues initial tasks (no dependencies) via Celery.
+        Enqueues initial tasks (no dependencies).
+
+        Todas las tareas iniciales se marcan como ejecutando en un único guardado y
+        sus mensajes se publican sin esperar entre ellos; los futures se resuelven
+        al final, de modo que el cliente de Pub/Sub puede agruparlos en lotes.
         """
         logger.info(f"Enqueando tareas iniciales via Celery: {run_id}")
         
+        initial_tasks = []
         for task_name, task_def in self._get_tasks_iterable(flow_definition):
             if not task_name:
                 continue
             # Admite ambos nombres de clave de dependencias
             deps = task_def.get("depends_on") or task_def.get("dependencies") or []
             if not deps:
-                self._execute_task(task_name, task_def, execution_status, run_id)
+                initial_tasks.append((task_name, task_def))
+        
+        if not initial_tasks:
+            return
+        
+        # Actualizar estado a ejecutando y guardarlo una sola vez
+        started_at = datetime.now(timezone.utc)
+        for task_name, _ in initial_tasks:
+            logger.info(f"Ejecutando tarea: {task_name}")
+            execution_status["tasks"][task_name]["status"] = TaskStatus.EXECUTING
+            execution_status["tasks"][task_name]["start"] = started_at
+        self._save_execution_status_running(run_id, execution_status)
+        # Antes del primer mensaje, para que ningún callback encuentre el run sin convertir
+        self._convert_to_dynamic_state(flow_definition, execution_status, run_id)
+        
+        futures = []
+        errors = {}
+        for task_name, task_def in initial_tasks:
+            try:
+                futures.append((task_name, self._publish_task_message(task_name, task_def, execution_status, run_id)))
+            except Exception as e:
+                errors[task_name] = str(e)
+        
+        for task_name, future in futures:
+            try:
+                logger.info(f"Mensaje enviado para tarea {task_name}: {future.result()}")
+            except Exception as e:
+                errors[task_name] = str(e)
+        
+        if errors:
+            for task_name, error in errors.items():
+                logger.error(f"Error ejecutando tarea {task_name}: {error}")
+                self._set_task_failed(task_name, execution_status, error)
+            self._save_execution_status_running(run_id, execution_status)
+            # Los callbacks (y el barrido de timeouts) leen el estado convertido: el fallo se aplica también allí
+            self._mark_dynamic_failures(execution_status["flow_id"], run_id, errors)
+            raise RuntimeError(f"Error publicando tareas iniciales: {errors}")
 
     
+    def _convert_to_dynamic_state(self, flow_definition: Dict[str, Any], execution_status: Dict[str, Any], run_id: str):
+        """
+        Guarda el run, una sola vez, en el formato dinámico que leen los callbacks.
+        
+        Se usa la definición ya cargada, así que los callbacks no vuelven a leerla
+        ni a normalizar el estado clásico. Los pasos en ejecución reciben su fecha
+        límite y su marcador en el índice de pasos en ejecución, como los que
+        despacha el dispatcher dinámico. Si la conversión falla, el primer
+        callback la hace a partir de running/.
+        """
+        from core.exceptions import StateConflictError
+        from flows.timeouts import TIMEOUT_DEADLINE_KEY, compute_deadline
+        from storage.repositories import STATE_GENERATION_KEY
+        
+        flow_id = execution_status["flow_id"]
+        # Misma forma que el documento guardado en running/ (fechas como texto)
+        state = convert_classic_state(json.loads(json.dumps(execution_status, default=str)), flow_definition)
+        definitions = dict(self._get_tasks_iterable(flow_definition))
+        running = [step for step in state["flow_config"]["steps"] if step["status"] == "running"]
+        for step in running:
+            started_at = datetime.fromisoformat(step["started_at"]) if step.get("started_at") else datetime.now(timezone.utc)
+            step[TIMEOUT_DEADLINE_KEY] = compute_deadline(definitions.get(step["id"]) or step, started_at)
+        # Solo creación: si un callback ya convirtió el run, su estado prevalece
+        state[STATE_GENERATION_KEY] = 0
+        try:
+            self.state_repo.save_flow_run_state(flow_id, run_id, state)
+            logger.info(f"Run {run_id} convertido al formato dinámico en {execution_status.get(STATE_LOCATION_KEY)}")
+            self.dispatcher.index_running(
+                [self.dispatcher.running_marker(flow_id, run_id, step) for step in running], self._flow_log(flow_id, run_id)
+            )
+        except StateConflictError:
+            logger.info(f"Run {run_id} ya convertido al formato dinámico")
+        except Exception as e:
+            logger.error(f"Error convirtiendo run {run_id} al formato dinámico: {str(e)}")
+    
+    def _mark_dynamic_failures(self, flow_id: str, run_id: str, errors: Dict[str, str]):
+        """Marca como fallidas en el estado convertido las tareas iniciales que no se publicaron."""
+        try:
+            self.dispatcher.mark_dispatch_failures(flow_id, run_id, errors, self._flow_log(flow_id, run_id))
+        except Exception as e:
+            logger.error(f"Error marcando tareas fallidas en el estado dinámico de {run_id}: {str(e)}")
+    
+    def _flow_log(self, flow_id: str, run_id: str):
+        from core.utils.logging_utils import get_flow_logger
+        return get_flow_logger(__name__, flow_id, run_id)
+    
     def _execute_task(self, task_name: str, task_definition: Dict[str, Any], execution_status: Dict[str, Any], run_id: str):
         """
         Ejecuta una tarea específica.
@@ -207,7 +370,8 @@ class FlowController:
             self._save_execution_status_running(run_id, execution_status)
             
             # Preparar y enviar mensaje
-            self._publish_task_message(task_name, task_definition, execution_status, run_id)
+            future = self._publish_task_message(task_name, task_definition, execution_status, run_id)
+            logger.info(f"Mensaje enviado para tarea {task_name}: {future.result()}")
             
         except Exception as e:
             logger.error(f"Error ejecutando tarea {task_name}: {str(e)}")
@@ -217,6 +381,9 @@ class FlowController:
     def _publish_task_message(self, task_name: str, task_definition: Dict[str, Any], execution_status: Dict[str, Any], run_id: str):
         """
         Publica el mensaje de la tarea al topic correspondiente.
+
+        Returns:
+            Future de Pub/Sub; el llamador decide cuándo esperar su resultado.
         """
         # Obtener config del step (puede estar en 'config' o 'params' para compatibilidad)
         step_config = task_definition.get("config", task_definition.get("params", {}))
@@ -236,19 +403,22 @@ class FlowController:
         topic_path = f"projects/{self.project_id}/topics/{topic_name}"
         
         message_data = json.dumps(task_message).encode('utf-8')
-        future = self.publisher.publish(topic_path, message_data)
-        
-        logger.info(f"Mensaje enviado para tarea {task_name}: {future.result()}")
+        return self.publisher.publish(topic_path, message_data)
 
     def _mark_task_as_failed(self, task_name: str, execution_status: Dict[str, Any], run_id: str, error_message: str):
         """
         Marca una tarea como fallida y guarda el estado.
         """
+        self._set_task_failed(task_name, execution_status, error_message)
+        self._save_execution_status_running(run_id, execution_status)
+    
+    def _set_task_failed(self, task_name: str, execution_status: Dict[str, Any], error_message: str):
+        """
+        Marca una tarea como fallida sin guardar el estado.
+        """
         execution_status["tasks"][task_name]["status"] = TaskStatus.FAILED
         execution_status["tasks"][task_name]["end"] = datetime.now(timezone.utc)
         execution_status["tasks"][task_name]["messages"] = [error_message]
-        
-        self._save_execution_status_running(run_id, execution_status)
     
     def _get_task_execution_topic(self, task_type: str) -> str:
         """